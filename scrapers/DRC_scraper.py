@@ -19,9 +19,9 @@ Updated: December 22, 2021
 ## pipenv install wkhtmltopdf / brew install wkhtmltopdf # ! this doesn't work for me
 ## pipenv run python scraper_tutorial.py
 
-# This code uses a web driver
-# Download from https://chromedriver.chromium.org/downloads
-# based on Chrome version (version 96.0 for my local machine)
+# This code uses a web driver, found by driver_resolver
+# (or download from https://chromedriver.chromium.org/downloads
+# based on Chrome version, and put it in this folder)
 
 from datetime import date
 import json
@@ -29,13 +29,11 @@ import os
 from os import path
 from urllib.parse import urlparse
 import re
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from bs4 import BeautifulSoup
+
+from chrome_bot import ChromeBot
+import extraction
+import parsing
+import resumable
 
 
 # Define class constants
@@ -45,65 +43,9 @@ METADATA = []
 METADATA_PATH = './data/DRC/metadata.json'
 COUNTRY = 'DRC'
 
-# Create fake user agent to bypass anti-robot walls
-FAKE_USER_AGENT = 'Mozilla/5.0 (Windows NT 4.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36'
-
 ### GENERALIZABLE CODE
 ### Can be reused for other countries' websites
 
-class ChromeBot:
-    def __init__(self, headless=False):
-        # Specify the driver chromebot
-        options = Options()
-        # Open chrome window or not?
-        options.headless = headless
-        # Add fake user agent to bypass anti-robot walls
-        options.add_argument(f'user-agent={FAKE_USER_AGENT}')
-        # Specify chromedriver location
-        s = Service("./chromedriver")
-        # Define driver with above specifications
-        self.driver = webdriver.Chrome(service=s, options=options)
-        print('\nChrome bot initialized!')
-
-    def navigate_to(self, url):
-        try:
-            self.driver.get(url)
-            print(f'\nLoaded page: {url}')
-        except:
-            print(f'\nCould not access this page: {url}')
-
-    def find_xpath(self, xpath):
-        try:
-            return self.driver.find_elements(By.XPATH, xpath)
-        except IndexError:
-            print('FAILED: Chrome bot could not find specified xpath.')
-
-    def find_xpath_solo(self, xpath):
-        try:
-            return self.driver.find_element(By.XPATH, xpath)
-        except IndexError:
-            print('FAILED: Chrome bot could not find specified xpath.')
-
-    def get_html(self):
-        return self.driver.page_source
-
-    def get_url(self):
-        return self.driver.current_url
-
-    def switch_to_default(self):
-        self.driver.switch_to.default_content()
-
-    def switch_to_tab(self, tab_id):
-        tab = self.driver.window_handles[tab_id]
-        self.driver.switch_to.window(tab)
-
-    def switch_to_frame(self, frame_xpath: str):
-        frame = self.driver.find_element(By.XPATH, frame_xpath)
-        self.driver.switch_to.frame(frame)
-
-    def wait_sec(self, time_sec):
-        self.driver.implicitly_wait(time_sec)
-
 def create_destination_file(law_name: str, law_text: str = '', type: str = 'txt', language: str = 'french'):
     """
     Define a name and file path for any law based on title, content, and desired file type
@@ -117,17 +59,14 @@ def create_destination_file(law_name: str, law_text: str = '', type: str = 'txt'
     file_path = DOWNLOAD_PATH + language + '/' + type + '/' + title + '.' + type
     destination_file = os.path.join(os.path.dirname(__file__), file_path)
     print("DOWNLOADING: ", destination_file)
-    # Check that the file does not already exist
-    if path.exists(destination_file):
-        print(destination_file + " is already downloaded. Not re-downloading.")
-        return
     return destination_file
 
-def append_to_metadata(law_name: str, file_link: str, filename: str, language: str = 'french'):
+def append_to_metadata(law_name: str, file_link: str, filename: str, language: str = 'french', sha256: str = None):
     """Append a new entry to the METADATA list."""
     METADATA.append({'title': law_name,
                      'link': file_link,
                      'download_path': filename,
+                     'sha256': sha256,
                      'download_date': date.today().strftime('%Y-%m-%d'),
                      'language': language,
                      'country': COUNTRY})
@@ -145,27 +84,49 @@ def write_metadata_json():
 ### COUNTRY-SPECIFIC CODE
 ### For DRC (Congo): from www.leganet.cd/JO.htm
 
+LAW_LINKS_XPATH = "//*[contains(text(), 'Texte') or contains(text(), 'texte') or contains(text(), 'pdf')]"
+## Titles are not consistently formatted across html pages
+## so trying different XPaths, in this order
+## If none of these work, the link is probably broken (404 error)-
+## a handful of them are, unfortunately
+LAW_PAGE = extraction.Extractor({
+    'title': {'select': ["/html/body/table[2]/tbody/tr/td[3]/p[1]",
+                         "/html/body/table[2]/tbody/tr/td[3]/span[1]/p",
+                         "/html/body/table[2]/tbody/tr/td[3]/div[1]/dl[1]",
+                         "/html/body/table[2]/tbody/tr/td[3]/dl/dt[1]",
+                         "/html/body/table[2]/tbody/tr/td[3]/font[1]/b/p"],
+              'type': 'text'},
+})
+
+def open_laws_list(bot) -> bool:
+    """Opens the page listing all laws. Returns False if a problem occured."""
+    # Navigate to start url
+    bot.navigate_to(START_URL)
+    # Access laws listing page
+    # Access XPath
+    laws_list_link = bot.wait_for_xpath("//img[@alt='Législation']")
+    # Stop if a problem occured
+    if not laws_list_link:
+        return False
+    # Click on button to acess list of laws
+    bot.click(laws_list_link[0])
+    bot.wait_for_network_idle()
+    return True
+
 def scrape_drc_laws(headless=True):
     """Scrape all DRC laws from http://www.leganet.cd/JO.htm"""
 
     # Define language
     language = 'french'
     # Initialize Selenium Chrome bot
-    bot = ChromeBot(headless)
-    # Navigate to start url
-    bot.navigate_to(START_URL)
-    bot.wait_sec(5)
-    # Access laws listing page
-    # Access XPath
-    laws_list_link = bot.find_xpath_solo("//img[@alt='Législation']")
-    # Stop if a problem occured
-    if laws_list_link is None:
+    # (PDF viewer stays on: PDF links open in a new tab whose url we read)
+    bot = ChromeBot(headless, pdf_viewer=True, lean=True)
+    # A fresh browser goes back to the list of laws
+    bot.restore = open_laws_list
+    if not open_laws_list(bot):
         return
-    # Click on button to acess list of laws
-    laws_list_link.click()
-    bot.wait_sec(2)
     # Find all the law links
-    all_links = bot.find_xpath("//*[contains(text(), 'Texte') or contains(text(), 'texte') or contains(text(), 'pdf')]")
+    all_links = bot.find_xpath(LAW_LINKS_XPATH)
     # Keep track of total laws and listing pages
     laws_ttl = len(all_links)
     print(f'Laws to download on the page: {len(all_links)}')
@@ -174,11 +135,17 @@ def scrape_drc_laws(headless=True):
     # Iterate over all download links; click on it, scrape the law, come back to previous page
     for i in range(len(all_links)): # For testing purposes, use: range(0, 1) or range(len(all_links)-5, len(all_links))
         try:
+            if bot.recycle_if_needed():
+                # The old browser's elements are gone; find the links again on the new one
+                all_links = bot.find_xpath(LAW_LINKS_XPATH)
             # Click on law, access page
-            all_links[i].click()
+            handles = bot.driver.window_handles
+            bot.click(all_links[i])
             # Switch (bot) to tab containing the law
-            bot.wait_sec(5)
-            bot.switch_to_tab(1)
+            if not bot.wait_for_new_tab(handles):
+                print("\nCould not access the link.")
+                continue
+            bot.wait_for_network_idle()
             # Get url of page
             file_source_url = bot.get_url()
             # Some of the links lead to PDFs, some to html files - not consistent
@@ -191,67 +158,42 @@ def scrape_drc_laws(headless=True):
                 print(f'\nFound law ({i+1}/{len(all_links)}): ', law_title)
                 # Create destination file from law title name
                 destination_file = create_destination_file(law_name=law_title, type='pdf', language=language)
-                # Check if file was already downloaded
-                if destination_file is not None:  # Unless file was already downloaded
-                    # Get HTML response (pdf content)
-                    response = requests.get(file_source_url, stream=True)
-                    # Write response as binary file
-                    with open(destination_file, 'wb') as f:
-                        f.write(response.content)
+                # Download the pdf, resuming if the connection drops, even if a file has its name:
+                # blob_store keeps another law with the same title apart
+                stored = resumable.download(file_source_url, destination_file)
+                if stored is not None:
                     # Add entry to metadata
-                    append_to_metadata(law_title, file_source_url, destination_file)
+                    append_to_metadata(law_title, file_source_url, stored.path, sha256=stored.sha256)
             else: # If it's not a PDF, it's a HTML page (on this website)
                 file_source_url = bot.get_url()
-                # Get title
-                ## Titles are not consistently formatted across html pages
-                ## so trying different XPaths
-                ## If none of these work, the link is probably broken (404 error)-
-                ## a handful of them are, unfortunately
-                continue_cond = True
-                try:
-                    law_title = bot.find_xpath_solo("/html/body/table[2]/tbody/tr/td[3]/p[1]").text[0:250]
-                except:
-                    try:
-                        law_title = bot.find_xpath_solo("/html/body/table[2]/tbody/tr/td[3]/span[1]/p").text[0:250]
-                    except:
-                        try:
-                            law_title = bot.find_xpath_solo("/html/body/table[2]/tbody/tr/td[3]/div[1]/dl[1]").text[0:250]
-                        except:
-                            try:
-                                law_title = bot.find_xpath_solo("/html/body/table[2]/tbody/tr/td[3]/dl/dt[1]").text[0:250]
-                            except:
-                                try:
-                                    law_title = bot.find_xpath_solo("/html/body/table[2]/tbody/tr/td[3]/font[1]/b/p").text[0:250]
-                                except:
-                                    print(f"\nThe link for this law is probably broken (404 error). You can check manually using the law's link: {file_source_url}")
-                                    continue_cond = False
-                if continue_cond:
+                # Parse the page once; the title and the text both come from it
+                tree = parsing.parse(bot.get_html())
+                law_title = LAW_PAGE(tree)['title']
+                if law_title is None:
+                    print(f"\nThe link for this law is probably broken (404 error). You can check manually using the law's link: {file_source_url}")
+                else:
+                    law_title = law_title[0:250]
                     # Announce law
                     print(f'\nFound law ({i+1}/{len(all_links)}): ', law_title)
-                    # Get box with text
-                    bot.find_xpath_solo("/html/body/table[2]/tbody/tr/td[3]") #//td[@valign='top']")
-                    # Get html text
-                    text_html = bot.get_html()
-                    # Use Beautiful Soup to get Unicode string
-                    soup = BeautifulSoup(text_html, features="html.parser")
-                    text_soup = soup.get_text()
+                    # Get the page's text as a Unicode string
+                    text_soup = parsing.text(tree)
                     text_mid = round(len(text_soup)/2)
                     # Display what it's about
                     content_extract = text_soup[text_mid:text_mid+250]
                     # Create file
                     destination_file = create_destination_file(law_title, content_extract, 'txt', language)
                     # Check if file was already downloaded
-                    if destination_file is not None:
+                    if path.exists(destination_file):
+                        print(destination_file + " is already downloaded. Not re-downloading.")
+                    else:
                         # Write text file
                         with open(destination_file, 'w') as f:
                             f.write(text_soup)
                         # Add entry metadata for this law
                         append_to_metadata(law_title, file_source_url, destination_file, language)
             # Close active tab and move on
-            bot.wait_sec(2)
             bot.driver.close()
             bot.switch_to_tab(0)
-            bot.wait_sec(1)
         except:
             print("\nCould not access the link.")
 
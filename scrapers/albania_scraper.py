@@ -1,12 +1,13 @@
 """Downloads all laws from the Albanian website."""
 from datetime import date
 import json
-from os import path
 from pathlib import Path
 import re
 
-from bs4 import BeautifulSoup
-import requests
+import crawl_state
+import fetch_engine
+import http_cache
+import parsing
 
 # Cherian wuz here
 
@@ -15,81 +16,79 @@ BASE_URL = 'https://euralius.eu'
 DOWNLOAD_PATH = '../data/albania/pdf'
 METADATA = []
 METADATA_PATH = '../data/albania/metadata.json'
+LINKS = parsing.xpath('//a[@href]')
+DOWNLOAD_LINKS = parsing.xpath("//a[@href and @title='Download']")
 
 def collect_links_from_main_page():
     """Gathers a list of links from the starting page."""
     law_pages = []
-    response = requests.get(START_URL)
-    html = BeautifulSoup(response.text, features="lxml")
+    response = http_cache.get(START_URL)
+    html = parsing.parse(response.text)
 
-    for link in html.find_all('a'):
-        if link.has_attr('href'):
+    for link in LINKS(html):
+        if link.get('href') is not None:
             search = re.search('/index.php/en/library/albanian-legislation/category/[0-9a-zA-z-]+',
-                               link['href'])
+                               link.get('href'))
             if search is not None:
-                full_link = BASE_URL + link['href']
+                full_link = BASE_URL + link.get('href')
                 if full_link == START_URL:
                     continue
-                law_pages.append(link['href'])
+                law_pages.append(link.get('href'))
     return law_pages
 
-def find_pdf(soup):
-    """Given a beautiful soup object, finds the first pdf 'Download' link."""
-    for link in soup.find_all('a'):
-        if link.has_attr('href') and link.has_attr('title') and link['title'] == 'Download':
-            title = link.text.replace(' ', '-')
-            return title, BASE_URL + link['href']
-
-def download_pdf_from_page(link):
-    """Parses a page and downloads the pdf from it."""
-    # Sometimes requests can fail or time out, so try getting the page multiple times.
-    for _ in range(1,10):
-        try:
-            page = requests.get(BASE_URL + link, timeout=10)
-        except:
-            continue
-        break
+def find_pdf(tree):
+    """Given a parsed page, finds the first pdf 'Download' link."""
+    for link in DOWNLOAD_LINKS(tree):
+        title = parsing.text(link).replace(' ', '-')
+        return title, BASE_URL + link.get('href')
 
+def download_pdf_from_page(page, downloads):
+    """Parses a law page and queues its pdf in downloads, a {pdf link: filename} dict.
+    Returns its metadata entry."""
     # Parse the title and download link
-    soup = BeautifulSoup(page.text, 'html.parser')
-    title, pdf_link = find_pdf(soup)
+    title, pdf_link = find_pdf(parsing.parse(page.text))
     filename = DOWNLOAD_PATH + '/' + title + '.pdf'
-    METADATA.append({'title': title,
-                     'link': pdf_link,
-                     'download_path': filename,
-                     'download_date': date.today().strftime('%Y-%m-%d'),
-                     'country': 'Albania',})
-    if path.exists(filename):
-        print(filename + " already downloaded")
-        return
-
-    print("Saving pdf from ", pdf_link, " to ", filename)
-    for _ in range(1,10):
-        try:
-            request = requests.get(pdf_link, timeout=10, stream=True)
-            with open(filename, 'wb') as file:
-                for chunk in request.iter_content(1024 * 1024):
-                    file.write(chunk)
-        except Exception as e:
-            print(e)
-            continue
-        break
+    entry = {'title': title,
+             'link': pdf_link,
+             'download_path': filename,
+             'download_date': date.today().strftime('%Y-%m-%d'),
+             'country': 'Albania',}
+    downloads[pdf_link] = filename
+    return entry
 
-def write_metadata_json():
-    """Writes the metadata json file."""
+def write_metadata_json(frontier):
+    """Writes the metadata json file, with the laws of every run so far."""
     print('Writing metadata to json')
+    METADATA[:] = frontier.metadata()
     with open(METADATA_PATH, 'w') as file:
         json.dump(METADATA, file)
 
+def scrape_law_pages(frontier, law_pages):
+    """Scrapes a batch of law pages, and records what became of them in the frontier."""
+    # Fetch the law pages concurrently, then parse them in order.
+    pages = fetch_engine.fetch_all(law_pages, cache=True)
+    downloads = {}
+    entries = {}
+    for link, page in zip(law_pages, pages):
+        print("Scraping law for link " + link)
+        if page is None:
+            frontier.failed(link, 'could not fetch the page')
+            continue
+        entries[link] = download_pdf_from_page(page, downloads)
+    # The link of each entry is its pdf
+    sources = {link: entry['link'] for link, entry in entries.items()}
+    frontier.done_downloads(entries, sources, fetch_engine.download_all(downloads))
+
 def scrape_albania_laws():
     """Scrapes all laws from the START_URL."""
     Path(DOWNLOAD_PATH).mkdir(parents=True, exist_ok=True)
-    law_pages = collect_links_from_main_page()
-    for link in law_pages:
-        print("Scraping law for link " + BASE_URL + link)
-        download_pdf_from_page(link)
+    frontier = crawl_state.Frontier('albania')
+    frontier.add(BASE_URL + link for link in collect_links_from_main_page())
+    # Only the law pages not done by an earlier run are fetched, a batch at a time
+    for batch in crawl_state.batches(frontier.pending()):
+        scrape_law_pages(frontier, batch)
 
-    write_metadata_json()
+    write_metadata_json(frontier)
 
 
 if __name__ == '__main__':
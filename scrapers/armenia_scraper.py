@@ -4,109 +4,101 @@ import re
 import json
 from os import path
 from pathlib import Path
-import httplib2
-from bs4 import BeautifulSoup, SoupStrainer
-import requests
+
+import crawl_state
+import extraction
+import fetch_engine
+import http_cache
+import parsing
 
 START_URL = 'http://www.parliament.am/legislation.php?sel=alpha&lang=eng'
 BASE_URL = 'http://www.parliament.am'
 METADATA = []
 METADATA_PATH = '../data/armenia/metadata.json'
 DOWNLOAD_DIR = '../data/armenia/'
+LAW_PAGE_LINK = re.compile(r'/legislation\.php\?sel=show&ID=[0-9]+&lang=eng')
+LAW_PAGE = extraction.Extractor({
+    # the first h3 is the title
+    'title': {'select': '//h3'},
+    'pdf': {'select': '//a[@href]', 'value': '@href', 'match': r'/law_docs/[0-9a-zA-Z]+eng\.pdf', 'type': 'url'},
+})
 
 def collect_links_from_main_page():
     """Create a list of links from the START_URL."""
     law_pages = []
-    http = httplib2.Http()
-    _, response = http.request(START_URL)
-    for link in BeautifulSoup(response, parse_only=SoupStrainer('a'), features="lxml"):
-        if link.has_attr('href'):
-            search = re.search(r'/legislation\.php\?sel=show&ID=[0-9]+&lang=eng', link['href'])
-            if search is not None:
-                law_pages.append(BASE_URL + link['href'])
+    response = http_cache.get(START_URL).content
+    for link in parsing.iter_tags(response, 'a'):
+        if link.get('href') is not None:
+            if LAW_PAGE_LINK.search(link.get('href')) is not None:
+                law_pages.append(BASE_URL + link.get('href'))
     return law_pages
 
-def download_pdf(pdf_path, html):
-    """Search for a pdf on the page and download and return true if found, else returns false."""
-    for link_tag in BeautifulSoup(html, parse_only=SoupStrainer('a'), features="lxml"):
-        if not link_tag.has_attr('href'):
-            continue
-        pdf_search = re.search(r'/law_docs/[0-9a-zA-Z]+eng\.pdf', link_tag['href'])
-        if pdf_search is None:
-            continue
-        filename = pdf_path
-        http_link = BASE_URL + link_tag['href']
-        print("Saving pdf from ", http_link, " to ", filename)
-
-        for _ in range(1,10):
-            try:
-                request = requests.get(http_link, timeout=10, stream=True)
-            except Exception as e:
-                print(e)
-                continue
-            break
-
-        # Open the output file and make sure we write in binary mode
-        with open(filename, 'wb') as file_handle:
-            # Walk through the request response in chunks of 1024 * 1024 bytes, so 1MiB
-            for chunk in request.iter_content(1024 * 1024):
-                file_handle.write(chunk)
-        return True
-    return False
-
 def download_text(law_text, filename):
     """Download a text file."""
     with open(filename, "a") as file:
         file.write(law_text)
         file.close()
 
-def write_metadata_json():
-    """Write the metadata file."""
+def write_metadata_json(frontier):
+    """Write the metadata file, with the laws of every run so far."""
     print('Writing metadata to json')
+    METADATA[:] = frontier.metadata()
     with open(METADATA_PATH, 'w') as file:
         json.dump(METADATA, file)
 
-def scrape_armenia_laws():
-    """Download all laws from the Armenia website."""
-    Path(f'{DOWNLOAD_DIR}pdf').mkdir(parents=True, exist_ok=True)
-    Path(f'{DOWNLOAD_DIR}txt').mkdir(parents=True, exist_ok=True)
-    law_pages = collect_links_from_main_page()
-    for link in law_pages:
+def scrape_law_pages(frontier, law_pages):
+    """Scrapes a batch of law pages, and records what became of them in the frontier."""
+    # Fetch the law pages concurrently, then parse them in order.
+    pages = fetch_engine.fetch_all(law_pages, cache=True)
+    downloads = {}
+    entries = {}
+    # The pdf each law page queued
+    sources = {}
+    for link, page in zip(law_pages, pages):
         print("Scraping law from link " + link)
-        for _ in range(1,10):
-            try:
-                page = requests.get(link, timeout=10)
-            except Exception as e:
-                print(e)
-                continue
-            break
+        if page is None:
+            frontier.failed(link, 'could not fetch the page')
+            continue
 
-        soup = BeautifulSoup(page.text, 'html.parser')
-        heading = soup.find_all('h3')
-        # the first h3 is the title
-        law_title = heading[0].text.replace(" ", "-")
+        # Parse each page once; the title, the pdf link and the text all come from this tree.
+        tree = parsing.parse(page.content)
+        law = LAW_PAGE(tree, base_url=BASE_URL)
+        law_title = law['title'].replace(" ", "-")
         pdf_path = DOWNLOAD_DIR + "pdf/" + law_title[:200] + ".pdf"
         txt_path = DOWNLOAD_DIR + 'txt/' + law_title[:200] + '.txt'
 
-        if path.exists(pdf_path) or path.exists(txt_path):
-            print("Already downloaded.")
-            continue
-
         # First search for a pdf. Otherwise, download the text on the page.
-        is_pdf = download_pdf(pdf_path, page.text)
-        if is_pdf:
+        # A pdf is downloaded even if a file has its name: blob_store tells different laws apart.
+        if law['pdf'] is not None:
+            downloads[law['pdf']] = pdf_path
+            sources[link] = law['pdf']
             download_path = pdf_path
-            continue
-        download_path = txt_path
-        download_text(soup.get_text(), txt_path)
+        # Laws already on disk keep their metadata entry, so that metadata.json still lists them
+        elif path.exists(txt_path):
+            print("Already downloaded.")
+            download_path = txt_path
+        else:
+            download_path = txt_path
+            download_text(parsing.text(tree), txt_path)
 
-        METADATA.append({'title': law_title,
+        entries[link] = {'title': law_title,
                          'link': link,
                          'download_path': download_path,
                          'download_date': date.today().strftime('%Y-%m-%d'),
-                         'country': 'Armenia'})
+                         'country': 'Armenia'}
 
-    write_metadata_json()
+    frontier.done_downloads(entries, sources, fetch_engine.download_all(downloads))
+
+def scrape_armenia_laws():
+    """Download all laws from the Armenia website."""
+    Path(f'{DOWNLOAD_DIR}pdf').mkdir(parents=True, exist_ok=True)
+    Path(f'{DOWNLOAD_DIR}txt').mkdir(parents=True, exist_ok=True)
+    frontier = crawl_state.Frontier('armenia')
+    frontier.add(collect_links_from_main_page())
+    # Only the law pages not done by an earlier run are fetched, a batch at a time
+    for batch in crawl_state.batches(frontier.pending()):
+        scrape_law_pages(frontier, batch)
+    write_metadata_json(frontier)
 
 if __name__ == '__main__':
     scrape_armenia_laws()
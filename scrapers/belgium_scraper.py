@@ -23,9 +23,9 @@ Updated: December 20, 2021
 ## pipenv install wkhtmltopdf / brew install wkhtmltopdf # ! this doesn't work for me
 ## pipenv run python scraper_tutorial.py
 
-# This code uses a web driver
-# Download from https://chromedriver.chromium.org/downloads
-# based on Chrome version (version 96.0 for my local machine)
+# This code uses a web driver, found by driver_resolver
+# (or download from https://chromedriver.chromium.org/downloads
+# based on Chrome version, and put it in this folder)
 
 from datetime import date
 import json
@@ -33,77 +33,30 @@ import os
 from os import path
 import re
 import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from bs4 import BeautifulSoup
+
+from chrome_bot import ChromeBot
+import crawl_state
+import parsing
 
 
 # Define class constants
 START_URL = 'http://www.ejustice.just.fgov.be/cgi/welcome.pl' # 'http://www.ejustice.just.fgov.be/loi/loi.htm'
+# Laws and listing pages are reached by clicking, not through links, so the crawl state
+# keys them on these urls with the law's numac (its id) or the listing page's date
+LISTING_URL = 'http://www.ejustice.just.fgov.be/cgi/summary.pl'
+LAW_URL = 'http://www.ejustice.just.fgov.be/cgi/article.pl'
 DOWNLOAD_PATH = './data/belgium/'
 METADATA = []
 METADATA_PATH = './data/belgium/metadata.json'
 COUNTRY = 'Belgium'
 LANGUAGES = {'french': 'Français', 'dutch': 'Nederlands', 'german': 'Deutsch'}
+PREVIOUS_BUTTON_XPATH = "//input[@type='Submit' and @value='Sommaire précédent' or @value='Vorige Inhoud' or @value='Voriger Inhalt']"
+LAW_BUTTONS_XPATH = "//input[@type='submit' and @name='numac']"
 
 
-# Create fake user agent to bypass anti-robot walls
-FAKE_USER_AGENT = 'Mozilla/5.0 (Windows NT 4.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36'
-
 ### GENERALIZABLE CODE
 ### Can be reused for other countries' websites
 
-class ChromeBot:
-    def __init__(self, headless=False):
-        options = Options()
-        options.headless = headless
-        options.add_argument(f'user-agent={FAKE_USER_AGENT}')
-
-        # Add custom profile to disactivate PDF viewer
-        profile = {
-            "plugins.plugins_list": [{"enabled": False,
-                                         "name": "Chrome PDF Viewer"}],
-        }
-        options.add_experimental_option("prefs", profile)
-        s = Service("./chromedriver")
-        self.driver = webdriver.Chrome(service=s, options=options)
-        print('\nChrome bot initialized!')
-
-    def navigate_to(self, url):
-        try:
-            self.driver.get(url)
-            print(f'\nLoaded page: {url}')
-        except:
-            print(f'\nCould not access this page: {url}')
-
-    def find_xpath(self, xpath):
-        try:
-            return self.driver.find_elements(By.XPATH, xpath)
-        except IndexError:
-            print('FAILED: Chrome bot could not find specified xpath.')
-
-    def find_xpath_solo(self, xpath):
-        try:
-            return self.driver.find_element(By.XPATH, xpath)
-        except IndexError:
-            print('FAILED: Chrome bot could not find specified xpath.')
-
-    def get_html(self):
-        return self.driver.page_source
-
-    def switch_to_default(self):
-        self.driver.switch_to.default_content()
-
-    def switch_to_frame(self, frame_xpath: str):
-        frame = self.driver.find_element(By.XPATH, frame_xpath)
-        self.driver.switch_to.frame(frame)
-
-    def wait_sec(self, time_sec):
-        self.driver.implicitly_wait(time_sec)
-
 def create_destination_file(law_name: str = 'Untitled', law_text: str = '', type: str = 'txt', language: str = 'french'):
     """
     Define a name and file path for any law based on title, content, and desired file type
@@ -117,24 +70,23 @@ def create_destination_file(law_name: str = 'Untitled', law_text: str = '', type
     # Create the path by combining relevant variables
     file_path = DOWNLOAD_PATH + language + '/' + type + '/' + title + law_text + '.' + type
     destination_file = os.path.join( os.path.dirname(__file__), file_path)
-    # Check that the file does not already exist
-    if path.exists(destination_file):
-        print(destination_file + " is already downloaded. Not re-downloading.")
-        return
     return destination_file
 
 def append_to_metadata(law_name: str, file_link: str, filename: str, language: str):
-    """Append a new entry to the METADATA list."""
-    METADATA.append({'title': law_name,
-                     'link': file_link,
-                     'download_path': filename,
-                     'download_date': date.today().strftime('%Y-%m-%d'),
-                     'language': language,
-                     'country': COUNTRY})
+    """Append a new entry to the METADATA list, and return it."""
+    entry = {'title': law_name,
+             'link': file_link,
+             'download_path': filename,
+             'download_date': date.today().strftime('%Y-%m-%d'),
+             'language': language,
+             'country': COUNTRY}
+    METADATA.append(entry)
     print('Added item to METADATA.')
+    return entry
 
-def write_metadata_json():
-    """Write the metadata to a json file."""
+def write_metadata_json(frontier):
+    """Write the metadata of the laws of every run so far to a json file."""
+    METADATA[:] = frontier.metadata()
     dirname = os.path.dirname(__file__)
     metadata_path = os.path.join(dirname, METADATA_PATH)
     with open(metadata_path, 'w') as f:
@@ -145,11 +97,37 @@ def write_metadata_json():
 ### COUNTRY-SPECIFIC CODE
 ### For Belgium: from www.ejustice.just.fgov.be
 
+def open_listing(bot, language: str, before: str = None) -> bool:
+    """Opens the listing pages in language, at the listing page published
+    just before the date before if given. Returns False if a problem occured."""
+    # Navigate to start url
+    bot.navigate_to(START_URL)
+    # Access language button & corresponding laws listing page
+    # Access XPath
+    laws_list_link = bot.find_xpath_solo("//input[@type='Submit' and @value='{}']".format(LANGUAGES.get(language))) # dynamic XPath
+    # Stop if a problem occured
+    if laws_list_link is None:
+        return False
+    # Click on button
+    bot.click(laws_list_link)
+    # Switch to main frame for later navigation
+    bot.switch_to_default()
+    if before is not None:
+        # Type the date in the footer and go to the listing page before it
+        bot.switch_to_frame("//frame[@name='Foot']")
+        pub_date = bot.find_xpath_solo("//input[@type='text' and @name='pub_date']")
+        bot.driver.execute_script("arguments[0].value = arguments[1];", pub_date, before)
+        bot.click(bot.find_xpath_solo(PREVIOUS_BUTTON_XPATH))
+        bot.switch_to_default()
+    return True
+
 def scrape_belgium_laws(headless=True):
     """Scrape all Belgian laws from www.ejustice.just.fgov.be"""
 
     # Initialize Selenium Chrome bot
-    bot = ChromeBot(headless)
+    bot = ChromeBot(headless, lean=True)
+    # What earlier runs already did, so that an interrupted crawl carries on where it stopped
+    frontier = crawl_state.Frontier('belgium')
 
     # Each law page (and corresponding file) has the same source url
     # i.e. each law page is only accessible via navigation from the start url
@@ -158,24 +136,34 @@ def scrape_belgium_laws(headless=True):
 
     for language in list(LANGUAGES):
         print(f'\nSearching for laws in {language}')
-        # Navigate to start url
-        bot.navigate_to(START_URL)
-        # Access language button & corresponding laws listing page
-        # Access XPath
-        laws_list_link = bot.find_xpath_solo("//input[@type='Submit' and @value='{}']".format(LANGUAGES.get(language))) # dynamic XPath
-        # Stop if a problem occured
-        if laws_list_link is None:
+        listing_kind = f'{language} listing'
+        # Once a first crawl of this language got to its last listing page, new sommaires
+        # only appear on the newest pages: every run walks the listing from the newest page,
+        # until a page whose laws were all scraped already
+        crawled = frontier.is_done(f'{LISTING_URL}?language={language}')
+        failed_listings = frontier.pending(listing_kind)
+        if crawled:
+            before = None
+        elif failed_listings:
+            # Reopen the listing at the first page that failed in an earlier run. The pages
+            # after it that are done only cost a page load, since their laws are skipped.
+            before = frontier.data(failed_listings[0])['before']
+        else:
+            # Reopen the listing after the last page an interrupted first crawl finished, if any
+            last_listing = frontier.latest(listing_kind)
+            before = frontier.data(last_listing)['pub_date'] if last_listing is not None else None
+        if not open_listing(bot, language, before=before):
             return
-        # Click on button
-        laws_list_link.click()
         # Keep track of total laws and listing pages
         laws_ttl = 0
         listings_num = 0
         # Initialize IDs (use proxy - their date) of listing pages
         this_page = '.'
         old_page = ''
-        # Switch to main frame for later navigation
-        bot.switch_to_default()
+        # Whether every listing page of this run was done
+        all_listings_done = True
+        # Date of the listing page the current one was reached from, to reopen it later
+        reached_from = before
 
         # Iterate through all the listing pages for this language
         while this_page != old_page: # Next listing page is available
@@ -183,18 +171,29 @@ def scrape_belgium_laws(headless=True):
             # Switch to frame
             listings_num += 1
             print(f'\nOn the listing page number {listings_num}')
+            # Only a listing page whose laws were all scraped is done; the others are failed, and retried on the next run
+            listing_done = False
+            # Laws on this listing page that no earlier run scraped
+            new_laws = 0
 
             try:
                 bot.switch_to_frame("//frame[@name='Body']")
-                all_links = bot.find_xpath("//input[@type='submit' and @name='numac']")
+                all_links = bot.find_xpath(LAW_BUTTONS_XPATH)
+                # Read every law's numac in one script call, to skip the ones already done without clicking
+                numacs = [law['numac'] for law in bot.extract({'selector': LAW_BUTTONS_XPATH, 'fields': {'numac': 'value'}})]
                 laws_ttl = laws_ttl + len(all_links)
                 print(f'Laws to download on the page: {len(all_links)}')
                 print(f'{laws_ttl} laws discovered so far in total')
 
                 # Iterate over all download links; click on it, scrape the law, come back to previous page
                 for i in range(len(all_links)): # For testing purposes, use: range(0, 1):
+                    law_url = f'{LAW_URL}?language={language}&numac={numacs[i]}'
+                    if frontier.is_done(law_url):
+                        print(f'Law {numacs[i]} is already downloaded. Not re-downloading.')
+                        continue
+                    new_laws += 1
                     # Click on law, access page
-                    all_links[i].click()
+                    bot.click(all_links[i])
                     # Switch to frame containing heading/title
                     bot.switch_to_frame("//frame[@name='Body']")
                     # Get title
@@ -204,31 +203,35 @@ def scrape_belgium_laws(headless=True):
                     # Write text file
                     # Get html text
                     text_html = bot.get_html()
-                    # Use Beautiful Soup to get Unicode string
-                    soup = BeautifulSoup(text_html, features="html.parser")
-                    text_soup = soup.get_text()
+                    # Parse it with lxml to get Unicode string
+                    text_soup = parsing.text(parsing.parse(text_html))
                     # Display what it's about
                     content_extract = text_soup[300:500]
                     print('It is about: ', content_extract)
                     # Create file
                     destination_file = create_destination_file(law_name=law_title, law_text=content_extract, type='txt', language=language)
-                    if destination_file is not None:
+                    # Check that the file does not already exist
+                    if path.exists(destination_file):
+                        print(destination_file + " is already downloaded. Not re-downloading.")
+                    else:
                         with open(destination_file, 'w') as f:
                             f.write(text_soup)
-                        # Add entry metadata for this law
-                        append_to_metadata(law_title, file_source_url, destination_file, language)
+                    # Add entry metadata for this law, even if it was downloaded before, so that metadata.json lists it
+                    entry = append_to_metadata(law_title, file_source_url, destination_file, language)
+                    frontier.done(law_url, metadata=entry)
 
                     # Exit frame and go back to listing
                     bot.switch_to_default()
                     bot.switch_to_frame("//frame[@name='Foot']")
                     # Click button to go back to listing
                     button_back = bot.find_xpath_solo("/html/body/table/tbody/tr/td[4]/form/input[5]")
-                    button_back.click()
+                    bot.click(button_back)
                     # Switch to listing frame
                     bot.switch_to_default()
                     bot.switch_to_frame("//frame[@name='Body']")
                     # Recollect all links
-                    all_links = bot.find_xpath("//input[@type='submit' and @name='numac']")
+                    all_links = bot.find_xpath(LAW_BUTTONS_XPATH)
+                listing_done = True
             except:
                print("\nNo laws accessible on this listing page. Moving on to the next.\n")
             try:
@@ -239,14 +242,34 @@ def scrape_belgium_laws(headless=True):
                 old_page = this_page
                 this_page = bot.find_xpath_solo("//input[@type='text' and @name='pub_date']").get_attribute("value")
                 print('\nThis listing page was published on:', this_page)
+                all_listings_done = all_listings_done and listing_done
+                listing_url = f'{LISTING_URL}?language={language}&pub_date={this_page}'
+                if listing_done:
+                    frontier.done(listing_url, data={'pub_date': this_page}, kind=listing_kind)
+                else:
+                    frontier.failed(listing_url, 'not every law could be scraped',
+                                    data={'pub_date': this_page, 'before': reached_from}, kind=listing_kind)
+                reached_from = this_page
+                # Stop there, unless a page that failed in an earlier run is further down
+                if crawled and listing_done and numacs and not new_laws and not frontier.pending(listing_kind):
+                    print(f'Every law from here on in {language} was scraped before.')
+                    break
+                # A fresh browser reopens the listing in this language, at the page before this one
+                bot.restore = lambda bot: open_listing(bot, language, before=this_page)
+                if bot.recycle_if_needed():
+                    continue
                 # Navigate to next page
-                button_next = bot.find_xpath_solo("//input[@type='Submit' and @value='Sommaire précédent' or @value='Vorige Inhoud' or @value='Voriger Inhalt']")
-                button_next.click()
+                button_next = bot.find_xpath_solo(PREVIOUS_BUTTON_XPATH)
+                bot.click(button_next)
             except:
                print("No next page could be accessed.")
                break
+        else:
+            # The last listing page was reached: unless a page failed, there is nothing left to do in this language
+            if all_listings_done:
+                frontier.done(f'{LISTING_URL}?language={language}', kind='language')
     # Write all metadata to JSON
-    write_metadata_json()
+    write_metadata_json(frontier)
     print(f'\n{laws_ttl} laws discovered in total')
     print('\nCode finished running!\n')
 
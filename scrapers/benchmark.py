@@ -0,0 +1,327 @@
+"""
+Offline benchmarks of the scrapers' parsing and extraction.
+
+Every case runs a scraper's own extraction code (e.g. vietnam's scrape_documents_info
+or india's collect_links_from_main_page) on pages recorded in benchmarks/fixtures/<country>,
+with http_cache.get and fetch_engine.fetch_all answering from the fixtures instead of
+the network, and downloads skipped. Nothing goes online, so parser changes can be
+measured and gated anywhere.
+
+For each case it reports pages parsed per second (best of --repeat samples), and from
+tracemalloc the peak memory of one run, and the allocations (blocks) and memory still
+allocated after it.
+With --save the results are added to benchmarks/history.json under the current
+commit, and every run is compared with the latest saved results (or --against a commit).
+--fail-over makes it exit with an error if a case got that many percent slower, or
+its peak memory that many percent bigger, so it can gate a change.
+
+The fixtures in the repository are small pages in the shape of each site. Run with
+--record (online) to replace a country's fixtures with the live pages: every page its
+cases ask for is fetched and saved, along with its url in the country's index.json.
+
+Usage:
+    python benchmark.py
+    python benchmark.py vietnam india --repeat 20
+    python benchmark.py --save
+    python benchmark.py --against 2693de7 --fail-over 10
+    python benchmark.py china --record
+"""
+import argparse
+from collections import namedtuple
+import contextlib
+from datetime import datetime
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+import fetch_engine
+import http_cache
+import parsing
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(REPO_DIR, 'benchmarks')
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, 'fixtures')
+HISTORY_PATH = os.path.join(BENCHMARK_DIR, 'history.json')
+# Timed samples per case; the best one is reported.
+REPEAT = 5
+# Seconds each sample should last, running the case as many times as that takes.
+SAMPLE_TIME = 0.2
+
+Case = namedtuple('Case', ['name', 'country', 'run'])
+
+
+class MissingFixture(KeyError):
+    """Raised when a case asks for a page that was never recorded."""
+
+
+class Fixtures:
+    """The recorded pages of one country, served by url from memory.
+
+    Missing pages fail like the network does: fetch_all returns None for them and get
+    raises. When recording, missing pages are fetched and saved instead.
+    """
+
+    def __init__(self, country: str, record=False):
+        self.directory = os.path.join(FIXTURE_DIR, country)
+        self.record = record
+        # Pages handed out, which is what a case's pages/sec counts
+        self.served = 0
+        if record:
+            # Recording starts over, so every page the cases ask for is fetched live
+            shutil.rmtree(self.directory, ignore_errors=True)
+        try:
+            with open(os.path.join(self.directory, 'index.json'), 'r') as file:
+                self.index = json.load(file)
+        except OSError:
+            self.index = {}
+        self.bodies = {}
+        for url, entry in self.index.items():
+            with open(os.path.join(self.directory, entry['file']), 'rb') as file:
+                self.bodies[url] = file.read()
+
+    def _record(self, url: str) -> bool:
+        response = fetch_engine.get_with_retries(url)
+        if response is None:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        filename = f'{len(self.index):03d}.html'
+        with open(os.path.join(self.directory, filename), 'wb') as file:
+            file.write(response.content)
+        self.index[url] = {'file': filename, 'encoding': response.encoding}
+        self.bodies[url] = response.content
+        with open(os.path.join(self.directory, 'index.json'), 'w') as file:
+            json.dump(self.index, file, indent=2)
+        print(f'Recorded {url}', file=sys.stderr)
+        return True
+
+    def response(self, url: str) -> Optional[requests.Response]:
+        if url not in self.index and not (self.record and self._record(url)):
+            return None
+        self.served += 1
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = self.bodies[url]
+        response.encoding = self.index[url].get('encoding')
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        response = self.response(url)
+        if response is None:
+            raise MissingFixture(url)
+        return response
+
+    def fetch_all(self, urls: Iterable[str], **kwargs) -> List[Optional[requests.Response]]:
+        return [self.response(url) for url in urls]
+
+
+@contextlib.contextmanager
+def replaced(module, **attributes):
+    """Sets attributes of module for the duration of the block."""
+    saved = {name: getattr(module, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+@contextlib.contextmanager
+def offline(fixtures: Fixtures):
+    """Serves the scrapers' requests from fixtures, and skips their downloads."""
+    with replaced(http_cache, get=fixtures.get), \
+         replaced(fetch_engine, fetch_all=fixtures.fetch_all,
+                  download_all=lambda downloads: dict.fromkeys(downloads)):
+        yield
+
+
+### The cases. Each one gets the country's scraper module and its fixtures.
+
+VIETNAM_LIST_URL = 'https://vbpl.vn/TW/Pages/vanbanTA.aspx?idLoaiVanBan=1&Page=1'
+
+def vietnam_documents_info(module, fixtures: Fixtures):
+    """A page of search results, with the pages of its documents and their Vietnamese versions."""
+    tree = parsing.parse(fixtures.get(VIETNAM_LIST_URL).content)
+    with tempfile.TemporaryDirectory() as directory, replaced(module, DOWNLOAD_PATH=directory):
+        module.scrape_documents_info(tree, 'Law')
+    module.METADATA.clear()
+
+def india_list_page(module, fixtures: Fixtures):
+    """A page of the list of acts."""
+    module.collect_links_from_main_page(module.START_URL)
+    module.ACT_PAGES.clear()
+
+def china_main_page(module, fixtures: Fixtures):
+    """The page listing all laws."""
+    module.collect_links_from_main_page()
+
+def albania_law_pages(module, fixtures: Fixtures):
+    """The list of laws, then find_pdf on the page of every law in it."""
+    law_pages = module.collect_links_from_main_page()
+    for page in fixtures.fetch_all([module.BASE_URL + link for link in law_pages]):
+        if page is not None:
+            module.find_pdf(parsing.parse(page.text))
+
+def armenia_law_pages(module, fixtures: Fixtures):
+    """The list of laws, then the title, pdf link and text of every law in it."""
+    law_pages = module.collect_links_from_main_page()
+    for page in fixtures.fetch_all(law_pages):
+        if page is not None:
+            tree = parsing.parse(page.content)
+            module.LAW_PAGE(tree, base_url=module.BASE_URL)
+            parsing.text(tree)
+
+CASES = [
+    Case('vietnam.scrape_documents_info', 'vietnam', vietnam_documents_info),
+    Case('india.collect_links_from_main_page', 'india', india_list_page),
+    Case('china.collect_links_from_main_page', 'china', china_main_page),
+    Case('albania.find_pdf', 'albania', albania_law_pages),
+    Case('armenia.law_page', 'armenia', armenia_law_pages),
+]
+
+
+def measure(case: Case, repeat=REPEAT, record=False) -> dict:
+    """Runs case once to warm up (or record), then repeat timed samples, then once traced."""
+    module = importlib.import_module(f'{case.country}_scraper')
+    fixtures = Fixtures(case.country, record=record)
+    with offline(fixtures), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        case.run(module, fixtures)
+        pages = fixtures.served
+        # Small fixtures run in milliseconds, so each sample runs the case enough times to last SAMPLE_TIME
+        loops = max(1, int(SAMPLE_TIME / max(time.perf_counter() - start, 1e-6)))
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(loops):
+                case.run(module, fixtures)
+            times.append((time.perf_counter() - start) / loops)
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        case.run(module, fixtures)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    diff = after.compare_to(before, 'filename')
+    retained = sum(stat.size_diff for stat in diff)
+    # Blocks still alive at the end of the run, so it counts what a case holds on to
+    allocations = sum(stat.count_diff for stat in diff)
+    return {'pages': pages,
+            'pages_per_sec': round(pages / min(times), 1) if pages else 0.0,
+            'peak_kb': round(peak / 1024, 1),
+            'allocations': allocations,
+            'retained_kb': round(retained / 1024, 1)}
+
+
+def current_commit() -> str:
+    """Returns the short hash of HEAD, with '+' if the tree has uncommitted changes."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True, cwd=REPO_DIR).stdout.strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD'], cwd=REPO_DIR).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('+' if dirty else '')
+
+
+def load_history() -> List[dict]:
+    try:
+        with open(HISTORY_PATH, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+
+def save_history(history: List[dict], commit: str, results: Dict[str, dict]):
+    # Re-running on a commit replaces its results
+    history = [entry for entry in history if entry['commit'] != commit]
+    history.append({'commit': commit, 'date': datetime.now().strftime('%Y-%m-%d %H:%M'),
+                    'python': platform.python_version(), 'results': results})
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    with open(HISTORY_PATH, 'w') as file:
+        json.dump(history, file, indent=2)
+
+
+def baseline(history: List[dict], against: Optional[str]) -> Optional[dict]:
+    """Returns the saved entry to compare with: against, or the latest one."""
+    if against is None:
+        return history[-1] if history else None
+    for entry in reversed(history):
+        if entry['commit'].rstrip('+').startswith(against):
+            return entry
+    raise SystemExit(f'No saved results for {against} in {HISTORY_PATH}')
+
+
+def _change(new: float, old: Optional[float]) -> Optional[float]:
+    return None if not old else (new - old) / old * 100
+
+
+def report(results: Dict[str, dict], base: Optional[dict], fail_over: Optional[float]) -> bool:
+    """Prints the results next to base's. Returns False if a case regressed past fail_over percent."""
+    ok = True
+    print(f'{"case":<38} {"pages":>5} {"pages/s":>9} {"change":>7} {"peak KB":>9} {"change":>7} {"allocations":>11} {"retained KB":>11}')
+    for name, result in results.items():
+        old = (base or {}).get('results', {}).get(name, {})
+        speed = _change(result['pages_per_sec'], old.get('pages_per_sec'))
+        peak = _change(result['peak_kb'], old.get('peak_kb'))
+        changes = [' ' * 7 if change is None else f'{change:+6.1f}%' for change in (speed, peak)]
+        flag = ''
+        if fail_over is not None and ((speed is not None and speed < -fail_over)
+                                      or (peak is not None and peak > fail_over)):
+            flag, ok = '  REGRESSION', False
+        print(f'{name:<38} {result["pages"]:>5} {result["pages_per_sec"]:>9.1f} {changes[0]} '
+              f'{result["peak_kb"]:>9.1f} {changes[1]} {result.get("allocations", 0):>11} '
+              f'{result["retained_kb"]:>11.1f}{flag}')
+    if base is not None:
+        print(f'Compared with {base["commit"]} ({base["date"]})')
+    return ok
+
+
+def select(names: List[str]) -> List[Case]:
+    """Returns the cases named (or whose country is named) in names, or all of them."""
+    if not names:
+        return CASES
+    cases = [case for case in CASES if case.name in names or case.country in names]
+    unknown = set(names) - {case.name for case in cases} - {case.country for case in cases}
+    if unknown:
+        raise SystemExit(f'Unknown cases: {", ".join(sorted(unknown))}')
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the scrapers\' parsing.')
+    parser.add_argument('cases', nargs='*', help='cases or countries to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='timed samples per case')
+    parser.add_argument('--save', action='store_true', help='add the results to the history')
+    parser.add_argument('--against', metavar='COMMIT', help='compare with this saved commit')
+    parser.add_argument('--fail-over', type=float, metavar='PERCENT',
+                        help='exit with an error on a slowdown or peak memory growth over PERCENT')
+    parser.add_argument('--record', action='store_true', help="replace the selected countries' fixtures with the live pages (online)")
+    args = parser.parse_args(argv)
+
+    history = load_history()
+    base = baseline(history, args.against)
+    results = {case.name: measure(case, args.repeat, args.record) for case in select(args.cases)}
+    commit = current_commit()
+    ok = report(results, base, args.fail_over)
+    if args.save:
+        save_history(history, commit, results)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
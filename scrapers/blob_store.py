@@ -0,0 +1,98 @@
+"""
+Content-addressed store for downloaded documents.
+
+Every downloaded file is stored once under data/blobs/<first 2 hex digits>/<sha256>,
+where the SHA-256 is computed while the file streams in (see resumable). The usual
+title-based download path is then a hard link to that blob, so:
+  - the same PDF reached through different titles, languages or attachments takes up
+    disk space only once;
+  - two different documents whose titles map to the same filename no longer overwrite
+    each other: the second one gets the start of its digest appended to its name. For
+    that, scrapers don't skip a download because a file with its title exists already;
+    pending downloads are keyed by url, and store() decides where the document goes.
+Metadata entries record the digest under 'sha256', so later stages can skip identical
+documents without reading them.
+"""
+from collections import namedtuple
+import hashlib
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+import metrics
+
+BLOB_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'blobs')
+CHUNK_SIZE = 1024 * 1024
+# Number of hex digits of the digest added to a filename to tell colliding documents apart.
+SUFFIX_LENGTH = 12
+
+# Where a stored document ended up, and its SHA-256 hex digest.
+Stored = namedtuple('Stored', ['path', 'sha256'])
+
+# Downloads finish on several threads at once; two of them may be after the same name
+_lock = threading.Lock()
+
+
+def blob_path(digest: str) -> str:
+    return os.path.join(BLOB_DIR, digest[:2], digest)
+
+
+def file_digest(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _link(blob: str, dest: str):
+    """Points dest at blob, with a hard link if possible and a copy otherwise."""
+    tmp = dest + '.link'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(blob, tmp)
+    except OSError:
+        shutil.copyfile(blob, tmp)
+    os.replace(tmp, dest)
+
+
+def store(path: str, digest: str, dest: str) -> Stored:
+    """Moves the finished file at path into the store and links it at dest.
+
+    Returns where the document can be found, which is dest unless dest already holds a
+    different document.
+    """
+    blob = blob_path(digest)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    with _lock:
+        if os.path.exists(blob):
+            print(f'Already stored identical file {digest[:SUFFIX_LENGTH]}, not storing it again')
+            metrics.increment('blob_duplicates')
+            os.remove(path)
+        else:
+            shutil.move(path, blob)
+
+        if os.path.exists(dest) and not os.path.samefile(dest, blob) and file_digest(dest) != digest:
+            # A different document already has this name.
+            root, ext = os.path.splitext(dest)
+            dest = f'{root}-{digest[:SUFFIX_LENGTH]}{ext}'
+            print(f'Another document is already saved under that name, saving as {dest}')
+        if not os.path.exists(dest) or not os.path.samefile(dest, blob):
+            _link(blob, dest)
+    return Stored(dest, digest)
+
+
+def add_digests(metadata: List[dict], stored: Dict[str, Optional[Stored]]):
+    """Records the digest (and final path) of downloaded files in their metadata entries.
+
+    stored maps each downloaded url to what was stored, as returned by
+    fetch_engine.download_all; entries are matched on their 'link'.
+    """
+    for entry in metadata:
+        result = stored.get(entry.get('link'))
+        if result is not None:
+            entry['download_path'] = result.path
+            entry['sha256'] = result.sha256
@@ -0,0 +1,85 @@
+"""
+Pool of headless browser workers sharing a queue of pages to scrape.
+
+Each worker thread owns its own Chrome (and therefore its own session and cookies) and
+takes items off a shared queue. If a worker's Chrome crashes, it is replaced by a fresh
+one and the item is tried again, so one dead browser doesn't end the crawl. Browsers
+that have loaded too many pages or grown too big are recycled between items.
+
+Usage:
+    pool = BrowserPool(lambda: ChromeBot(headless=True), workers=4)
+    results = pool.map(scrape_law, links)   # scrape_law(bot, link)
+"""
+import queue
+import threading
+from typing import TYPE_CHECKING, Callable, Iterable, List
+
+if TYPE_CHECKING:
+    from chrome_bot import ChromeBot
+
+WORKERS = 4
+# Times a single item is retried on a fresh browser after its browser crashed.
+MAX_RESTARTS = 2
+# Error messages from a driver whose browser is gone, rather than a page-level error.
+CRASH_MESSAGES = ('chrome not reachable', 'invalid session id', 'session deleted',
+                  'disconnected', 'target window already closed', 'tab crashed')
+
+
+def is_crash(error: Exception) -> bool:
+    """Returns true if the error means the browser itself died."""
+    # Imported here so that scrapers can use the pool's settings without loading selenium.
+    from selenium.common.exceptions import WebDriverException
+    message = str(error).lower()
+    return isinstance(error, WebDriverException) and any(crash in message for crash in CRASH_MESSAGES)
+
+
+class BrowserPool:
+    """Runs func(bot, item) for every item on a pool of browsers."""
+
+    def __init__(self, factory: Callable[[], 'ChromeBot'], workers=WORKERS):
+        self.factory = factory
+        self.workers = workers
+
+    def _work(self, func: Callable, items: queue.Queue, results: list):
+        bot = None
+        while True:
+            try:
+                index, item = items.get_nowait()
+            except queue.Empty:
+                break
+            for restart in range(MAX_RESTARTS + 1):
+                try:
+                    if bot is None:
+                        bot = self.factory()
+                    results[index] = func(bot, item)
+                    # Items don't depend on each other, so a worn-out browser can be swapped at any point.
+                    bot.recycle_if_needed()
+                    break
+                except Exception as e:
+                    if not is_crash(e):
+                        print(f'Failed to scrape {item}: {e}')
+                        break
+                    print(f'Browser crashed on {item}, restarting it')
+                    if bot is not None:
+                        bot.quit()
+                    bot = None
+        if bot is not None:
+            bot.quit()
+
+    def map(self, func: Callable, items: Iterable) -> List:
+        """Returns [func(bot, item) for item in items], computed on all workers.
+
+        Results are in the same order as items; items that failed give None.
+        """
+        items = list(items)
+        work = queue.Queue()
+        for index, item in enumerate(items):
+            work.put((index, item))
+        results = [None] * len(items)
+        threads = [threading.Thread(target=self._work, args=(func, work, results), daemon=True)
+                   for _ in range(min(self.workers, len(items)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,97 @@
+"""
+Persistent Chrome profiles, one set per country.
+
+A fresh ChromeBot starts from an empty temporary profile, so every run downloads the
+same JavaScript bundles and fonts again and goes through the same cookie banners.
+With a persistent profile the HTTP disk cache and cookies survive between runs.
+
+Chrome locks a profile while it uses it, so every browser needs a directory of its
+own: data/chrome_profiles/<country>/worker-<n>. A bot claims the first free slot and
+releases it when it quits, so parallel workers of one country each get their own.
+Each profile's disk cache is capped at CACHE_SIZE_MB, and a profile that grew past
+MAX_PROFILE_MB anyway has its caches cleared (keeping its cookies) before use.
+
+Usage:
+    bot = ChromeBot(headless=True, profile='france')
+"""
+import os
+import shutil
+import socket
+import threading
+from typing import Optional
+
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'chrome_profiles')
+# Most browsers of one country running at once with a persistent profile; more get a temporary one.
+MAX_SLOTS = 8
+CACHE_SIZE_MB = 256
+MAX_PROFILE_MB = 1024
+# Profile subdirectories that only hold caches, and can be deleted at any time.
+CACHE_DIRS = ['Cache', 'Code Cache', 'GPUCache', 'Service Worker/CacheStorage']
+
+_claimed = set()
+_lock = threading.Lock()
+
+
+def _in_use(path: str) -> bool:
+    """Returns true if a live Chrome holds the profile lock at path."""
+    lock = os.path.join(path, 'SingletonLock')
+    if not os.path.lexists(lock):
+        return False
+    try:
+        # The lock is a symlink to '<hostname>-<pid>'.
+        host, pid = os.readlink(lock).rsplit('-', 1)
+    except (OSError, ValueError):
+        return True
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+def prune(path: str):
+    """Clears the caches of the profile at path if it grew past MAX_PROFILE_MB."""
+    if _size_mb(path) <= MAX_PROFILE_MB:
+        return
+    print(f'Clearing the caches of Chrome profile {path}')
+    for profile in os.listdir(path):
+        for cache in CACHE_DIRS:
+            shutil.rmtree(os.path.join(path, profile, cache), ignore_errors=True)
+
+
+def claim(country: str) -> Optional[str]:
+    """Returns a free profile directory for country, or None if all slots are in use."""
+    with _lock:
+        for slot in range(MAX_SLOTS):
+            path = os.path.abspath(os.path.join(PROFILE_DIR, country, f'worker-{slot}'))
+            if path in _claimed or _in_use(path):
+                continue
+            os.makedirs(path, exist_ok=True)
+            _claimed.add(path)
+            break
+        else:
+            print(f'All Chrome profiles for {country} are in use, using a temporary one')
+            return None
+    prune(path)
+    return path
+
+
+def release(path: str):
+    """Lets another browser use the profile at path."""
+    with _lock:
+        _claimed.discard(path)
@@ -4,144 +4,134 @@ from datetime import date
 import json
 from os import link, path
 from pathlib import Path
-import re
 
-from bs4 import BeautifulSoup, SoupStrainer
-import requests
+import crawl_state
+import extraction
+import fetch_engine
+import http_cache
+import parsing
 
 START_URL = 'http://www.gov.cn/flfg/index.htm'
 BASE_URL = 'http://www.gov.cn'
 METADATA = []
 METADATA_PATH = '../data/china/metadata.json'
 DOWNLOAD_DIR = '../data/china/'
+MAIN_PAGE = extraction.Extractor({
+    'laws': {'select': '//a[@href]', 'value': '@href', 'match': '/flfg/', 'many': True,
+             'fields': {'link': {'value': '@href', 'type': 'url'}, 'title': 'text'}},
+})
+LAW_PAGE = extraction.Extractor({
+    # the pdf's url is in the title attribute of its link
+    'pdfs': {'select': "//*[contains(@href, 'pdf')]", 'many': True, 'fields': {'name': 'text', 'link': '@title'}},
+    # the law text is in the p tags only
+    'paragraphs': {'select': '//p', 'many': True},
+})
 
 def collect_links_from_main_page():
     """Create a list of links from the START_URL."""
     law_pages = []
     print('Starting to request...')
-    response = requests.get(START_URL)
+    response = http_cache.get(START_URL)
     print('Got response!')
     response.encoding = 'utf-8' # assign encoding for Simplified Chinese character
-    html = BeautifulSoup(response.text, 'html.parser')
-
-    for link in html.find_all('a'):
-        if link.has_attr('href'):
-            search = re.search('/flfg/', link['href'])
-            if search is not None:
-                full_link = BASE_URL + link['href']
-                law_title = link.text
-                if full_link == START_URL:
-                    continue
-                law_pages.append((full_link, law_title))
+    main_page = MAIN_PAGE(parsing.parse(response.text), base_url=BASE_URL)
+
+    for law in main_page['laws']:
+        if law['link'] == START_URL:
+            continue
+        law_pages.append((law['link'], law['title']))
     return law_pages
 
-def download_multiple_pdf(pdf_path, link_list):
+def download_multiple_pdf(pdf_path, pdfs, downloads):
     """Use if a law page contains more than one pdf links"""
     print('Found multiple pdf in one page...')
-    for iter, link in enumerate(link_list):
-        filename = pdf_path[:-4] + '_' + str(iter) + '_' + link.text + '.pdf'
-        http_link = link['title']
-        print('Saving pdf from ', http_link, ' to ', filename)
-
-        for _ in range(1,10):
-            try:
-                request = requests.get(http_link, timeout=10, stream=True)
-            except Exception as e:
-                print(e)
-                continue
-            break
-
-        # Open output file. Write in binary mode
-        with open(filename, 'wb') as file_handle:
-            for chunk in request.iter_content(1024 * 1024):
-                file_handle.write(chunk) 
-
-def download_pdf(pdf_path, page_soup):
-    """Search for pdf in the page, download pdf. Return true if found, else return false."""
-    link = page_soup.find_all(href=re.compile('pdf'))
-    if link != []:
-        if len(link) == 1:
-            filename = pdf_path
-            http_link = link[0]['title']
-            print('Saving pdf from ', http_link, ' to ', filename)
-
-            for _ in range(1,10):
-                try:
-                    request = requests.get(http_link, timeout=10, stream=True)
-                except Exception as e:
-                    print(e)
-                    continue
-                break
-
-            # Open the output file. Write in binary mode
-            with open(filename, 'wb') as file_handle:
-                for chunk in request.iter_content(1024 * 1024):
-                    file_handle.write(chunk)
+    for iter, pdf in enumerate(pdfs):
+        filename = pdf_path[:-4] + '_' + str(iter) + '_' + pdf['name'] + '.pdf'
+        downloads[pdf['link']] = filename
+
+def download_pdf(pdf_path, pdfs, downloads):
+    """Queue the pdfs found in the page for download. Return true if there are any, else return false."""
+    if pdfs != []:
+        if len(pdfs) == 1:
+            downloads[pdfs[0]['link']] = pdf_path
         else:
-            download_multiple_pdf(pdf_path, link)
+            download_multiple_pdf(pdf_path, pdfs, downloads)
         return True
     return False
 
-def download_text(page, filename):
-    """Parse page to get law text (p tag only) and write to txt file."""
+def download_text(paragraphs, filename):
+    """Write the law text (the page's p tags) to a txt file."""
     print('Saving law text from page')
-    soup_p = BeautifulSoup(page.text, 'html.parser', parse_only=SoupStrainer('p'))
-    law_text = soup_p.get_text()
+    law_text = ''.join(paragraphs)
     with open(filename, 'a', encoding='utf-8') as file:
         file.write(law_text)
         file.close()
 
-def write_metadata_json():
-    """Write the metadata file."""
+def write_metadata_json(frontier):
+    """Write the metadata file, with the laws of every run so far."""
     print('Writing metadata to json.')
+    METADATA[:] = frontier.metadata()
     with open(METADATA_PATH, 'w', encoding='utf-8') as file:
         json.dump(METADATA, file, ensure_ascii=False)
 
-def scrape_china_laws():
-    """Download all laws from the China Policy webpage."""
-    Path(f'{DOWNLOAD_DIR}pdf').mkdir(parents=True, exist_ok=True)
-    Path(f'{DOWNLOAD_DIR}txt').mkdir(parents=True, exist_ok=True)
+def scrape_law_pages(frontier, law_pages):
+    """Scrapes a batch of (link, title) law pages, and records what became of them in the frontier."""
+    # Fetch the law pages concurrently, then parse them in order.
+    pages = fetch_engine.fetch_all([link for link, _ in law_pages], cache=True)
+    downloads = {}
+    entries = {}
+    # The pdf each law page queued, or the list of them when it has several
+    sources = {}
 
-    law_pages = collect_links_from_main_page()
-
-    for link, law_title in law_pages:
+    for (link, law_title), page in zip(law_pages, pages):
         print('Scraping law from link ' + link)
+        if page is None:
+            frontier.failed(link, 'could not fetch the page')
+            continue
 
-        for _ in range(1, 10):
-            try:
-                page = requests.get(link, timeout=10)
-            except Exception as e:
-                print(e)
-                continue
-            break
-        
-        # Indicate encoding for Simplified Chinese characters
+        # Indicate encoding for Simplified Chinese characters.
+        # Parse each page once; the pdf links and the text both come from it.
         page.encoding = 'utf-8'
-        soup = BeautifulSoup(page.text, 'html.parser')
+        law = LAW_PAGE(parsing.parse(page.text))
         pdf_path = DOWNLOAD_DIR + 'pdf/' + law_title + '.pdf'
         txt_path = DOWNLOAD_DIR + 'txt/' + law_title + '.txt'
 
-        if path.exists(pdf_path) or path.exists(txt_path):
-            print('Already downloaded.')
-            continue
-
-        # First search if pdf file exists. If yes, download pdf.
-        # Otherwise download the text on the page.
-        is_pdf = download_pdf(pdf_path, soup)        
-    
-        if is_pdf:
+        # First search if pdf file exists. If yes, download pdf, even if a file has its
+        # name: blob_store tells different laws apart. Otherwise download the text on the page.
+        if download_pdf(pdf_path, law['pdfs'], downloads):
+            links = [pdf['link'] for pdf in law['pdfs']]
+            sources[link] = links[0] if len(links) == 1 else links
             download_path = pdf_path
+        # Laws already on disk keep their metadata entry, so that metadata.json still lists them
+        elif path.exists(txt_path):
+            print('Already downloaded.')
+            download_path = txt_path
         else:
             download_path = txt_path
-            download_text(page, txt_path)
+            download_text(law['paragraphs'], txt_path)
 
-        METADATA.append({'title': law_title,
+        entries[link] = {'title': law_title,
                          'link': link,
                          'download_path': download_path,
                          'download_date': date.today().strftime('%Y-%m-%d'),
-                         'country': 'China'})
+                         'country': 'China'}
+
+    frontier.done_downloads(entries, sources, fetch_engine.download_all(downloads))
+
+def scrape_china_laws():
+    """Download all laws from the China Policy webpage."""
+    Path(f'{DOWNLOAD_DIR}pdf').mkdir(parents=True, exist_ok=True)
+    Path(f'{DOWNLOAD_DIR}txt').mkdir(parents=True, exist_ok=True)
 
-    write_metadata_json()
+    frontier = crawl_state.Frontier('china')
+    law_pages = collect_links_from_main_page()
+    frontier.add(link for link, _ in law_pages)
+    # Only the law pages not done by an earlier run are fetched, a batch at a time
+    pending = set(frontier.pending())
+    law_pages = [(link, law_title) for link, law_title in law_pages if link in pending]
+    for batch in crawl_state.batches(law_pages):
+        scrape_law_pages(frontier, batch)
+    write_metadata_json(frontier)
 
 if __name__ == '__main__':
     scrape_china_laws()
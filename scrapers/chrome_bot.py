@@ -0,0 +1,526 @@
+"""
+Selenium Chrome bot shared by the browser-based scrapers.
+
+This used to be copied into every scraper ("REUSABLE CODE"); it now lives here so that
+improvements reach all of them.
+
+Waits are explicit: instead of sleeping, the bot polls for the condition it is
+actually waiting on (an element, an iframe's src, a new tab, the network going
+quiet) and moves on as soon as it holds. Every wait is recorded in metrics, and
+times out after the per-site timeout in SITE_WAIT_TIMEOUTS.
+
+In lean mode (ChromeBot(lean=True)) the browser doesn't download images, fonts,
+stylesheets, media or analytics scripts, since the scrapers only read the DOM's text
+and links. Requests are blocked through DevTools (Network.setBlockedURLs); sites that
+break without some of those resources allow them back in LEAN_ALLOW. DevTools settings
+belong to a tab, so the block list is set again in every tab the bot switches to.
+
+A bot created with capture_mime_types keeps the bodies of matching responses (e.g.
+the PDF shown in a viewer) available through DevTools, so save_captured() can write
+the document the browser already loaded instead of downloading it a second time.
+DevTools hands the body over in one piece, so save_captured() holds it in memory (as
+base64 when it is binary): Chrome only keeps bodies up to CAPTURE_MAX_MB for it, and a
+bigger document is left to the scraper's own streamed download.
+
+Chrome's memory keeps growing over a long crawl, so the bot counts the pages it loads
+and watches the memory of its chromedriver and Chrome processes. Past MAX_PAGES or
+MAX_MEMORY_MB, recycle_if_needed() restarts the browser and calls bot.restore(bot),
+which the scraper sets to take the new browser back to where the crawl was.
+
+ChromeBot(profile='<country>') runs Chrome on a persistent profile from
+browser_profiles, so its disk cache and cookies carry over to the next run.
+
+extract(spec) reads many elements in one script call instead of one WebDriver round
+trip per element and attribute. A spec maps field names to what to read from every
+element matching its selector (CSS, or XPath if it starts with / or ( or ./):
+    bot.extract({'selector': 'a', 'fields': {'href': 'href', 'id': 'id'}})
+    -> [{'href': 'https://...', 'id': 'next'}, ...]
+A field is 'text' (the visible text, like WebElement.text), the name of a property or
+attribute (like WebElement.get_attribute), or a nested spec relative to the element.
+
+Usage:
+    bot = ChromeBot(headless=True, lean=True)
+    bot.click(link)
+    pdf_url = bot.wait_for_attribute('.pdf-reader iframe', 'src')
+"""
+import base64
+from collections import defaultdict
+import hashlib
+import json
+import os
+import time
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+import blob_store
+from browser_pool import is_crash
+import browser_profiles
+import driver_resolver
+import http_client
+import metrics
+import rate_limiter
+
+### Fake user agent to bypass anti-robot walls
+FAKE_USER_AGENT = 'Mozilla/5.0 (Windows NT 4.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36'
+
+# Seconds to wait for a condition before giving up, unless the site is listed in SITE_WAIT_TIMEOUTS.
+WAIT_TIMEOUT = 10
+# Slow sites get longer.
+SITE_WAIT_TIMEOUTS = {
+    'www.fedlex.admin.ch': 20,
+    'www.legifrance.gouv.fr': 15,
+    'www.leganet.cd': 20,
+}
+# Seconds between checks of a condition.
+POLL_INTERVAL = 0.2
+# The network counts as idle once no resource has finished loading for this many seconds.
+NETWORK_IDLE = 0.5
+
+# URL patterns blocked in lean mode ('*' matches anything): resource types we never read...
+LEAN_BLOCKED_RESOURCES = [
+    '*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.svg*', '*.webp*', '*.ico*', '*.bmp*',
+    '*.woff*', '*.ttf*', '*.otf*', '*.eot*',
+    '*.css*',
+    '*.mp4*', '*.webm*', '*.mp3*',
+]
+# ...and third-party analytics and tracking hosts.
+LEAN_BLOCKED_HOSTS = [
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*googlesyndication.com*',
+    '*facebook.net*', '*hotjar.com*', '*matomo*', '*piwik*', '*xiti.com*', '*atinternet*',
+]
+# Patterns each site needs to work, which lean mode lets through there.
+LEAN_ALLOW = {
+    # The link to the list of laws is an image.
+    'www.leganet.cd': ['*.png*', '*.jpg*', '*.jpeg*', '*.gif*'],
+}
+# Restart the browser after loading this many pages...
+MAX_PAGES = 500
+# ...or once chromedriver and Chrome use this much memory (RSS, in MB, shared pages counted per process).
+MAX_MEMORY_MB = 2048
+# Seconds between memory checks, which scan /proc.
+MEMORY_CHECK_INTERVAL = 30
+# Largest response body Chrome keeps for save_captured(), which reads it into memory whole.
+CAPTURE_MAX_MB = 20
+# Total size of the bodies Chrome keeps at once, for the responses of a few documents.
+CAPTURE_BUFFER_MB = 5 * CAPTURE_MAX_MB
+# Characters of base64 decoded at a time when writing a captured body (a multiple of 4).
+CAPTURE_CHUNK = 4 * 256 * 1024
+
+EXTRACT_SCRIPT = """
+function select(context, selector) {
+    if (/^(\\/|\\(|\\.\\/|\\.\\.)/.test(selector)) {
+        const result = document.evaluate(selector, context, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        const nodes = [];
+        for (let i = 0; i < result.snapshotLength; i++) {
+            nodes.push(result.snapshotItem(i));
+        }
+        return nodes;
+    }
+    return Array.from(context.querySelectorAll(selector));
+}
+function read(element, field) {
+    if (typeof field === 'object') {
+        return extract(element, field);
+    }
+    if (field === 'text') {
+        return (element.innerText || element.textContent || '').trim();
+    }
+    const property = element[field];
+    if (property !== undefined && property !== null && typeof property !== 'object' && typeof property !== 'function') {
+        return property;
+    }
+    return element.getAttribute(field);
+}
+function extract(context, spec) {
+    return select(context, spec.selector).map(function (element) {
+        const row = {};
+        for (const name in spec.fields) {
+            row[name] = read(element, spec.fields[name]);
+        }
+        return row;
+    });
+}
+return extract(document, arguments[0]);
+"""
+
+
+def _process_tree(root: int) -> List[int]:
+    """Returns root and all its descendant process ids, from /proc."""
+    children = defaultdict(list)
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # The process name is in parentheses and can contain spaces; the parent id is the second field after it.
+        children[int(stat.rsplit(')', 1)[1].split()[1])].append(int(entry))
+    tree, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children[pid])
+    return tree
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class ChromeBot:
+    def __init__(self, headless=False, user_agent: Optional[str] = FAKE_USER_AGENT,
+                 driver_path: Optional[str] = None, pdf_viewer=False,
+                 window_size: Optional[str] = None, lean=False,
+                 capture_mime_types: Optional[List[str]] = None, profile: Optional[str] = None):
+        options = Options()
+        options.headless = headless
+        if user_agent is not None:
+            options.add_argument(f'user-agent={user_agent}')
+        if window_size is not None:
+            options.add_argument(f'--window-size={window_size}')
+
+        if not pdf_viewer:
+            # Add custom prefs to disactivate PDF viewer
+            prefs = {
+                "plugins.plugins_list": [{"enabled": False,
+                                             "name": "Chrome PDF Viewer"}],
+            }
+            options.add_experimental_option("prefs", prefs)
+        if capture_mime_types:
+            # The performance log carries the DevTools network events.
+            options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        self.profile_path = browser_profiles.claim(profile) if profile is not None else None
+        if self.profile_path is not None:
+            options.add_argument(f'--user-data-dir={self.profile_path}')
+            options.add_argument(f'--disk-cache-size={browser_profiles.CACHE_SIZE_MB * 1024 * 1024}')
+
+        self.options = options
+        # Resolved once per process, offline when possible
+        self.driver_path = driver_path if driver_path is not None else driver_resolver.driver_path()
+        self.lean = lean
+        self.capture_mime_types = capture_mime_types or []
+        # Called with the bot after it was recycled, to get back to where the crawl was
+        self.restore: Optional[Callable[['ChromeBot'], None]] = None
+        self._start()
+        print('Chrome bot initialized!')
+
+    def _start(self):
+        if self.driver_path is not None:
+            self.driver = webdriver.Chrome(service=Service(self.driver_path), options=self.options)
+        else:
+            self.driver = webdriver.Chrome(options=self.options)
+        # Window handle -> the patterns blocked in that tab
+        self._blocked = {}
+        # DevTools request id -> url, for matching responses that haven't finished loading yet
+        self._capturing = {}
+        # (request id, url) of matching responses that have finished loading, oldest first
+        self._captured = []
+        self.pages = 0
+        self._memory_checked = time.monotonic()
+        if self.lean or self.capture_mime_types:
+            self._enable_network()
+
+    def _enable_network(self):
+        """Turns on the DevTools network domain in the current tab, keeping only bodies that save_captured() can hold."""
+        self.driver.execute_cdp_cmd('Network.enable', {'maxResourceBufferSize': CAPTURE_MAX_MB * 1024 * 1024,
+                                                       'maxTotalBufferSize': CAPTURE_BUFFER_MB * 1024 * 1024})
+
+    def memory_mb(self) -> Optional[float]:
+        """Returns the memory used by chromedriver and the Chrome processes it started,
+        or None if it can't be measured (no /proc)."""
+        process = getattr(self.driver.service, 'process', None)
+        if process is None or not os.path.isdir('/proc'):
+            return None
+        return sum(_rss_kb(pid) for pid in _process_tree(process.pid)) / 1024
+
+    def needs_recycle(self) -> bool:
+        """Returns true if the browser has loaded too many pages or uses too much memory."""
+        if self.pages >= MAX_PAGES:
+            print(f'Chrome has loaded {self.pages} pages')
+            return True
+        if time.monotonic() - self._memory_checked < MEMORY_CHECK_INTERVAL:
+            return False
+        self._memory_checked = time.monotonic()
+        memory = self.memory_mb()
+        if memory is not None and memory >= MAX_MEMORY_MB:
+            print(f'Chrome uses {memory:.0f} MB')
+            return True
+        return False
+
+    def recycle(self):
+        """Restarts the browser, then restores the crawl's state with self.restore."""
+        print('Recycling Chrome')
+        metrics.increment('browser_recycles')
+        self._quit_driver()
+        self._start()
+        if self.restore is not None:
+            self.restore(self)
+
+    def recycle_if_needed(self) -> bool:
+        """Recycles the browser if it needs it. Returns true if it did."""
+        if not self.needs_recycle():
+            return False
+        self.recycle()
+        return True
+
+    def block_for(self, url):
+        """In lean mode, blocks the resources that the site of url doesn't need."""
+        if not self.lean:
+            return
+        allowed = LEAN_ALLOW.get(urlparse(url).netloc, [])
+        blocked = [pattern for pattern in LEAN_BLOCKED_RESOURCES + LEAN_BLOCKED_HOSTS if pattern not in allowed]
+        handle = self.driver.current_window_handle
+        if blocked != self._blocked.get(handle):
+            if handle not in self._blocked:
+                # A tab opened after the first one doesn't have the network domain on yet
+                self._enable_network()
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked})
+            self._blocked[handle] = blocked
+
+    def navigate_to(self, url) -> bool:
+        """Loads url, paced by rate_limiter. Returns False if it could not be loaded, and
+        raises if the browser crashed, so that a BrowserPool restarts it."""
+        try:
+            self.block_for(url)
+            self.pages += 1
+            rate_limiter.navigate(self.driver, url)
+            print(f'Loaded page: {url}')
+            return True
+        except Exception as e:
+            if is_crash(e):
+                raise
+            print(f'Could not access this page: {url}')
+            return False
+
+    def find_xpath(self, xpath):
+        try:
+            return self.driver.find_elements(By.XPATH, xpath)
+        except IndexError:
+            print('FAILED: Chrome bot could not find specified xpath.')
+
+    def find_xpath_solo(self, xpath):
+        try:
+            return self.driver.find_element(By.XPATH, xpath)
+        except IndexError:
+            print('FAILED: Chrome bot could not find specified xpath.')
+
+    def find_class(self, class_name):
+        try:
+            return self.driver.find_elements(By.CLASS_NAME, class_name)
+        except IndexError:
+            print(f'FAILED: Chrome bot could not find elements of that class: {class_name}.')
+
+    def find_id(self, id_name):
+        try:
+            return self.driver.find_elements(By.ID, id_name)
+        except IndexError:
+            print(f'FAILED: Chrome bot could not find elements with that id: {id_name}.')
+
+    def find_tag(self, tag_name):
+        try:
+            return self.driver.find_elements(By.TAG_NAME, tag_name)
+        except IndexError:
+            print(f'FAILED: Chrome bot could not find elements with that tag name: {tag_name}.')
+
+    def find_text(self, text):
+        try:
+            return self.driver.find_element(By.LINK_TEXT, text)
+        except IndexError:
+            print(f'FAILED: Chrome bot could not find elements with that text: {text}.')
+
+    def find_css(self, css_selector):
+        try:
+            return self.driver.find_elements(By.CSS_SELECTOR, css_selector)
+        except IndexError:
+            print(f'FAILED: Chrome bot could not find elements with that CSS: {css_selector}.')
+
+    def extract(self, spec: dict) -> List[dict]:
+        """Returns the fields of spec for every element matching its selector, in one script call."""
+        return self.driver.execute_script(EXTRACT_SCRIPT, spec) or []
+
+    def get_html(self):
+        return self.driver.page_source
+
+    def get_url(self):
+        return self.driver.current_url
+
+    def click(self, element):
+        """Clicks an element that navigates somewhere, paced by the rate limiter."""
+        self.pages += 1
+        rate_limiter.click(self.driver, element)
+
+    def export_session(self) -> http_client.ScraperSession:
+        """Returns an HTTP session carrying this browser's cookies and user agent, so pages
+        behind the browser's session can be fetched without going through WebDriver."""
+        user_agent = self.driver.execute_script('return navigator.userAgent')
+        session = http_client.new_session(headers={'User-Agent': user_agent})
+        for cookie in self.driver.get_cookies():
+            session.cookies.set(cookie['name'], cookie['value'],
+                                domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        return session
+
+    def timeout_for(self, timeout: Optional[float] = None) -> float:
+        """Returns timeout, or the default timeout for the site the bot is on."""
+        if timeout is not None:
+            return timeout
+        return SITE_WAIT_TIMEOUTS.get(urlparse(self.driver.current_url).netloc, WAIT_TIMEOUT)
+
+    def wait(self, name: str, condition: Callable, timeout: Optional[float] = None):
+        """Waits until condition(driver) returns something truthy, and returns it.
+        Returns None if it timed out. The time taken is recorded as metric wait.<name>."""
+        timeout = self.timeout_for(timeout)
+        start = time.monotonic()
+        try:
+            result = WebDriverWait(self.driver, timeout, poll_frequency=POLL_INTERVAL,
+                                   ignored_exceptions=(StaleElementReferenceException,)).until(condition)
+        except TimeoutException:
+            print(f'Timed out after {timeout}s waiting for {name}')
+            metrics.increment(f'wait_timeouts.{name}')
+            result = None
+        metrics.record(f'wait.{name}', time.monotonic() - start)
+        return result
+
+    def wait_for_xpath(self, xpath, timeout: Optional[float] = None) -> List:
+        """Waits until elements matching xpath are present, and returns them (or [] on timeout)."""
+        return self.wait('element', lambda driver: driver.find_elements(By.XPATH, xpath), timeout) or []
+
+    def wait_for_css(self, css_selector, timeout: Optional[float] = None) -> List:
+        """Waits until elements matching css_selector are present, and returns them (or [] on timeout)."""
+        return self.wait('element', lambda driver: driver.find_elements(By.CSS_SELECTOR, css_selector), timeout) or []
+
+    def wait_for_attribute(self, css_selector, attribute='src', timeout: Optional[float] = None) -> Optional[str]:
+        """Waits until an element matching css_selector has attribute set (e.g. an iframe's src), and returns it."""
+        def attribute_set(driver):
+            for element in driver.find_elements(By.CSS_SELECTOR, css_selector):
+                value = element.get_attribute(attribute)
+                if value and value != 'about:blank':
+                    return value
+            return None
+        return self.wait(attribute, attribute_set, timeout)
+
+    def wait_for_new_tab(self, handles: List[str], timeout: Optional[float] = None) -> bool:
+        """Waits until a tab that is not in handles opens, and switches to it."""
+        def new_tab(driver):
+            return [handle for handle in driver.window_handles if handle not in handles]
+        opened = self.wait('new_tab', new_tab, timeout)
+        if not opened:
+            return False
+        self.driver.switch_to.window(opened[-1])
+        # Whatever the tab loads from now on skips the blocked resources too
+        self.block_for(self.driver.current_url)
+        return True
+
+    def wait_for_network_idle(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the page has loaded and no resource has finished loading for NETWORK_IDLE seconds."""
+        state = {'count': -1, 'since': time.monotonic()}
+        def idle(driver):
+            ready, count = driver.execute_script(
+                "return [document.readyState, performance.getEntriesByType('resource').length]")
+            now = time.monotonic()
+            if ready != 'complete' or count != state['count']:
+                state['count'], state['since'] = count, now
+                return False
+            return now - state['since'] >= NETWORK_IDLE
+        return bool(self.wait('network_idle', idle, timeout))
+
+    def _read_network_log(self):
+        """Picks matching responses out of the DevTools events logged since the last call."""
+        for entry in self.driver.get_log('performance'):
+            message = json.loads(entry['message'])['message']
+            params = message.get('params', {})
+            if message.get('method') == 'Network.responseReceived':
+                response = params['response']
+                if response.get('mimeType') in self.capture_mime_types:
+                    self._capturing[params['requestId']] = response['url']
+            elif message.get('method') == 'Network.loadingFinished' and params.get('requestId') in self._capturing:
+                self._captured.append((params['requestId'], self._capturing.pop(params['requestId'])))
+
+    def clear_captured(self):
+        """Forgets the responses captured so far, e.g. before clicking a link to a new document."""
+        if self.capture_mime_types:
+            self._read_network_log()
+        self._capturing.clear()
+        self._captured.clear()
+
+    def save_captured(self, dest: str, url: Optional[str] = None,
+                      timeout: Optional[float] = None) -> Optional[blob_store.Stored]:
+        """Waits for a captured response (from url, or the latest one), and writes its body to dest.
+
+        DevTools returns the whole body at once, so it is held in memory (a third bigger, as
+        base64) while it is written; bodies over CAPTURE_MAX_MB aren't kept by Chrome at all.
+        Returns where the file was stored and its digest, or None if there was nothing to
+        save, e.g. a body too big to capture, which the caller then downloads itself.
+        """
+        def finished(driver):
+            self._read_network_log()
+            matching = [request_id for request_id, response_url in self._captured
+                        if url is None or response_url == url]
+            return matching[-1] if matching else None
+        request_id = self.wait('captured_response', finished, timeout)
+        if request_id is None:
+            return None
+        try:
+            result = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        except WebDriverException as e:
+            print(f'Could not read the captured response: {e}')
+            return None
+        body = result['body']
+        part = dest + '.part'
+        hasher = hashlib.sha256()
+        with open(part, 'wb') as file_handle:
+            if result.get('base64Encoded'):
+                for start in range(0, len(body), CAPTURE_CHUNK):
+                    chunk = base64.b64decode(body[start:start + CAPTURE_CHUNK])
+                    file_handle.write(chunk)
+                    hasher.update(chunk)
+            else:
+                chunk = body.encode('utf-8')
+                file_handle.write(chunk)
+                hasher.update(chunk)
+        metrics.increment('captured_responses')
+        print('Saved captured response to ', dest)
+        return blob_store.store(part, hasher.hexdigest(), dest)
+
+    def switch_to_default(self):
+        self.driver.switch_to.default_content()
+
+    def switch_to_tab(self, tab_id):
+        tab = self.driver.window_handles[tab_id]
+        self.driver.switch_to.window(tab)
+        self.block_for(self.driver.current_url)
+
+    def switch_to_frame(self, frame_xpath: str):
+        frame = self.driver.find_element(By.XPATH, frame_xpath)
+        self.driver.switch_to.frame(frame)
+
+    def wait_sec(self, time_sec):
+        """Waits up to time_sec for the page to settle. Prefer waiting for a specific condition."""
+        self.wait_for_network_idle(timeout=time_sec)
+
+    def _quit_driver(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            print(f'Could not close Chrome cleanly: {e}')
+
+    def quit(self):
+        self._quit_driver()
+        if self.profile_path is not None:
+            browser_profiles.release(self.profile_path)
+            self.profile_path = None
@@ -0,0 +1,195 @@
+"""
+One entry point for all scrapers.
+
+Every <country>_scraper.py module with a scrape_<name>_laws function is a scraper.
+They are found by reading the modules' source (with ast) rather than importing them,
+so listing them or checking their status doesn't load selenium, bs4 or lxml. A
+scraper's module, and whatever it imports, is only loaded when it is run.
+
+Usage:
+    python cli.py list
+    python cli.py status
+    python cli.py run albania armenia
+    python cli.py run france --show-browser
+    python cli.py reset india
+"""
+import argparse
+import ast
+from collections import namedtuple
+from datetime import datetime
+import glob
+import importlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+import crawl_state
+
+SCRAPERS_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_PATTERN = re.compile(r'scrape_(\w+)_laws$')
+# Modules whose import means a scraper drives a browser.
+BROWSER_MODULES = {'chrome_bot', 'browser_pool', 'selenium'}
+
+Scraper = namedtuple('Scraper', ['country', 'module', 'function', 'description', 'browser',
+                                 'metadata_path', 'arguments'])
+
+
+def _imports(tree: ast.Module) -> set:
+    """Returns the top-level packages a module imports."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module is not None:
+            names.add(node.module.split('.')[0])
+    return names
+
+
+def _constants(tree: ast.Module) -> Dict[str, object]:
+    """Returns the module-level constants that are plain literals."""
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                constants[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                pass
+    return constants
+
+
+def _read(path: str) -> Optional[Scraper]:
+    with open(path, 'r', encoding='utf-8') as file:
+        tree = ast.parse(file.read(), filename=path)
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)
+                 and FUNCTION_PATTERN.match(node.name)]
+    if not functions:
+        return None
+    function = functions[0]
+    module = os.path.splitext(os.path.basename(path))[0]
+    country = module[:-len('_scraper')].lower()
+    docstring = ast.get_docstring(tree) or ''
+    description = docstring.strip().splitlines()[0] if docstring.strip() else ''
+    metadata_path = _constants(tree).get('METADATA_PATH')
+    if not isinstance(metadata_path, str):
+        metadata_path = f'../data/{country}/metadata.json'
+    return Scraper(country, module, function.name, description, bool(_imports(tree) & BROWSER_MODULES),
+                   os.path.normpath(os.path.join(SCRAPERS_DIR, metadata_path)),
+                   [arg.arg for arg in function.args.args])
+
+
+def discover() -> Dict[str, Scraper]:
+    """Returns every scraper, by country."""
+    scrapers = {}
+    for path in sorted(glob.glob(os.path.join(SCRAPERS_DIR, '*_scraper.py'))):
+        scraper = _read(path)
+        if scraper is not None:
+            scrapers[scraper.country] = scraper
+    return scrapers
+
+
+def find(scrapers: Dict[str, Scraper], name: str) -> Optional[Scraper]:
+    """Finds a scraper by country or by the name in its function (e.g. 'swiss')."""
+    name = name.lower()
+    if name in scrapers:
+        return scrapers[name]
+    for scraper in scrapers.values():
+        if FUNCTION_PATTERN.match(scraper.function).group(1) == name:
+            return scraper
+    return None
+
+
+def list_scrapers(scrapers: Dict[str, Scraper]):
+    for scraper in scrapers.values():
+        kind = 'browser' if scraper.browser else 'http'
+        print(f'{scraper.country:<12} {kind:<8} {scraper.module}.{scraper.function}  {scraper.description}')
+
+
+def _crawl_progress(country: str) -> str:
+    """Returns how many urls of a scraper's crawl state are done, pending and failed, if any."""
+    if not os.path.exists(crawl_state.STATE_PATH):
+        return ''
+    frontier = crawl_state.Frontier(country)
+    counts = frontier.counts()
+    frontier.close()
+    if not counts:
+        return ''
+    return '  (crawl: ' + ', '.join(f'{counts.get(status, 0)} {status}'
+                                   for status in ('done', 'pending', 'failed')) + ')'
+
+
+def status(scrapers: Dict[str, Scraper]):
+    """Prints when each scraper last wrote its metadata, how many laws it lists, and how far
+    its crawl got."""
+    for scraper in scrapers.values():
+        progress = _crawl_progress(scraper.country)
+        if not os.path.exists(scraper.metadata_path):
+            print(f'{scraper.country:<12} never finished{progress}' if progress else f'{scraper.country:<12} never run')
+            continue
+        modified = datetime.fromtimestamp(os.path.getmtime(scraper.metadata_path)).strftime('%Y-%m-%d %H:%M')
+        try:
+            with open(scraper.metadata_path, 'r') as file:
+                laws = f'{len(json.load(file))} laws'
+        except (OSError, ValueError):
+            laws = 'unreadable metadata'
+        print(f'{scraper.country:<12} {modified}  {laws}{progress}')
+
+
+def reset(scrapers: List[Scraper]):
+    """Forgets the crawl state of scrapers, so that their next run starts from scratch."""
+    for scraper in scrapers:
+        frontier = crawl_state.Frontier(scraper.country)
+        frontier.reset()
+        frontier.close()
+        print(f'Forgot the crawl state of {scraper.country}')
+
+
+def run(scrapers: List[Scraper], headless=True):
+    """Imports and runs scrapers, one after the other."""
+    # The scrapers use paths relative to this folder, and import each other from it.
+    os.chdir(SCRAPERS_DIR)
+    if SCRAPERS_DIR not in sys.path:
+        sys.path.insert(0, SCRAPERS_DIR)
+    for scraper in scrapers:
+        print(f'Running {scraper.country}')
+        start = time.monotonic()
+        function = getattr(importlib.import_module(scraper.module), scraper.function)
+        kwargs = {'headless': headless} if 'headless' in scraper.arguments else {}
+        function(**kwargs)
+        print(f'Finished {scraper.country} in {time.monotonic() - start:.0f}s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scrapers for every country in the world\'s laws.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='list the scrapers')
+    commands.add_parser('status', help='show when each scraper last ran')
+    run_parser = commands.add_parser('run', help='run scrapers')
+    run_parser.add_argument('countries', nargs='+', metavar='country')
+    run_parser.add_argument('--show-browser', action='store_true', help='don\'t run browsers headless')
+    reset_parser = commands.add_parser('reset', help='forget where crawls stopped, to start them over')
+    reset_parser.add_argument('countries', nargs='+', metavar='country')
+    args = parser.parse_args(argv)
+
+    scrapers = discover()
+    if args.command == 'list':
+        list_scrapers(scrapers)
+    elif args.command == 'status':
+        status(scrapers)
+    else:
+        selected = []
+        for name in args.countries:
+            scraper = find(scrapers, name)
+            if scraper is None:
+                parser.error(f'unknown country: {name} (see the list command)')
+            selected.append(scraper)
+        if args.command == 'reset':
+            reset(selected)
+        else:
+            run(selected, headless=not args.show_browser)
+
+
+if __name__ == '__main__':
+    main()
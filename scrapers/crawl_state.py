@@ -0,0 +1,201 @@
+"""
+Durable crawl frontier: every url a scraper discovers, and how far it got with it.
+
+Without it, a crash loses everything but the files already on disk, and skipping them
+again needs each law page fetched and parsed first, just to work out its filename. The
+frontier is one SQLite database shared by all scrapers (data/crawl_state.sqlite), with
+a row per (country, url):
+
+    kind        what the url is to the scraper, e.g. 'list', 'act' or 'law'
+    status      'pending' until the scraper is done with it, 'failed' after an error
+    attempts    how many times the scraper got to the end of it, done or failed (a run
+                interrupted halfway through a url doesn't count against it)
+    sha256      the digest of the document it gave, from blob_store
+    data        what the scraper needs to carry on from it without fetching it again
+                (e.g. the next listing page), as json
+    metadata    its entry in the scraper's metadata.json, as json
+    error       the last error, if it failed
+    discovered, updated   timestamps
+
+So a scraper adds the urls it finds, works through the ones still pending (in the order
+they were found, in batches), and marks each one done as soon as it is. A run after a
+crash skips whatever is done before fetching anything, and still writes metadata.json
+with the entries of every run, from metadata(). Failed urls are retried on later runs,
+until they have failed MAX_ATTEMPTS times. The url of a row can be any key that is unique within a
+country, for pages that are reached by clicking rather than through a link.
+
+To crawl a site again from scratch, forget its state:
+    python cli.py reset india
+
+Usage:
+    frontier = crawl_state.Frontier('albania')
+    frontier.add(law_pages, 'law')
+    for batch in crawl_state.batches(frontier.pending('law')):
+        ...
+        frontier.done(url, sha256=digest, metadata=entry)
+"""
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Union
+
+from blob_store import Stored
+
+STATE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'crawl_state.sqlite')
+# Times a url can fail, over all runs, before the frontier stops handing it out.
+MAX_ATTEMPTS = 3
+# Urls worked through between two saves of the crawl state, in batches().
+BATCH_SIZE = 100
+# Seconds to wait for another scraper's write to finish.
+BUSY_TIMEOUT = 30
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS frontier (
+    country TEXT NOT NULL,
+    url TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    sha256 TEXT,
+    data TEXT,
+    metadata TEXT,
+    error TEXT,
+    discovered TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    PRIMARY KEY (country, url)
+);
+CREATE INDEX IF NOT EXISTS frontier_status ON frontier (country, kind, status);
+'''
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def batches(items: List, size: int = BATCH_SIZE) -> Iterable[List]:
+    """Yields items in lists of size, so that an interruption only loses the current one."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _dumps(value) -> Optional[str]:
+    return None if value is None else json.dumps(value, ensure_ascii=False)
+
+
+class Frontier:
+    """The crawl state of one country's scraper. Safe to share between threads."""
+
+    def __init__(self, country: str, path: str = STATE_PATH):
+        self.country = country
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                   isolation_level=None)
+        # WAL lets a scraper read while another one writes, and makes each commit cheap
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _write(self, sql: str, rows: List[tuple]):
+        with self._lock:
+            with self._db:
+                self._db.execute('BEGIN')
+                self._db.executemany(sql, rows)
+
+    def _read(self, sql: str, *args) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, (self.country,) + args).fetchall()
+
+    def add(self, urls: Iterable[str], kind: str = 'law'):
+        """Records newly discovered urls as pending. Urls already known are left as they are."""
+        now = _now()
+        self._write('INSERT OR IGNORE INTO frontier (country, url, kind, discovered, updated) '
+                    'VALUES (?, ?, ?, ?, ?)', [(self.country, url, kind, now, now) for url in urls])
+
+    def pending(self, kind: str = 'law') -> List[str]:
+        """Returns the urls of kind that aren't done yet (nor failed too often), oldest first."""
+        rows = self._read('SELECT url FROM frontier WHERE country = ? AND kind = ? '
+                          "AND status != 'done' AND attempts < ? ORDER BY rowid", kind, MAX_ATTEMPTS)
+        return [url for url, in rows]
+
+    def is_done(self, url: str) -> bool:
+        return bool(self._read("SELECT 1 FROM frontier WHERE country = ? AND url = ? AND status = 'done'", url))
+
+    def data(self, url: str) -> Optional[dict]:
+        """Returns the data saved when url was done (or failed), or None."""
+        rows = self._read('SELECT data FROM frontier WHERE country = ? AND url = ?', url)
+        return json.loads(rows[0][0]) if rows and rows[0][0] is not None else None
+
+    def latest(self, kind: str) -> Optional[str]:
+        """Returns the url of kind that was done last, or None."""
+        rows = self._read("SELECT url FROM frontier WHERE country = ? AND kind = ? AND status = 'done' "
+                          'ORDER BY updated DESC, rowid DESC LIMIT 1', kind)
+        return rows[0][0] if rows else None
+
+    def done(self, url: str, sha256: str = None, data: dict = None, metadata: dict = None, kind: str = 'law'):
+        """Marks url as done, with what it gave."""
+        now = _now()
+        self._write("INSERT INTO frontier (country, url, kind, status, attempts, sha256, data, metadata, discovered, updated) "
+                    "VALUES (?, ?, ?, 'done', 1, ?, ?, ?, ?, ?) ON CONFLICT (country, url) DO UPDATE SET "
+                    "status = 'done', attempts = attempts + 1, sha256 = excluded.sha256, data = excluded.data, "
+                    "metadata = excluded.metadata, error = NULL, updated = excluded.updated",
+                    [(self.country, url, kind, sha256, _dumps(data), _dumps(metadata), now, now)])
+
+    def failed(self, url: str, error: str, data: dict = None, kind: str = 'law'):
+        """Marks url as failed; it is tried again on the next runs, until it has failed MAX_ATTEMPTS times."""
+        now = _now()
+        self._write("INSERT INTO frontier (country, url, kind, status, attempts, data, error, discovered, updated) "
+                    "VALUES (?, ?, ?, 'failed', 1, ?, ?, ?, ?) ON CONFLICT (country, url) DO UPDATE SET "
+                    "status = 'failed', attempts = attempts + 1, data = COALESCE(excluded.data, data), "
+                    "error = excluded.error, updated = excluded.updated",
+                    [(self.country, url, kind, _dumps(data), error, now, now)])
+
+    def done_downloads(self, entries: Dict[str, Optional[dict]], sources: Dict[str, Union[str, List[str]]],
+                       stored: Dict[str, Optional[Stored]]):
+        """Marks the pages in entries, {url: metadata entry or None}, as done or failed once
+        their downloads are over.
+
+        sources maps each page that queued a download to the url of its document, or to
+        the list of urls of its documents when it has several, and stored is what
+        fetch_engine.download_all returned. Like blob_store.add_digests, the entries get
+        the final path and digest of their document, or a 'files' list with the link, path
+        and digest of each one; a page with a download that failed is marked failed, so
+        that it is fetched again on the next run.
+        """
+        for url, entry in entries.items():
+            source = sources.get(url)
+            links = source if isinstance(source, list) else [source]
+            missing = [link for link in links if link in stored and stored[link] is None]
+            if missing:
+                self.failed(url, f'could not download {", ".join(missing)}')
+                continue
+            if isinstance(source, list):
+                if entry is not None:
+                    entry['files'] = [{'link': link, 'download_path': stored[link].path,
+                                       'sha256': stored[link].sha256} for link in links if link in stored]
+                self.done(url, metadata=entry)
+                continue
+            result = stored.get(source)
+            if result is not None and entry is not None:
+                entry['download_path'] = result.path
+                entry['sha256'] = result.sha256
+            self.done(url, sha256=result.sha256 if result is not None else None, metadata=entry)
+
+    def metadata(self) -> List[dict]:
+        """Returns the metadata entries of every url done, over all runs, in the order they were found."""
+        rows = self._read("SELECT metadata FROM frontier WHERE country = ? AND status = 'done' "
+                          'AND metadata IS NOT NULL ORDER BY rowid')
+        return [json.loads(entry) for entry, in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Returns the number of urls by status."""
+        return dict(self._read('SELECT status, COUNT(*) FROM frontier WHERE country = ? GROUP BY status'))
+
+    def reset(self):
+        """Forgets everything about this country's crawl."""
+        self._write('DELETE FROM frontier WHERE country = ?', [(self.country,)])
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,126 @@
+"""
+Finds a chromedriver that works with the installed Chrome, without going online.
+
+Scrapers used to call ChromeDriverManager().install(), which checks versions over the
+network before anything starts (and fails on machines without internet access), or
+hard-coded ./chromedriver. Instead, ChromeBot asks this module, which looks for a
+driver in this order:
+  1. the CHROMEDRIVER_PATH environment variable;
+  2. the driver that worked last time, cached in data/chromedriver.json, as long as
+     the installed Chrome has the same major version;
+  3. ./chromedriver and chromedriver on the PATH, if their major version matches Chrome's;
+  4. webdriver_manager, which downloads a matching driver (the only online step).
+The answer is kept for the rest of the process, so only the first bot pays for it.
+
+Usage:
+    path = driver_resolver.driver_path()
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from typing import Optional
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'chromedriver.json')
+CHROME_BINARIES = ['google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser',
+                   '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome']
+DRIVER_CANDIDATES = ['./chromedriver', 'chromedriver']
+VERSION_PATTERN = re.compile(r'(\d+)\.\d+\.\d+(?:\.\d+)?')
+# Seconds to wait for a binary to print its version.
+VERSION_TIMEOUT = 10
+
+_resolved = None
+_lock = threading.Lock()
+
+
+def _version(binary: str) -> Optional[str]:
+    """Returns the version that binary --version prints, or None."""
+    try:
+        output = subprocess.run([binary, '--version'], capture_output=True, text=True,
+                                timeout=VERSION_TIMEOUT).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = VERSION_PATTERN.search(output)
+    return match.group(0) if match else None
+
+
+def _major(version: Optional[str]) -> Optional[str]:
+    return version.split('.')[0] if version else None
+
+
+def chrome_version() -> Optional[str]:
+    """Returns the version of the installed Chrome, or None if it can't be found."""
+    for binary in CHROME_BINARIES:
+        if shutil.which(binary) is not None or os.path.exists(binary):
+            version = _version(binary)
+            if version is not None:
+                return version
+    return None
+
+
+def _compatible(driver_version: Optional[str], chrome: Optional[str]) -> bool:
+    # Without a Chrome version to compare to, any working driver is our best guess.
+    return driver_version is not None and (chrome is None or _major(driver_version) == _major(chrome))
+
+
+def _load_cache() -> dict:
+    try:
+        with open(CACHE_PATH, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path: str, driver_version: Optional[str], chrome: Optional[str]):
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    with open(CACHE_PATH, 'w') as file:
+        json.dump({'driver_path': path, 'driver_version': driver_version, 'chrome_version': chrome}, file)
+
+
+def _download() -> Optional[str]:
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        return ChromeDriverManager().install()
+    except Exception as e:
+        print(f'Could not download a chromedriver: {e}')
+        return None
+
+
+def _resolve() -> Optional[str]:
+    if os.environ.get('CHROMEDRIVER_PATH'):
+        return os.environ['CHROMEDRIVER_PATH']
+
+    chrome = chrome_version()
+    cache = _load_cache()
+    path = cache.get('driver_path')
+    if path and os.path.exists(path) and _major(cache.get('chrome_version')) == _major(chrome):
+        return path
+
+    for candidate in DRIVER_CANDIDATES:
+        path = candidate if os.path.exists(candidate) else shutil.which(candidate)
+        if path is None:
+            continue
+        driver_version = _version(path)
+        if _compatible(driver_version, chrome):
+            path = os.path.abspath(path)
+            _save_cache(path, driver_version, chrome)
+            return path
+        print(f'{path} is chromedriver {driver_version}, which does not match Chrome {chrome}')
+
+    path = _download()
+    if path is not None:
+        _save_cache(path, _version(path), chrome)
+    return path
+
+
+def driver_path() -> Optional[str]:
+    """Returns the path of a chromedriver for the installed Chrome, or None to let
+    Selenium look for one itself."""
+    global _resolved
+    with _lock:
+        if _resolved is None:
+            _resolved = _resolve() or ''
+            print(f'Using chromedriver: {_resolved or "found by Selenium"}')
+    return _resolved or None
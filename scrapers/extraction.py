@@ -0,0 +1,130 @@
+"""
+Declarative extraction rules, compiled once and run over a parsed page.
+
+Scrapers used to find what they needed in a page by hand: loop over every <a> running
+a regex on its href, or, for sites with several page layouts, nest try/except around
+one XPath after another. Instead, a scraper now describes each field it wants with a rule:
+
+    'select'   an XPath, or a list of XPaths tried in order until one matches (fallbacks)
+    'value'    what to read from each element: 'text' (default) or '@<attribute>'
+    'match'    a regex the value has to contain for the element to count
+    'many'     return the values of all matching elements instead of the first one
+    'type'     'str' (default), 'text' (whitespace collapsed), 'int' or 'url' (made absolute)
+    'fields'   read these sub-rules from each matching element instead of a single value;
+               a sub-rule is a rule whose 'select' is relative (or left out for the element
+               itself), or just its 'value'
+    'default'  returned when nothing matches (None, or [] with many)
+
+Extractor compiles the XPaths and regexes of a set of rules once. Calling it on a
+parsed page evaluates every distinct XPath once, however many rules share it (e.g. all
+the rules filtering the page's links by href), and a rule without many stops at the
+first element that matches. A fallback only costs an XPath evaluation when the ones
+before it found nothing.
+
+Usage:
+    LAW_PAGE = extraction.Extractor({
+        'title': {'select': ["//div[@id='title']", '//h1'], 'type': 'text'},
+        'pdf': {'select': '//a[@href]', 'value': '@href', 'match': r'\\.pdf$', 'type': 'url'},
+    })
+    law = LAW_PAGE(parsing.parse(response.content), base_url=response.url)
+    print(law['title'], law['pdf'])
+"""
+from collections import namedtuple
+import re
+from typing import Dict, List, Optional, Union
+from urllib.parse import urljoin
+
+from lxml import etree
+
+import parsing
+
+TYPES = {
+    'str': lambda value, base_url: value,
+    'text': lambda value, base_url: ' '.join(value.split()),
+    'int': lambda value, base_url: int(value.strip()),
+    'url': lambda value, base_url: urljoin(base_url or '', value.strip()),
+}
+
+_Rule = namedtuple('_Rule', ['selectors', 'value', 'pattern', 'many', 'convert', 'fields', 'default'])
+
+
+def _compile(name: str, rule: Union[str, dict], relative=False) -> _Rule:
+    if isinstance(rule, str):
+        rule = {'value': rule}
+    unknown = set(rule) - {'select', 'value', 'match', 'many', 'type', 'fields', 'default'}
+    if unknown:
+        raise ValueError(f'Unknown keys in the rule for {name}: {sorted(unknown)}')
+    if 'select' not in rule and not relative:
+        raise ValueError(f'The rule for {name} has nothing to select')
+    select = rule.get('select', [])
+    selectors = tuple(parsing.xpath(expression) for expression in
+                      ([select] if isinstance(select, str) else select))
+    value = rule.get('value', 'text')
+    if value != 'text' and not value.startswith('@'):
+        raise ValueError(f"The value of {name} should be 'text' or '@<attribute>', not {value!r}")
+    if rule.get('type', 'str') not in TYPES:
+        raise ValueError(f"Unknown type for {name}: {rule['type']!r}")
+    fields = None
+    if 'fields' in rule:
+        fields = [(field, _compile(f'{name}.{field}', sub_rule, relative=True))
+                  for field, sub_rule in rule['fields'].items()]
+    pattern = re.compile(rule['match']) if 'match' in rule else None
+    many = rule.get('many', False)
+    default = rule.get('default', [] if many else None)
+    return _Rule(selectors, value, pattern, many, TYPES[rule.get('type', 'str')], fields, default)
+
+
+def _read(node, value: str) -> Optional[str]:
+    if isinstance(node, str):
+        # The XPath selected an attribute or a text node itself
+        return str(node)
+    if value == 'text':
+        return parsing.text(node)
+    return node.get(value[1:])
+
+
+def _apply(rule: _Rule, node, selected: dict, base_url: Optional[str]):
+    if not rule.selectors:
+        # A sub-rule without select reads the element it is applied to
+        candidates = [[node]]
+    else:
+        candidates = (_select(selector, node, selected) for selector in rule.selectors)
+    values = []
+    for elements in candidates:
+        for element in elements:
+            value = _read(element, rule.value)
+            if value is None or (rule.pattern is not None and rule.pattern.search(value) is None):
+                continue
+            if rule.fields is not None:
+                # Sub-rules select relative to this element, so they share nothing with the page
+                value = {field: _apply(sub_rule, element, {}, base_url) for field, sub_rule in rule.fields}
+            else:
+                value = rule.convert(value, base_url)
+            if not rule.many:
+                return value
+            values.append(value)
+        if values:
+            # Later selectors are only fallbacks for this one
+            break
+    if not values:
+        return list(rule.default) if isinstance(rule.default, list) else rule.default
+    return values
+
+
+def _select(selector: etree.XPath, node, selected: dict) -> List:
+    if selector not in selected:
+        selected[selector] = selector(node)
+    return selected[selector]
+
+
+class Extractor:
+    """A set of rules {field: rule}, compiled. Call it on a parsed page to get {field: value}."""
+
+    def __init__(self, rules: Dict[str, dict]):
+        self.rules = [(field, _compile(field, rule)) for field, rule in rules.items()]
+
+    def __call__(self, tree, base_url: Optional[str] = None) -> dict:
+        # Every XPath's result, so rules sharing a selector only evaluate it once
+        selected = {}
+        return {field: _apply(rule, tree, selected, base_url) for field, rule in self.rules}
+
@@ -0,0 +1,109 @@
+"""
+Asyncio engine for fetching many pages and files concurrently.
+
+The scrapers spend nearly all of their time waiting on round trips, so instead of
+calling requests.get one URL at a time they hand whole batches of URLs to this engine.
+Requests run on a thread pool over the shared http_client session, bounded by a global cap on requests in flight and a
+smaller cap per host so no single government site gets hammered.
+
+Results always come back in the same order as the input, so the scrapers can keep
+processing pages (and writing metadata) in their original order.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+import blob_store
+import http_cache
+import http_client
+import resumable
+import retry
+
+# At most this many requests in flight across all hosts.
+MAX_IN_FLIGHT = 32
+# At most this many requests in flight to any one host.
+MAX_PER_HOST = 8
+
+
+def get_with_retries(url: str, cache=False, **kwargs) -> Optional[requests.Response]:
+    """Gets a url with the shared retry policy. Returns None if every attempt failed.
+
+    With cache=True the page goes through the conditional-GET cache in http_cache.
+    """
+    get = http_cache.get if cache else http_client.get
+    try:
+        return retry.call(url, get, url, **kwargs)
+    except retry.RetryError as e:
+        print(e)
+        return None
+
+
+class FetchEngine:
+    """Runs blocking HTTP calls concurrently, bounded globally and per host."""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_per_host=MAX_PER_HOST):
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        # Semaphores belong to an event loop, so they are created fresh for every run.
+        self._global = None
+        self._hosts = {}
+        self._executor = None
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.max_per_host)
+        return self._hosts[host]
+
+    async def _run(self, url: str, func: Callable, *args, **kwargs):
+        """Calls func in a worker thread once both a global and a per-host slot for url are free."""
+        async with self._global, self._host_slot(url):
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _gather(self, jobs):
+        self._global = asyncio.Semaphore(self.max_in_flight)
+        self._hosts = {}
+        return await asyncio.gather(*(self._run(url, func, *args, **kwargs)
+                                      for url, func, args, kwargs in jobs))
+
+    def run_all(self, jobs: Iterable[Tuple[str, Callable, tuple, dict]]) -> list:
+        """Runs (url, func, args, kwargs) jobs concurrently and returns their results in order."""
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            self._executor = executor
+            try:
+                return asyncio.run(self._gather(jobs))
+            finally:
+                self._executor = None
+
+    def fetch_all(self, urls: Iterable[str], **kwargs) -> List[Optional[requests.Response]]:
+        """Gets every url concurrently. Failed requests come back as None."""
+        return self.run_all((url, get_with_retries, (url,), kwargs) for url in urls)
+
+    def download_all(self, downloads: Dict[str, str]) -> Dict[str, Optional[blob_store.Stored]]:
+        """Downloads every url in a {url: destination file} dict concurrently, resuming on failures.
+
+        Keying by url means a document linked from several laws is only downloaded once,
+        while two different documents whose titles give the same destination are both
+        downloaded: blob_store gives the second one its own name.
+        Returns {url: where it was stored and its digest, or None if it failed}.
+        """
+        results = self.run_all((url, resumable.download, (url, dest), {}) for url, dest in downloads.items())
+        return dict(zip(downloads, results))
+
+
+def fetch_all(urls: Iterable[str], **kwargs) -> List[Optional[requests.Response]]:
+    """Gets every url concurrently with the default engine."""
+    return FetchEngine().fetch_all(urls, **kwargs)
+
+
+def download_all(downloads: Dict[str, str]) -> Dict[str, Optional[blob_store.Stored]]:
+    """Downloads every url in a {url: destination file} dict concurrently with the default engine."""
+    return FetchEngine().download_all(downloads)
@@ -4,88 +4,24 @@ using a Selenium Chrome bot.
 """
 from datetime import date
 import json
-from os import path
 import re
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 import os
 
+from chrome_bot import ChromeBot
+import fetch_engine
+import resumable
+
 START_URL = 'https://www.legifrance.gouv.fr/'
 DOWNLOAD_PATH = '../data/france/pdf/'
 METADATA = []
 METADATA_PATH = '../data/france/metadata.json'
 COUNTRY = 'France'
 
-### Fake user agent to bypass anti-robot walls
-FAKE_USER_AGENT = 'Mozilla/5.0 (Windows NT 4.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36'
-
 ### REUSABLE CODE
 
-class ChromeBot:
-    def __init__(self, headless=False):
-        options = Options()
-        options.headless = headless
-        options.add_argument(f'user-agent={FAKE_USER_AGENT}')
-
-        # Add custom profile to disactivate PDF viewer
-        profile = {
-            "plugins.plugins_list": [{"enabled": False,
-                                         "name": "Chrome PDF Viewer"}],
-        }
-        options.add_experimental_option("prefs", profile)
-
-        self.driver = webdriver.Chrome(options=options)
-        print('Chrome bot initialized!')
-    
-    def navigate_to(self, url):
-        try:
-            self.driver.get(url)
-            print(f'Loaded page: {url}')
-        except:
-            print(f'Could not access this page: {url}')
-    
-    def find_xpath(self, xpath):
-        try:
-            return self.driver.find_elements_by_xpath(xpath)
-        except IndexError:
-            print('FAILED: Chrome bot could not find specified xpath.')
-    
-    def find_class(self, class_name):
-        try:
-            return self.driver.find_elements_by_class_name(class_name)
-        except IndexError:
-            print('FAILED: Chrome bot could not find elements of that class: {class_name}.')
-    
-    def find_id(self, id_name):
-        try:
-            return self.driver.find_elements_by_id(id_name)
-        except IndexError:
-            print('FAILED: Chrome bot could not find elements with that id: {id_name}.')
-    
-    def find_tag(self, tag_name):
-        try:
-            return self.driver.find_elements_by_tag_name(tag_name)
-        except IndexError:
-            print('FAILED: Chrome bot could not find elements with that tag name: {tag_name}.')
-            
-    def switch_to_tab(self, tab_id):
-        tab = self.driver.window_handles[tab_id]
-        self.driver.switch_to.window(tab)
-        
-    def wait_sec(self, time_sec):
-        self.driver.implicitly_wait(time_sec)
-
-
-def collect_response(url: str, trials=10, timeout=10):
-    for _ in range(trials):
-        try:
-            response = requests.get(url, timeout=timeout, stream=True)
-        except:
-            print('Page failed to load. Trying again...')
-            continue
-        break
-    return response
+def collect_response(url: str, timeout=10):
+    """Gets url with the shared retry policy. Returns None if the page could not be loaded."""
+    return fetch_engine.get_with_retries(url, timeout=timeout, stream=True)
 
 
 def filename_maker(law_name: str) -> str:
@@ -104,24 +40,25 @@ def create_pdf_destination_file(title):
         os.path.dirname(__file__), 
         generate_pdf_file_name(title)
     )
-    if path.exists(pdf_destination_file):
-        print(pdf_destination_file + " already downloaded")
-        return
+    # A file with this name may be another law with the same title: blob_store keeps both
     return pdf_destination_file
 
 
 def write_response(response, pdf_destination_file):
-    with open(pdf_destination_file, 'wb') as file:
-        for chunk in response.iter_content(1024 * 1024):
-            file.write(chunk)
-    print("Saved file as binary.")
+    """Streams the response to the file, resuming with Range requests if the stream breaks.
+    Returns where the file was stored and its digest, or None if it could not be saved."""
+    stored = resumable.download(response.url, pdf_destination_file, response=response)
+    if stored is not None:
+        print("Saved file as binary.")
+    return stored
 
 
-def append_to_metadata(law_name: str, pdf_link: str, filename: str):
+def append_to_metadata(law_name: str, pdf_link: str, filename: str, sha256: str = None):
     """Appends an item to the METADATA list."""
     METADATA.append({'title': law_name,
                      'link': pdf_link,
                      'download_path': filename,
+                     'sha256': sha256,
                      'download_date': date.today().strftime('%Y-%m-%d'),
                      'country': COUNTRY,})
     print('Added item to METADATA.')
@@ -142,56 +79,54 @@ def scrape_france_laws(headless=True):
     """Scrapes all French laws from legifrance.gouv.fr."""
     
     # Initialize Selenium Chrome bot and navigate to start url.
-    bot = ChromeBot(headless)
+    bot = ChromeBot(headless, lean=True, capture_mime_types=['application/pdf'], profile='france')
     bot.navigate_to(START_URL)
-    bot.wait_sec(5)
     
     # Navigate to "Codes" (=Laws) page. /!\ Sometimes it hits an anti-robot wall..
-    laws_list_link = bot.find_xpath(
+    laws_list_link = bot.wait_for_xpath(
         '//*[@id="main"]/div/div[2]/div/div/div[1]/div/ul/li[1]/p/span/a'
     )
-    if laws_list_link is None:
+    if not laws_list_link:
         return  # Stop if a problem occured
-    laws_list_link[0].click()
-    bot.wait_sec(2)
+    bot.click(laws_list_link[0])
     
     # Find references to download links for all laws on the page
-    all_download_links = bot.find_class('picto-download')
+    all_download_links = bot.wait_for_css('.picto-download')
     print(f'Laws to download on the page: {len(all_download_links)}\n')
     
     # Iterate over all download links; click on it, scrape the law, come back to previous page
     for k, link in enumerate(all_download_links):
-        link.click()
-        bot.wait_sec(2)
-        bot.switch_to_tab(1)
+        handles = bot.driver.window_handles
+        bot.clear_captured()
+        bot.click(link)
+        if not bot.wait_for_new_tab(handles):
+            print(f'Warning: Could not open law {k+1}')
+            continue
         
         # Scrape law title
-        law_title = bot.find_class('pdf-title')[0].text
+        law_title = bot.wait_for_css('.pdf-title')[0].text
         print(f'\nFound law ({k+1}/{len(all_download_links)}): ', law_title)
         
         # Create destination file from law title name
         pdf_destination_file = create_pdf_destination_file(law_title)
 
-        if pdf_destination_file is not None:  # Unless file was already downloaded      
-            # Get a link to the PDF from the hidden "object" element of the DOM
-            pdf_source_url = bot.find_tag('object')[0].get_attribute('data')
+        # Get a link to the PDF from the hidden "object" element of the DOM
+        pdf_source_url = bot.wait_for_attribute('object', 'data')
 
-            # Get HTML response (pdf content)
+        # Save the PDF the browser already loaded, or else download it ourselves
+        stored = bot.save_captured(pdf_destination_file)
+        if stored is None and pdf_source_url is not None:
             response = collect_response(pdf_source_url)
-
-            # Write response as binary file
-            write_response(response, pdf_destination_file)
-            bot.wait_sec(2)
-
+            stored = None if response is None else write_response(response, pdf_destination_file)
+        if stored is None:
+            print(f'Warning: Could not download this law: {law_title}')
+        else:
             # Add entry to metadata
-            append_to_metadata(law_title, pdf_source_url, pdf_destination_file)
-        
-        bot.wait_sec(2)
+            append_to_metadata(law_title, pdf_source_url, stored.path, stored.sha256)
 
         # Close active tab and move on
         bot.driver.close()
         bot.switch_to_tab(0)
-        bot.wait_sec(1)
     
     # Write all metadata to JSON
     write_metadata_json()
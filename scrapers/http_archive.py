@@ -0,0 +1,205 @@
+"""
+Records the scrapers' HTTP traffic to an archive on disk, and replays it offline.
+
+Every request the scrapers send goes through http_client's sessions, so the archive
+sits under them as a transport adapter and works for every scraper unchanged. It is
+switched on with environment variables:
+
+    HTTP_ARCHIVE_MODE     'record' to save every response, 'replay' to answer from the
+                          archive without touching the network (default: neither)
+    HTTP_ARCHIVE          the archive's directory (default: data/http_archive)
+    HTTP_REPLAY_LATENCY   seconds to wait before each replayed response, or 'recorded'
+                          to wait as long as the live response took (default: 0)
+
+The archive is an append-only index.jsonl, one line per response (method, url, status,
+headers, time taken and the SHA-256 of the body), and the bodies themselves, gzipped
+and stored once per digest under bodies/. Responses are looked up by method, url, body
+(for form posts) and Range header. A request sent several times is answered with its
+recorded responses in order, repeating the last one, so retries replay as they happened.
+A request that was never recorded gets a 404, and is counted in metrics.
+
+While recording, conditional headers are dropped so that every response has a full
+body: a 304 answered to this machine's http_cache would be useless to another one.
+Replayed requests aren't paced by the rate limiter, since no server is involved;
+HTTP_REPLAY_LATENCY stands in for the network instead. Pages that Chrome loads itself
+are not archived, only what the scrapers fetch over HTTP.
+
+Usage:
+    HTTP_ARCHIVE_MODE=record python cli.py run albania
+    HTTP_ARCHIVE_MODE=replay HTTP_REPLAY_LATENCY=recorded python cli.py run albania
+"""
+from collections import defaultdict
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+import metrics
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'http_archive')
+MODES = ('record', 'replay')
+# Request headers that select a different response, and so are part of the lookup key.
+KEY_HEADERS = ['Range']
+# Request headers dropped while recording, so that responses have full bodies.
+CONDITIONAL_HEADERS = ['If-None-Match', 'If-Modified-Since']
+# Response headers that describe the body as it was sent, not as it is stored.
+TRANSPORT_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+def mode() -> Optional[str]:
+    """Returns 'record' or 'replay' from HTTP_ARCHIVE_MODE, or None."""
+    value = os.environ.get('HTTP_ARCHIVE_MODE', '').strip().lower()
+    if value and value not in MODES:
+        raise ValueError(f'HTTP_ARCHIVE_MODE should be one of {MODES}, not {value!r}')
+    return value or None
+
+
+def _key(request: requests.PreparedRequest) -> str:
+    body = request.body or b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    parts = [request.method, request.url, hashlib.sha256(body).hexdigest()]
+    parts += [f'{name}: {request.headers[name]}' for name in KEY_HEADERS if name in request.headers]
+    return '\n'.join(parts)
+
+
+class Archive:
+    """An archive directory: index.jsonl and the gzipped bodies, by SHA-256."""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.entries: Dict[str, List[dict]] = defaultdict(list)
+        # How many times each key was replayed, to answer repeated requests in order
+        self.replayed: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        try:
+            with open(os.path.join(directory, 'index.jsonl'), 'r') as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['key']].append(entry)
+        except OSError:
+            pass
+
+    def _body_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'bodies', digest[:2], digest + '.gz')
+
+    def add(self, request: requests.PreparedRequest, response: requests.Response, elapsed: float):
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in TRANSPORT_HEADERS}
+        entry = {'key': _key(request), 'method': request.method, 'url': request.url,
+                 'status': response.status_code, 'reason': response.reason, 'headers': headers,
+                 'elapsed': round(elapsed, 3), 'sha256': digest}
+        path = self._body_path(digest)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with gzip.open(path + '.part', 'wb') as file:
+                    file.write(body)
+                os.replace(path + '.part', path)
+            with open(os.path.join(self.directory, 'index.jsonl'), 'a') as file:
+                file.write(json.dumps(entry) + '\n')
+            self.entries[entry['key']].append(entry)
+        metrics.increment('http_archive.recorded')
+
+    def find(self, request: requests.PreparedRequest) -> Optional[dict]:
+        """Returns the next recorded response to request, or None."""
+        key = _key(request)
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                return None
+            index = min(self.replayed[key], len(entries) - 1)
+            self.replayed[key] += 1
+        return entries[index]
+
+    def body(self, entry: dict) -> bytes:
+        with gzip.open(self._body_path(entry['sha256']), 'rb') as file:
+            return file.read()
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Wraps an adapter, saving every response it gets in the archive."""
+
+    def __init__(self, adapter: HTTPAdapter, archive: Archive):
+        super().__init__()
+        self.adapter = adapter
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        for name in CONDITIONAL_HEADERS:
+            request.headers.pop(name, None)
+        start = time.monotonic()
+        response = self.adapter.send(request, **kwargs)
+        # Reading the body here still lets callers stream it: requests then iterates over it in memory
+        response.content
+        self.archive.add(request, response, time.monotonic() - start)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Answers requests from the archive, after the simulated latency."""
+
+    def __init__(self, archive: Archive, latency: str = '0'):
+        super().__init__()
+        self.archive = archive
+        # None to wait as long as each response took when it was recorded
+        self.latency = None if latency == 'recorded' else float(latency)
+
+    def _delay(self, entry: dict) -> float:
+        return entry['elapsed'] if self.latency is None else self.latency
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        entry = self.archive.find(request)
+        if entry is None:
+            metrics.increment('http_archive.missing')
+            print(f'Not in the HTTP archive: {request.method} {request.url}')
+            raw = HTTPResponse(body=io.BytesIO(b''), status=404, reason='Not Archived', preload_content=False)
+        else:
+            metrics.increment('http_archive.replayed')
+            delay = self._delay(entry)
+            if delay > 0:
+                time.sleep(delay)
+            body = self.archive.body(entry)
+            headers = dict(entry['headers'], **{'Content-Length': str(len(body))})
+            raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=entry['status'],
+                               reason=entry['reason'], preload_content=False, decode_content=False)
+        return self.build_response(request, raw)
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> Archive:
+    """Returns the archive in HTTP_ARCHIVE, shared by every session of the process."""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = Archive(os.environ.get('HTTP_ARCHIVE') or ARCHIVE_DIR)
+            print(f'HTTP archive ({mode()}): {_archive.directory}')
+    return _archive
+
+
+def wrap(adapter: HTTPAdapter) -> HTTPAdapter:
+    """Returns the adapter a new session should mount: adapter itself, or the archive's."""
+    current = mode()
+    if current == 'record':
+        return RecordingAdapter(adapter, get_archive())
+    if current == 'replay':
+        adapter.close()
+        return ReplayAdapter(get_archive(), os.environ.get('HTTP_REPLAY_LATENCY', '0').strip() or '0')
+    return adapter
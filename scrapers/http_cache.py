@@ -0,0 +1,176 @@
+"""
+On-disk HTTP cache for listing and law pages, using conditional requests.
+
+When a page is first fetched, its body is stored along with its ETag and Last-Modified
+validators. On the next run, the request is sent with If-None-Match/If-Modified-Since,
+and if the server answers 304 Not Modified the stored body is served instead of being
+downloaded again. Pages without validators are never cached, since we would have no way
+of knowing whether they changed.
+
+The cache is capped in size; once it grows past MAX_SIZE bytes the least recently used
+entries are evicted.
+
+Usage:
+    import http_cache
+    response = http_cache.get(url)
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import http_client
+import metrics
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'http_cache')
+# Maximum size of the cached bodies, in bytes.
+MAX_SIZE = 2 * 1024 ** 3
+# When evicting, remove entries until the cache is at most this fraction of MAX_SIZE.
+EVICT_TO = 0.9
+# Response headers kept with each entry.
+STORED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified']
+
+
+class HttpCache:
+    """Conditional-GET cache stored as one .json (validators) and one .body file per url."""
+
+    def __init__(self, directory=CACHE_DIR, max_size=MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key[:2], key)
+        return base + '.json', base + '.body'
+
+    def _load(self, url: str) -> Optional[dict]:
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url or not os.path.exists(body_path):
+            return None
+        return entry
+
+    def _store(self, url: str, response: requests.Response):
+        """Saves the response in the cache. Failing to (disk full, permissions) only costs
+        the cache entry, never the response."""
+        meta_path, body_path = self._paths(url)
+        entry = {'url': url,
+                 'status': response.status_code,
+                 'encoding': response.encoding,
+                 'headers': {name: response.headers[name] for name in STORED_HEADERS
+                             if name in response.headers}}
+        # Write to temporary files first, so a crash never leaves a half-written entry.
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+            with open(body_path + suffix, 'wb') as file:
+                file.write(response.content)
+            with open(meta_path + suffix, 'w') as file:
+                json.dump(entry, file)
+            old_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            os.replace(body_path + suffix, body_path)
+            os.replace(meta_path + suffix, meta_path)
+        except OSError as e:
+            print(f'Could not cache {url}: {e}')
+            metrics.increment('http_cache.write_errors')
+            for partial in (body_path + suffix, meta_path + suffix):
+                try:
+                    os.remove(partial)
+                except OSError:
+                    pass
+            return
+        self._account(len(response.content) - old_size)
+
+    def _cached_response(self, entry: dict, response: requests.Response) -> requests.Response:
+        """Builds a response from a cache entry, for a request that got a 304."""
+        _, body_path = self._paths(entry['url'])
+        with open(body_path, 'rb') as file:
+            content = file.read()
+        # Mark the entry as recently used for eviction.
+        os.utime(body_path)
+        cached = requests.Response()
+        cached.status_code = entry['status']
+        cached.headers = CaseInsensitiveDict(entry['headers'])
+        cached.encoding = entry['encoding']
+        cached.url = response.url
+        cached.request = response.request
+        cached.reason = 'OK (cached)'
+        cached._content = content
+        cached.from_cache = True
+        return cached
+
+    def _account(self, added: int):
+        """Keeps track of the total cache size and evicts entries once it is over the limit."""
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._bodies())
+            else:
+                self._size += added
+            if self._size <= self.max_size:
+                return
+            # Least recently used first
+            for body_path, size, _ in sorted(self._bodies(), key=lambda body: body[2]):
+                if self._size <= self.max_size * EVICT_TO:
+                    break
+                for stale in (body_path, body_path[:-len('.body')] + '.json'):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                self._size -= size
+
+    def _bodies(self):
+        """Yields (path, size, last used time) for every cached body."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.body'):
+                    stat = os.stat(os.path.join(root, name))
+                    yield os.path.join(root, name), stat.st_size, stat.st_mtime
+
+    def get(self, url: str, headers=None, **kwargs) -> requests.Response:
+        """Gets url, sending the stored validators and serving the stored body on a 304.
+
+        The whole body is read into memory, so this is meant for pages, not streamed files.
+        """
+        headers = dict(headers or {})
+        entry = self._load(url)
+        if entry is not None:
+            if 'ETag' in entry['headers']:
+                headers['If-None-Match'] = entry['headers']['ETag']
+            if 'Last-Modified' in entry['headers']:
+                headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        response = http_client.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            return self._cached_response(entry, response)
+        if response.status_code == 200 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+            self._store(url, response)
+        return response
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> HttpCache:
+    """Returns the cache shared by every scraper in this process."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HttpCache()
+    return _cache
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """Gets url through the shared cache."""
+    return get_cache().get(url, **kwargs)
@@ -0,0 +1,199 @@
+"""
+Shared HTTP client for all scrapers.
+
+Every scraper used to call requests.get directly, which opens a new connection (and
+does a new TCP and TLS handshake) for every page. Instead, all requests go through
+one requests.Session per process, which keeps a pool of keep-alive connections per
+host and reuses them across pages, threads and scrapers. Every request is also paced
+by the per-host rate limiter in rate_limiter.
+
+Usage:
+    import http_client
+    response = http_client.get(url)
+
+The pool sizes, default timeout and default headers can be changed with configure().
+Sessions record or replay their traffic when HTTP_ARCHIVE_MODE is set (see http_archive).
+HTTP_HOST_MAP sends the requests for some hosts to another server, e.g. the mock sites:
+    HTTP_HOST_MAP='vbpl.vn=http://127.0.0.1:8800,www.gov.cn=http://127.0.0.1:8800'
+or '*=http://127.0.0.1:8800' for every host.
+"""
+import os
+import re
+import ssl
+import threading
+from typing import Dict, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import http_archive
+import rate_limiter
+
+# Default timeout in seconds (connect and read) for every request.
+TIMEOUT = 10
+# Number of hosts to keep a connection pool for.
+POOL_CONNECTIONS = 32
+# Number of keep-alive connections to keep open per host.
+POOL_MAXSIZE = 16
+# Some servers don't send their full certificate chain, so we provide the missing
+# intermediate certificates ourselves to avoid SSL errors.
+EXTRA_CERTIFICATES = [
+    os.path.join(os.path.dirname(__file__), 'italy_certificate.pem'),  # www.normattiva.it
+]
+HEADERS = {}
+TITLE_PATTERN = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+
+def _host_map(value: str) -> Dict[str, Tuple[str, str]]:
+    """Parses 'host=http://address:port,...' into {host: (scheme, address)}."""
+    host_map = {}
+    for pair in filter(None, (pair.strip() for pair in value.split(','))):
+        host, _, target = pair.partition('=')
+        target = urlsplit(target.strip() if '//' in target else '//' + target.strip())
+        if not host.strip() or not target.netloc:
+            raise ValueError(f'HTTP_HOST_MAP entries should look like host=http://address:port, not {pair!r}')
+        host_map[host.strip().lower()] = (target.scheme or 'http', target.netloc)
+    return host_map
+
+
+# Hosts whose requests go to another server instead, from HTTP_HOST_MAP ('*' for all hosts).
+HOST_MAP = _host_map(os.environ.get('HTTP_HOST_MAP', ''))
+
+_session = None
+_lock = threading.Lock()
+
+
+def _ssl_context() -> ssl.SSLContext:
+    """Creates one TLS context shared by all connections, trusting the extra certificates."""
+    context = ssl.create_default_context()
+    for certificate in EXTRA_CERTIFICATES:
+        if os.path.exists(certificate):
+            context.load_verify_locations(certificate)
+    return context
+
+
+class PooledAdapter(HTTPAdapter):
+    """Transport adapter that keeps keep-alive connection pools per host with a shared TLS context."""
+
+    def __init__(self, *args, **kwargs):
+        self._context = _ssl_context()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self._context
+        return super().init_poolmanager(*args, **kwargs)
+
+
+class RemappedAdapter(HTTPAdapter):
+    """Wraps an adapter, sending the requests for the hosts in host_map to their replacement.
+    The Host header and the response's url keep the original host, so scrapers don't notice."""
+
+    def __init__(self, adapter: HTTPAdapter, host_map: Dict[str, Tuple[str, str]]):
+        super().__init__()
+        self.adapter = adapter
+        self.host_map = host_map
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        target = self.host_map.get(url.hostname) or self.host_map.get('*')
+        if target is None:
+            return self.adapter.send(request, **kwargs)
+        original = request.url
+        request.headers['Host'] = url.netloc
+        request.url = urlunsplit((target[0], target[1]) + tuple(url[2:]))
+        response = self.adapter.send(request, **kwargs)
+        request.url = response.url = original
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class ScraperSession(requests.Session):
+    """Session that applies a default timeout, so no request can hang forever,
+    and paces every request through the per-host rate limiter (unless paced is False)."""
+
+    def __init__(self, timeout=TIMEOUT, paced=True):
+        super().__init__()
+        self.timeout = timeout
+        self.paced = paced
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if not self.paced:
+            return super().request(method, url, **kwargs)
+        rate_limiter.wait(url)
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.Timeout:
+            rate_limiter.report(url, timed_out=True)
+            raise
+        rate_limiter.report(url,
+                            status=response.status_code,
+                            latency=response.elapsed.total_seconds(),
+                            blocked=not kwargs.get('stream') and _looks_blocked(response),
+                            retry_after=response.headers.get('Retry-After'))
+        return response
+
+
+def _looks_blocked(response: requests.Response) -> bool:
+    """Returns true if an HTML response is an anti-robot page rather than the page we asked for."""
+    if 'html' not in response.headers.get('Content-Type', ''):
+        return False
+    title = TITLE_PATTERN.search(response.content[:4096])
+    return title is not None and rate_limiter.looks_blocked(title.group(1).decode('utf-8', 'replace'))
+
+
+def new_session(timeout=TIMEOUT, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                headers=None) -> ScraperSession:
+    """Creates a session with pooled keep-alive connections for http and https."""
+    # Replayed responses don't come from a server, so there is nothing to pace
+    session = ScraperSession(timeout, paced=http_archive.mode() != 'replay')
+    adapter = PooledAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    if HOST_MAP:
+        adapter = RemappedAdapter(adapter, HOST_MAP)
+    adapter = http_archive.wrap(adapter)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(HEADERS)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def get_session() -> ScraperSession:
+    """Returns the session shared by every scraper in this process."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = new_session(TIMEOUT, POOL_CONNECTIONS, POOL_MAXSIZE)
+    return _session
+
+
+def configure(timeout=None, pool_connections=None, pool_maxsize=None, headers=None):
+    """Changes the shared session's settings. Call before any requests are made."""
+    global _session, TIMEOUT, POOL_CONNECTIONS, POOL_MAXSIZE
+    if timeout is not None:
+        TIMEOUT = timeout
+    if pool_connections is not None:
+        POOL_CONNECTIONS = pool_connections
+    if pool_maxsize is not None:
+        POOL_MAXSIZE = pool_maxsize
+    if headers is not None:
+        HEADERS.update(headers)
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """Gets url through the shared session."""
+    return get_session().get(url, **kwargs)
+
+
+def post(url: str, data=None, **kwargs) -> requests.Response:
+    """Posts to url through the shared session."""
+    return get_session().post(url, data=data, **kwargs)
@@ -1,161 +1,171 @@
 """Download all laws from the Indian website."""
 from datetime import date
 import re
-import csv
 import json
 from pathlib import Path
-from os import path
 
-from bs4 import BeautifulSoup
-
-import requests
-from selenium import webdriver
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
+from browser_pool import BrowserPool, is_crash
+import crawl_state
+import extraction
+import fetch_engine
+import http_cache
+import parsing
 
 START_URL = 'https://www.indiacode.nic.in/handle/123456789/1362/browse?type=actno'
 BASE_URL = 'https://www.indiacode.nic.in/'
+# The crawl state's key for the walk through the list of acts, to tell an interrupted walk from a finished one
+LIST_WALK_URL = START_URL + '#walk'
 DOWNLOAD_PATH = '../data/india/pdf'
 
 ACT_PAGES = []
-PDF_PAGES = []
 
 METADATA = []
 METADATA_PATH = '../data/india/metadata.json'
 
+# A page of the list of acts: links to the acts, and to the next page
+LIST_PAGE = extraction.Extractor({
+    'acts': {'select': '//a[@href]', 'value': '@href', 'many': True,
+             'match': r'/handle/123456789/1362/browse\?type=actno&order=ASC&rpp=20&value=[0-9]+'},
+    'next_page': {'select': "(//a[@href][starts-with(concat(normalize-space(@class), ' '), 'pull-right ')])[last()]",
+                  'value': '@href', 'type': 'url', 'default': ''},
+})
+# Links from an act page to the pages of its pdfs
+PDF_PAGE_LINK = re.compile(r'https://www.indiacode.nic.in/handle/123456789/[0-9]+\?'
+                           'view_type=browse&sam_handle=123456789/1362')
+# The page of one pdf
+PDF_PAGE = extraction.Extractor({
+    'short_title': {'select': "//p[@id='short_title']", 'default': ''},
+    'pdf_link': {'select': '//a[@href]', 'value': '@href', 'match': '/bitstream/123456789/.*/.*/.*.pdf',
+                 'type': 'url', 'default': ''},
+})
+
 def collect_links_from_main_page(link_page):
     """Collects links from the main page."""
-    response = requests.get(link_page)
+    response = http_cache.get(link_page)
     print("Gathering links from page " + link_page)
-    html = BeautifulSoup(response.text, features="lxml")
-
-    next_page = ''
-    for link in html.find_all('a'):
-        if link.has_attr('href'):
-            act_search = re.search(
-                r'/handle/123456789/1362/browse\?type=actno&order=ASC&rpp=20&value=[0-9]+',
-                link['href'])
-            if act_search is not None:
-                ACT_PAGES.append(link['href'].replace('rpp=20','rpp=100'))
-                continue
-
-            # check if this is the link to the next page of results
-            if link.has_attr('class') and link['class'][0] == "pull-right":
-                next_page = BASE_URL + link['href']
-    return next_page
+    page = LIST_PAGE(parsing.parse(response.content), base_url=BASE_URL)
+    ACT_PAGES.extend(act.replace('rpp=20','rpp=100') for act in page['acts'])
+    return page['next_page']
 
 
-def collect_links_from_act_page(driver, act_page):
-    """Collects links on individual act pages."""
+def collect_links_from_act_page(bot, act_page):
+    """Collects links on individual act pages. Returns the links to pdf pages."""
     print("gathering pdf page links from act page " + act_page)
-    driver.get(act_page)
+    # Through the bot, so that its page count recycles it; a page that didn't load fails the act
+    if not bot.navigate_to(act_page):
+        raise RuntimeError(f'Could not load {act_page}')
 
-    atags = driver.find_elements_by_tag_name('a')
+    pdf_pages = []
+    # Read every href in one script call rather than one round trip per anchor
+    atags = bot.extract({'selector': 'a', 'fields': {'href': 'href'}})
     for atag in atags:
-        href = atag.get_attribute('href')
-        if href is None:
-            continue
-        href_search = re.search(
-            r'https://www.indiacode.nic.in/handle/123456789/[0-9]+\?'
-            'view_type=browse&sam_handle=123456789/1362', href)
-        if href_search is not None:
-            PDF_PAGES.append(href)
-
-
-def write_pdf(link, dest):
-    """Saves the pdf."""
-    if path.exists(dest):
-        print("already downloaded")
-        return
-
-    print("Saving pdf from ", link, " to ", dest)
-    success = False
-    for _ in range(1,10):
-        try:
-            request = requests.get(link, timeout=10, stream=True)
-            success = True
-        except Exception as e:
-            print(e)
+        href = atag['href']
+        if not href:
             continue
-        break
+        if PDF_PAGE_LINK.search(href) is not None:
+            pdf_pages.append(href)
+    return pdf_pages
 
-    if not success:
-        print("error getting pdf from link")
-        return
 
-    # Open the output file and make sure we write in binary mode
-    with open(dest, 'wb') as file_handle:
-        # Walk through the request response in chunks of 1024 * 1024 bytes, so 1MiB
-        for chunk in request.iter_content(1024 * 1024):
-            # Write the chunk to the file
-            file_handle.write(chunk)
+def write_pdf(link, dest, downloads):
+    """Queues the pdf in downloads, a {link: destination} dict. A file with the same name
+    doesn't mean it is saved already: blob_store tells different laws apart."""
+    downloads[link] = dest
 
 
-def download_pdf_from_page(pdf_page):
-    """Downloads the pdf from a page."""
-    response = requests.get(pdf_page)
+def download_pdf_from_page(pdf_page, response, downloads):
+    """Finds the pdf on a page and queues it for download. Returns its metadata entry."""
     print("gathering pdf from page " + pdf_page)
-    html = BeautifulSoup(response.text, features="lxml")
-
-    short_title = ''
-    for tag in html.find_all('p'):
-        if tag.has_attr('id'):
-            if tag['id'] == 'short_title':
-                short_title = tag.text.lower().replace(" ", "-").replace(",","")
-                break
-    download_dest = DOWNLOAD_PATH + '/' + short_title + ".pdf"
+    page = PDF_PAGE(parsing.parse(response.content), base_url=BASE_URL)
 
-    pdf_link = ''
-    for tag in html.find_all('a'):
-        if tag.has_attr('href'):
-            pdf_search = re.search('/bitstream/123456789/.*/.*/.*.pdf', tag['href'])
-            if pdf_search is not None:
-                pdf_link = BASE_URL + tag['href']
-                break
+    short_title = page['short_title'].lower().replace(" ", "-").replace(",","")
+    download_dest = DOWNLOAD_PATH + '/' + short_title + ".pdf"
+    pdf_link = page['pdf_link']
 
     if pdf_link == '' or short_title == '':
         print("Unable to find short title or pdf link, returning")
-    METADATA.append({'title': short_title, 'link': pdf_link, 'download_path': download_dest,
-                     'download_date':date.today().strftime('%Y-%m-%d'), 'country': 'India'})
-    write_pdf(pdf_link, download_dest)
-
-
-def scrape_intermediate_links_to_csv():
-    """Writes all links to follow to a csv file."""
+    entry = {'title': short_title, 'link': pdf_link, 'download_path': download_dest,
+             'download_date':date.today().strftime('%Y-%m-%d'), 'country': 'India'}
+    write_pdf(pdf_link, download_dest, downloads)
+    return entry
+
+
+def collect_act_pages(frontier):
+    """Walks the list of acts, adding the act pages to the frontier.
+
+    Every run walks the whole list again, so that new acts are found: the list pages go
+    through http_cache, so the ones that didn't change only cost a 304. Only the pages
+    that an interrupted walk got through aren't fetched again: the frontier has their next page.
+    """
+    walk = frontier.data(LIST_WALK_URL) or {'number': 0, 'finished': True}
+    if walk['finished']:
+        walk = {'number': walk['number'] + 1, 'finished': False}
+        frontier.done(LIST_WALK_URL, data=walk, kind='walk')
     link_page = START_URL
     while link_page != '':
-        link_page = collect_links_from_main_page(link_page)
-
-    options = Options()
-    options.headless = True
-    options.add_argument("--window-size=1920,1200")
-
-    driver = webdriver.Chrome(ChromeDriverManager().install(), options=options)
-    for act_page in ACT_PAGES:
-        collect_links_from_act_page(driver, BASE_URL + act_page)
-
-    with open('india_pdf_pages.csv', 'w', newline='') as csvfile:
-        spamwriter = csv.writer(csvfile, delimiter=' ',
-                            quotechar='|', quoting=csv.QUOTE_MINIMAL)
-        for pdf_page in PDF_PAGES:
-            spamwriter.writerow([pdf_page])
-
+        data = frontier.data(link_page)
+        if frontier.is_done(link_page) and data.get('walk') == walk['number']:
+            link_page = data['next_page']
+            continue
+        ACT_PAGES.clear()
+        next_page = collect_links_from_main_page(link_page)
+        frontier.add((BASE_URL + act_page for act_page in ACT_PAGES), 'act')
+        frontier.done(link_page, data={'next_page': next_page, 'walk': walk['number']}, kind='list')
+        link_page = next_page
+    frontier.done(LIST_WALK_URL, data=dict(walk, finished=True), kind='walk')
+
+
+def scrape_intermediate_links(frontier):
+    """Adds the links to every pdf page to the frontier."""
+    collect_act_pages(frontier)
+    act_pages = frontier.pending('act')
+    if not act_pages:
+        return
 
-def download_pdfs_from_links_in_csvfile():
-    """Reads the links from the csvfile and downloads all laws from those links."""
-    pdf_pages = []
-    with open('india_pdf_pages.csv', 'r', newline='') as csvfile:
-        spamreader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-        for row in spamreader:
-            pdf_pages.append(row[0])
+    # Only this step needs selenium, so it is only imported here.
+    from chrome_bot import ChromeBot
+    def new_bot():
+        return ChromeBot(headless=True, user_agent=None, pdf_viewer=True, window_size='1920,1200')
 
-    for pdf_page in pdf_pages:
-        download_pdf_from_page(pdf_page)
+    def visit(bot, act_page):
+        # Each act page is done as soon as its pdf pages are in the frontier
+        try:
+            pdf_pages = collect_links_from_act_page(bot, act_page)
+        except Exception as e:
+            # A crashed browser is restarted by the pool and the page tried again
+            if not is_crash(e):
+                frontier.failed(act_page, str(e), kind='act')
+            raise
+        frontier.add(pdf_pages, 'pdf_page')
+        frontier.done(act_page, kind='act')
+
+    # Act pages are independent, so visit them on a pool of browsers
+    pool = BrowserPool(new_bot)
+    pool.map(visit, act_pages)
+
+
+def download_pdfs_from_pdf_pages(frontier):
+    """Downloads the laws from the pdf pages in the frontier that aren't done yet."""
+    # Work in batches, so that an interruption only loses the current one.
+    for batch in crawl_state.batches(frontier.pending('pdf_page')):
+        # Fetch the batch's pdf pages concurrently, then parse them in order.
+        responses = fetch_engine.fetch_all(batch, cache=True)
+        downloads = {}
+        entries = {}
+        for pdf_page, response in zip(batch, responses):
+            if response is None:
+                frontier.failed(pdf_page, 'could not fetch the page')
+                continue
+            entries[pdf_page] = download_pdf_from_page(pdf_page, response, downloads)
+        # The link of each entry is its pdf
+        sources = {pdf_page: entry['link'] for pdf_page, entry in entries.items()}
+        frontier.done_downloads(entries, sources, fetch_engine.download_all(downloads))
 
 
-def write_metadata_json():
-    """Write out the metadata file."""
+def write_metadata_json(frontier):
+    """Write out the metadata file, with the laws of every run so far."""
     print('Writing scraper metadata json')
+    METADATA[:] = frontier.metadata()
     with open(METADATA_PATH, 'w') as jsonfile:
         json.dump(METADATA, jsonfile)
 
@@ -163,11 +173,11 @@ def write_metadata_json():
 def scrape_india_laws():
     """Scrapes all laws from the START_URL."""
     Path(DOWNLOAD_PATH).mkdir(parents=True, exist_ok=True)
-    # This step takes a long time. Prefer to run this first, then comment out
-    # this line and run the Download stage.
-    scrape_intermediate_links_to_csv()
-    download_pdfs_from_links_in_csvfile()
-    write_metadata_json()
+    # Both steps take a long time; after an interruption they carry on where they stopped.
+    frontier = crawl_state.Frontier('india')
+    scrape_intermediate_links(frontier)
+    download_pdfs_from_pdf_pages(frontier)
+    write_metadata_json(frontier)
 
 
 if __name__ == '__main__':
@@ -8,7 +8,10 @@ Summary of the scraping process:
 4. Write the text of the code to a txt file.
 
 The server likes to reject requests that don't look like a real browser, and requires an active session to load
-most pages, so we use Selenium for everything.
+most pages. In hybrid mode (the default), a browser only opens the session: its cookies and user agent are
+handed to an HTTP session, which fetches and parses steps 2-4 for all codes concurrently. That avoids pulling
+multi-megabyte texts through WebDriver. Codes for which the HTTP session stops working (it expired, or the
+server wants a real browser) are downloaded with Selenium as before.
 """
 
 from datetime import date, datetime
@@ -16,13 +19,21 @@ import json
 from pathlib import Path
 import re
 from typing import List, Optional, Tuple
+from urllib.parse import urljoin
 from bs4 import BeautifulSoup
+from lxml import html as lxml_html
+import requests
 
-from selenium import webdriver
 from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.webdriver import WebDriver
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.common.by import By
+
+import browser_pool
+from browser_pool import BrowserPool
+from chrome_bot import ChromeBot
+import fetch_engine
+import rate_limiter
+import retry
 
 DOWNLOAD_PATH = '../data/italy/txt'
 METADATA_PATH = '../data/italy/metadata.json'
@@ -36,64 +47,156 @@ CODES_LIST_URL = f'{BASE_URL}staticPage/codici'
 FAKE_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:94.0) Gecko/20100101 Firefox/94.0'
 DATE_FORMAT = '%Y-%m-%d'
 
+
+class SessionExpired(Exception):
+    """The HTTP session no longer gets the pages a browser would."""
+
 def collect_code_urls(driver: WebDriver) -> List[Tuple[str, str]]:
     """Returns a list of (code URL, name of code)"""
-    driver.get(CODES_LIST_URL)
+    rate_limiter.navigate(driver, CODES_LIST_URL)
     html = BeautifulSoup(driver.page_source, 'lxml')
     return list(map(lambda x: (x['href'], x.text.strip()), html.find_all('a', href=re.compile('uri-res'))))
 
-def download_code(driver: WebDriver, code: Tuple[str, str]) -> Optional[dict]:
+def code_url(code: Tuple[str, str]) -> str:
+    """Returns the full URL of a code's page."""
     url = code[0]
     # One link is a full URL, the rest are relative
     if not url.startswith('http'):
         url = BASE_URL + url
+    return url
+
+def download_code(driver: WebDriver, code: Tuple[str, str]) -> Optional[dict]:
+    url = code_url(code)
     metadata = {'title': code[1], 'link': url, 'download_date': date.today().strftime(DATE_FORMAT), 'country': 'Italy'}
     print(f'Downloading {code[1]}')
-    driver.get(url)
-    try:
-        last_updated = re.search("Ultimo aggiornamento all'atto pubblicato il (.*)\)", driver.page_source)
-        if last_updated is not None:
-            metadata['last_updated'] = datetime.strptime(last_updated.group(1), '%d/%m/%Y').strftime(DATE_FORMAT)
-        date_enacted = re.search(r':(\d{4}-\d{2}-\d{2});', driver.current_url)
-        if date_enacted is not None:
-            metadata['date_enacted'] = date_enacted.group(1)
-        else:
-            date_enacted = re.search('Entrata in vigore del provvedimento: (.*)\.', driver.page_source)
-            metadata['date_enacted'] = datetime.strptime(date_enacted.group(1), '%d/%m/%Y').strftime(DATE_FORMAT)
-    except (re.error, ValueError) as e:
-        print('Error parsing dates', e.msg)
+    rate_limiter.navigate(driver, url)
+    parse_dates(metadata, driver.page_source, driver.current_url)
     # Click on Complete Act, which takes us to a page where we can select which elements of the code to include.
     # It opens in a new tab, so we switch to that.
     try:
-        complete_act = driver.find_element_by_link_text('atto completo')
+        complete_act = driver.find_element(By.LINK_TEXT, 'atto completo')
     except NoSuchElementException as e:
         print(e.msg)
         print(f'No Complete Act button, failed to download {code[1]}')
         return None
-    complete_act.click()
+    rate_limiter.click(driver, complete_act)
     driver.switch_to.window(driver.window_handles[-1])
     # All elements of the code are already selected, so we click View to go to the full text.
-    view = driver.find_element_by_xpath('//input[@value="Visualizza"]')
-    view.click()
-    text = driver.find_element_by_class_name('wrapper_pre').text
+    view = driver.find_element(By.XPATH, '//input[@value="Visualizza"]')
+    rate_limiter.click(driver, view)
+    text = driver.find_element(By.CLASS_NAME, 'wrapper_pre').text
+    return write_code(metadata, code, text)
+
+def parse_dates(metadata: dict, page_source: str, current_url: str):
+    """Adds the last update and enactment dates from a code's page to its metadata."""
+    try:
+        last_updated = re.search("Ultimo aggiornamento all'atto pubblicato il (.*)\)", page_source)
+        if last_updated is not None:
+            metadata['last_updated'] = datetime.strptime(last_updated.group(1), '%d/%m/%Y').strftime(DATE_FORMAT)
+        date_enacted = re.search(r':(\d{4}-\d{2}-\d{2});', current_url)
+        if date_enacted is not None:
+            metadata['date_enacted'] = date_enacted.group(1)
+        else:
+            date_enacted = re.search('Entrata in vigore del provvedimento: (.*)\.', page_source)
+            metadata['date_enacted'] = datetime.strptime(date_enacted.group(1), '%d/%m/%Y').strftime(DATE_FORMAT)
+    except (re.error, ValueError, AttributeError) as e:
+        print('Error parsing dates', e)
+
+def write_code(metadata: dict, code: Tuple[str, str], text: str) -> dict:
     name = f'{code[1].replace(" ", "_")}.txt'
     metadata['download_path'] = f'txt/{name}'
     with open(f'{DOWNLOAD_PATH}/{name}', 'w') as file:
         file.write(text)
     return metadata
 
+### Hybrid mode: the same steps over the browser's HTTP session
+
+def fetch_page(session: requests.Session, method: str, url: str, **kwargs) -> Tuple[str, lxml_html.HtmlElement]:
+    """Returns the final url and parsed tree of a page, raising SessionExpired if the server turns us away."""
+    try:
+        response = retry.call(url, session.request, method, url, **kwargs)
+    except retry.RetryError as e:
+        raise SessionExpired(str(e))
+    if response.status_code in (401, 403):
+        raise SessionExpired(f'{url} returned status {response.status_code}')
+    # lxml can't parse an empty document, and a browser would have got a page
+    if not response.content.strip():
+        raise SessionExpired(f'{url} returned an empty page')
+    return response.url, lxml_html.fromstring(response.content)
+
+def form_data(form: lxml_html.FormElement, submit: lxml_html.InputElement) -> dict:
+    """Returns the fields a browser would send when submitting form with submit, leaving all options default."""
+    data = dict(form.form_values())
+    if submit.get('name'):
+        data[submit.get('name')] = submit.get('value', '')
+    return data
+
+def download_code_http(session: requests.Session, code: Tuple[str, str]) -> Optional[dict]:
+    """Downloads a code like download_code, but over session. Raises SessionExpired if the session stopped working."""
+    url = code_url(code)
+    metadata = {'title': code[1], 'link': url, 'download_date': date.today().strftime(DATE_FORMAT), 'country': 'Italy'}
+    print(f'Downloading {code[1]} over HTTP')
+    page_url, page = fetch_page(session, 'GET', url)
+    parse_dates(metadata, lxml_html.tostring(page, encoding='unicode'), page_url)
+    # Complete Act is a plain link (opening in a new tab in the browser).
+    complete_act = page.xpath('//a[normalize-space(text())="atto completo"]/@href')
+    if not complete_act:
+        raise SessionExpired(f'No Complete Act link for {code[1]}')
+    page_url, page = fetch_page(session, 'GET', urljoin(page_url, complete_act[0]))
+    # All elements of the code are already selected, so we submit the form with View.
+    view = page.xpath('//input[@value="Visualizza"]')
+    if not view or view[0].form is None:
+        raise SessionExpired(f'No View button for {code[1]}')
+    form = view[0].form
+    action = urljoin(page_url, form.get('action') or page_url)
+    method = (form.get('method') or 'GET').upper()
+    data = form_data(form, view[0])
+    if method == 'POST':
+        page_url, page = fetch_page(session, method, action, data=data)
+    else:
+        page_url, page = fetch_page(session, method, action, params=data)
+    text = page.xpath('//*[contains(concat(" ", normalize-space(@class), " "), " wrapper_pre ")]')
+    if not text:
+        raise SessionExpired(f'No text for {code[1]}')
+    return write_code(metadata, code, text[0].text_content())
+
+def try_download_code_http(session: requests.Session, code: Tuple[str, str]):
+    """Returns (metadata, False), or (None, True) if the code needs to be downloaded in a browser."""
+    try:
+        return download_code_http(session, code), False
+    except SessionExpired as e:
+        print(f'HTTP session failed for {code[1]}, falling back to the browser: {e}')
+        return None, True
+
 
-def scrape_italy_laws():
+def scrape_italy_laws(workers=browser_pool.WORKERS, hybrid=True):
     Path(DOWNLOAD_PATH).mkdir(parents=True, exist_ok=True)
 
-    options = Options()
-    options.headless = True
-    options.add_argument(f'user-agent={FAKE_USER_AGENT}')
-    driver = webdriver.Chrome(ChromeDriverManager().install(), options=options)
+    def new_bot() -> ChromeBot:
+        return ChromeBot(headless=True, user_agent=FAKE_USER_AGENT, pdf_viewer=True, profile='italy')
 
-    codes = collect_code_urls(driver)
+    bot = new_bot()
+    codes = collect_code_urls(bot.driver)
+    session = bot.export_session() if hybrid else None
+    bot.quit()
     print(f'Found {len(codes)} codes')
-    metadata = list(filter(None, map(lambda x: download_code(driver, x), codes)))
+
+    results = [None] * len(codes)
+    browser_codes = list(range(len(codes)))
+    if session is not None:
+        # Fetch every code over the browser's session, several at a time (and per host, by their full URL).
+        jobs = ((code_url(code), try_download_code_http, (session, code), {}) for code in codes)
+        outcomes = fetch_engine.FetchEngine().run_all(jobs)
+        results = [result for result, _ in outcomes]
+        browser_codes = [i for i, (_, needs_browser) in enumerate(outcomes) if needs_browser]
+
+    if browser_codes:
+        # Each code is downloaded in its own browser session, several at a time.
+        pool = BrowserPool(new_bot, workers)
+        fallback = pool.map(lambda bot, code: download_code(bot.driver, code), [codes[i] for i in browser_codes])
+        for i, result in zip(browser_codes, fallback):
+            results[i] = result
+    metadata = list(filter(None, results))
     print('Writing metadata')
     with open(METADATA_PATH, 'w') as jsonfile:
         json.dump(metadata, jsonfile)
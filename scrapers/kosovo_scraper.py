@@ -1,66 +1,187 @@
-"""Download all laws from the Kosovo website."""
+"""
+Download all laws from the Kosovo website.
+
+The site is an ASP.NET WebForms app: the pager and the language/main law buttons are
+postbacks of the page's form. By default we replay those postbacks over plain HTTP
+(copying __VIEWSTATE, __EVENTVALIDATION etc. from the hidden inputs), which is much
+faster than driving Chrome and lets us fetch many laws at once. The original Selenium
+crawl is kept as a fallback: scrape_kosovo_laws(browserless=False).
+"""
 from datetime import date
 import json
 from pathlib import Path
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
+import re
+import threading
+from typing import Optional, Tuple
+from urllib.parse import urljoin
+
+from lxml import html as lxml_html
+
+import browser_pool
+from browser_pool import BrowserPool
+import fetch_engine
+import http_client
+import rate_limiter
+import retry
 
 
 BASE_URL = 'https://gzk.rks-gov.net'
 START_URL = 'https://gzk.rks-gov.net/LawInForceList.aspx'
 
+ENGLISH_BUTTON_XPATH = '/html/body/form/div[3]/div[1]/div[1]/div[2]/div[2]/ul/li[2]/a'
+MAIN_LAW_BUTTON_XPATH = '/html/body/form/div[3]/div[1]/div[2]/div[2]/div[2]/div/div[1]/div/div/div[1]/a'
+ABOLISHED_XPATH = '//*[@id="MainContent_lblAct_Ne_Fuqi_Txt"]'
+LAW_TEXT_XPATH = '//*[@id="MainContent_txtDocument"]'
+# What get_links_and_next needs from every anchor, read in one script call
+ANCHORS_SPEC = {'selector': 'a', 'fields': {'href': 'href', 'class': 'class', 'id': 'id'}}
+# javascript:__doPostBack('target','argument') or WebForm_DoPostBackWithOptions(new WebForm_PostBackOptions("target", "argument", ...))
+POSTBACK_PATTERN = re.compile(r"__doPostBack\('([^']*)','([^']*)'\)"
+                              r'|WebForm_PostBackOptions\("([^"]*)",\s*"([^"]*)"')
+
 LINKS = []
 METADATA = []
 METADATA_PATH = '../data/kosovo/metadata.csv'
 DOWNLOAD_PATH = '../data/kosovo/txt/'
 
+def is_next_button(atag) -> bool:
+    return atag['class'] == 'Linkbutton' and 'Next' in (atag['id'] or '')
+
 def get_links_and_next(atags):
-    """Populates the list of LINKS to follow."""
+    """Populates the list of LINKS to follow from {'href', 'class', 'id'} anchors.
+    Returns the anchor of the Next button, if there is one."""
     for atag in atags:
-        link = atag.get_attribute('href')
-        if link is None:
+        link = atag['href']
+        if not link:
             continue
         if 'https' in link:
             LINKS.append(link)
-        class_attr = atag.get_attribute('class')
-        tag_id = atag.get_attribute('id')
-        if class_attr is not None and class_attr == 'Linkbutton' and 'Next' in tag_id:
+        if is_next_button(atag):
             return atag
     return None
 
+def open_list_page(bot, page):
+    """Opens page number page (counting from 0) of the list of laws in bot."""
+    rate_limiter.navigate(bot.driver, START_URL)
+    for _ in range(page):
+        next_button = next(filter(is_next_button, bot.extract(ANCHORS_SPEC)))
+        bot.click(bot.find_id(next_button['id'])[0])
+
 def get_law_text(driver, law_link):
-    """Get the text of a law."""
+    """Get the text of a law. Returns its metadata, or None if the law was not saved."""
+    # Like ChromeBot, selenium is only imported in browser mode
+    from selenium.webdriver.common.by import By
     print('Getting text for link: ' + law_link)
-    driver.get(law_link)
+    rate_limiter.navigate(driver, law_link)
 
     # Click button for english
-    driver.find_elements_by_xpath(
-        '/html/body/form/div[3]/div[1]/div[1]/div[2]/div[2]/ul/li[2]/a')[0].click()
+    rate_limiter.click(driver, driver.find_elements(By.XPATH, ENGLISH_BUTTON_XPATH)[0])
 
-    main_law_page_button = driver.find_elements_by_xpath(
-        '/html/body/form/div[3]/div[1]/div[2]/div[2]/div[2]/div/div[1]/div/div/div[1]/a')
+    main_law_page_button = driver.find_elements(By.XPATH, MAIN_LAW_BUTTON_XPATH)
 
     main_law_title = main_law_page_button[0].text
-    is_abolished = driver.find_elements_by_xpath('//*[@id="MainContent_lblAct_Ne_Fuqi_Txt"]')
+    is_abolished = driver.find_elements(By.XPATH, ABOLISHED_XPATH)
     if len(is_abolished) > 0 and 'ABOLISHED' in is_abolished[0].text:
         print('Law is abolished. Returning.')
-        return
+        return None
 
     # Open the page of the main law and grab the text
-    main_law_page_button[0].click()
-    law_text = driver.find_elements_by_xpath('//*[@id="MainContent_txtDocument"]')[0].text
+    rate_limiter.click(driver, main_law_page_button[0])
+    law_text = driver.find_elements(By.XPATH, LAW_TEXT_XPATH)[0].text
+    return save_law_text(law_link, main_law_title, law_text)
 
+def save_law_text(law_link, main_law_title, law_text):
+    """Write the text of a law to its file. Returns its metadata."""
     title = main_law_title.strip().replace(' ', '-').replace('/','-')[:249]
     filename = DOWNLOAD_PATH + title + '.txt'
-    METADATA.append({'title': main_law_title,
-                     'link': law_link,
-                     'download_path': filename,
-                     'download_date': date.today().strftime('%Y-%m-%d'),
-                     'country': 'Kosovo'})
     with open(filename, "a") as file_handle:
         file_handle.write(law_text)
         file_handle.close()
+    return {'title': main_law_title,
+            'link': law_link,
+            'download_path': filename,
+            'download_date': date.today().strftime('%Y-%m-%d'),
+            'country': 'Kosovo'}
+
+### Browserless mode: replay the ASP.NET postbacks over HTTP
+
+_sessions = threading.local()
+
+def http_session():
+    """Returns this thread's HTTP session. ASP.NET only handles one request at a time per
+    session, so every thread needs its own session (and cookies) to actually run in parallel."""
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = http_client.new_session()
+    return _sessions.session
+
+def load(session, url) -> Tuple[str, lxml_html.HtmlElement]:
+    """Get a page. Returns its final url and parsed tree."""
+    response = retry.call(url, session.get, url)
+    return response.url, lxml_html.fromstring(response.content)
+
+def postback(session, url, tree, target, argument=''):
+    """Submit the page's form as if the control called target had been clicked."""
+    form = tree.xpath('//form')[0]
+    # The hidden inputs carry __VIEWSTATE, __VIEWSTATEGENERATOR and __EVENTVALIDATION
+    fields = {field.get('name'): field.get('value', '')
+              for field in form.xpath('.//input[@type="hidden"]') if field.get('name')}
+    fields['__EVENTTARGET'] = target
+    fields['__EVENTARGUMENT'] = argument
+    action = urljoin(url, form.get('action') or url)
+    response = retry.call(action, session.post, action, data=fields)
+    return response.url, lxml_html.fromstring(response.content)
+
+def follow(session, url, tree, anchor):
+    """Follow a link (an lxml anchor or an anchor dict), which is either a postback or a plain link."""
+    href = anchor.get('href', '')
+    match = POSTBACK_PATTERN.search(href)
+    if match is None:
+        return load(session, urljoin(url, href))
+    target, argument = match.group(1, 2) if match.group(1) is not None else match.group(3, 4)
+    return postback(session, url, tree, target, argument)
+
+def anchors_http(url, tree):
+    """Returns the anchors of a parsed page as get_links_and_next wants them, with
+    links resolved like a browser does."""
+    anchors = []
+    for atag in tree.iter('a'):
+        link = atag.get('href')
+        if link is not None and not link.startswith('javascript:'):
+            link = urljoin(url, link)
+        anchors.append({'href': link, 'class': atag.get('class'), 'id': atag.get('id')})
+    return anchors
+
+def collect_links_http():
+    """Page through LawInForceList.aspx with postbacks, collecting all LINKS."""
+    session = http_session()
+    url, tree = load(session, START_URL)
+    res = get_links_and_next(anchors_http(url, tree))
+    while res is not None:
+        url, tree = follow(session, url, tree, res)
+        res = get_links_and_next(anchors_http(url, tree))
+
+def get_law_text_http(law_link) -> Optional[dict]:
+    """Get the text of a law over HTTP. Returns its metadata, or None if the law was not saved."""
+    print('Getting text for link: ' + law_link)
+    session = http_session()
+    try:
+        url, tree = load(session, law_link)
+        # Click button for english
+        url, tree = follow(session, url, tree, tree.xpath(ENGLISH_BUTTON_XPATH)[0])
+
+        main_law_page_button = tree.xpath(MAIN_LAW_BUTTON_XPATH)
+        main_law_title = main_law_page_button[0].text_content()
+        is_abolished = tree.xpath(ABOLISHED_XPATH)
+        if len(is_abolished) > 0 and 'ABOLISHED' in is_abolished[0].text_content():
+            print('Law is abolished. Returning.')
+            return None
+
+        # Open the page of the main law and grab the text
+        url, tree = follow(session, url, tree, main_law_page_button[0])
+        law_text = tree.xpath(LAW_TEXT_XPATH)[0].text_content()
+    except (IndexError, retry.RetryError) as e:
+        print(f'Could not get the law text from {law_link}: {e!r}')
+        return None
+    return save_law_text(law_link, main_law_title, law_text)
 
 def write_metadata_json():
     """Write the metadata file."""
@@ -68,34 +189,45 @@ def write_metadata_json():
     with open(METADATA_PATH, 'w') as file:
         json.dump(METADATA, file)
 
-def scrape_kosovo_laws():
+def scrape_kosovo_laws(workers=browser_pool.WORKERS, browserless=True):
     """Scrapes all laws from the Kosovo site."""
     Path(DOWNLOAD_PATH).mkdir(parents=True, exist_ok=True)
 
-    options = Options()
-    options.headless = True
-    options.add_argument("--window-size=1920,1200")
+    if browserless:
+        collect_links_http()
+        print('Finished getting links. Found ' + str(len(LINKS)))
+        results = fetch_engine.FetchEngine().run_all((link, get_law_text_http, (link,), {}) for link in LINKS)
+        METADATA.extend(filter(None, results))
+        write_metadata_json()
+        return
+
+    # Only the browser mode needs selenium, so it is only imported here.
+    from chrome_bot import ChromeBot
+    def new_bot():
+        return ChromeBot(headless=True, user_agent=None, pdf_viewer=True, window_size='1920,1200')
 
-    driver = webdriver.Chrome(ChromeDriverManager().install(), options=options)
-    driver.get(START_URL)
+    bot = new_bot()
+    page = 0
+    # A fresh browser pages through the list again to where the crawl was
+    bot.restore = lambda bot: open_list_page(bot, page)
+    open_list_page(bot, page)
 
-    atags = driver.find_elements_by_tag_name('a')
-    res = get_links_and_next(atags)
+    res = get_links_and_next(bot.extract(ANCHORS_SPEC))
     while res is not None:
-        res.click()
-        atags = driver.find_elements_by_tag_name('a')
-        res = get_links_and_next(atags)
+        page += 1
+        if not bot.recycle_if_needed():
+            bot.click(bot.find_id(res['id'])[0])
+        res = get_links_and_next(bot.extract(ANCHORS_SPEC))
 
     print('Finished getting links. Found ' + str(len(LINKS)))
+    bot.quit()
 
-    done = 1
-    for link in LINKS:
-        print('Processing link: ' + str(done) + '/' + str(len(LINKS)))
-        get_law_text(driver, link)
-        done += 1
+    # Every law page is independent, so get them on a pool of browsers
+    pool = BrowserPool(new_bot, workers)
+    results = pool.map(lambda bot, link: get_law_text(bot.driver, link), LINKS)
+    METADATA.extend(filter(None, results))
 
     write_metadata_json()
-    driver.quit()
 
 
 if __name__ == '__main__':
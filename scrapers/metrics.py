@@ -0,0 +1,63 @@
+"""
+Counters and timings collected while a scraper runs.
+
+Any module can count events (retries, cache hits, ...) or record durations (waits,
+downloads, ...). The totals are printed when the process exits, so every scraper run
+ends with a short summary of what happened.
+
+Usage:
+    metrics.increment('retries')
+    metrics.record('wait.element', seconds)
+"""
+import atexit
+from collections import Counter, defaultdict
+import threading
+
+COUNTERS = Counter()
+TIMINGS = defaultdict(list)
+
+_lock = threading.Lock()
+_registered = False
+
+
+def _register_summary():
+    global _registered
+    if not _registered:
+        _registered = True
+        atexit.register(print_summary)
+
+
+def increment(name: str, amount=1):
+    """Adds amount to the counter called name."""
+    with _lock:
+        COUNTERS[name] += amount
+        _register_summary()
+
+
+def record(name: str, seconds: float):
+    """Records one duration, in seconds, under name."""
+    with _lock:
+        TIMINGS[name].append(seconds)
+        _register_summary()
+
+
+def summary() -> dict:
+    """Returns the counters, and count/total/max of every timing."""
+    with _lock:
+        return {
+            'counters': dict(COUNTERS),
+            'timings': {name: {'count': len(values), 'total': sum(values), 'max': max(values)}
+                        for name, values in TIMINGS.items()},
+        }
+
+
+def print_summary():
+    """Prints all counters and timings."""
+    result = summary()
+    if not result['counters'] and not result['timings']:
+        return
+    print('\nMetrics:')
+    for name, value in sorted(result['counters'].items()):
+        print(f'  {name}: {value}')
+    for name, timing in sorted(result['timings'].items()):
+        print(f"  {name}: {timing['count']} in {timing['total']:.1f}s (max {timing['max']:.1f}s)")
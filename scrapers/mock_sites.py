@@ -0,0 +1,450 @@
+"""
+Local imitations of the government sites the scrapers crawl, for scale and load tests.
+
+One server answers for all of them, telling the sites apart by the Host header, with
+pages in the same structure as the real ones (only what the scrapers read):
+  - vbpl.vn: the 24 document types, paged ul.listLaw results, English and Vietnamese
+    document pages, and javascript attachment links;
+  - www.indiacode.nic.in: the paged browse-by-act-number list, act pages, pdf pages
+    with their short title, and the bitstream pdfs;
+  - euralius.eu: the category of all Albanian laws and each law's Download link;
+  - www.parliament.am: legislation.php's alphabetical list and law pages, half of
+    them with an English pdf under /law_docs/;
+  - www.gov.cn: the flfg index and law pages, a quarter of them with a pdf.
+The corpus has --laws laws per site, each generated from its number when it is asked
+for, so 10k or 1M laws cost no memory or setup; huge list pages are streamed out.
+Every pdf is different, so the blob store can't make a big crawl look small on disk.
+
+Faults can be injected into every response: --latency (plus up to --jitter) seconds of
+delay, --error-rate of 500/503 answers, and --throttle, a number of requests per second
+per site above which the server answers 429 with a Retry-After.
+
+/_mock/stats, on any host, returns what the server has seen as JSON: requests per
+site and per status, bytes sent, the most requests it had in flight at once, and
+the first urls it had no page for.
+
+Point the scrapers at it with http_client's HTTP_HOST_MAP. Browsers load pages
+themselves, so only what a scraper fetches over HTTP goes to the mock sites.
+
+Usage:
+    python mock_sites.py --laws 100000 --latency 0.05 --error-rate 0.01 --throttle 50
+    HTTP_HOST_MAP='*=http://127.0.0.1:8800' python cli.py run armenia
+    curl http://127.0.0.1:8800/_mock/stats
+"""
+import argparse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+PORT = 8800
+LAWS = 10000
+PDF_KB = 100
+# Paragraphs of text on a law page.
+PARAGRAPHS = 30
+# Results per page of the paged lists.
+VIETNAM_PAGE_SIZE = 20
+INDIA_PAGE_SIZE = 20
+VIETNAM_TYPES = 24
+# List entries written out at once when streaming a list page.
+STREAM_BATCH = 1000
+# Urls without a page that the stats keep.
+MAX_NOT_FOUND = 20
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-')
+
+# (status, content type, body chunks)
+Page = Tuple[int, str, Iterable[bytes]]
+
+
+class Faults:
+    """The latency, errors and throttling to inject, and their random source."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.random = random.Random(seed)
+        # Per site: (second, requests served in that second)
+        self.windows: Dict[str, Tuple[int, int]] = {}
+        self.lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self.lock:
+            return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def error(self) -> Optional[int]:
+        """Returns the status of an injected error, or None."""
+        with self.lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                return self.random.choice((500, 503))
+        return None
+
+    def throttled(self, site: str) -> bool:
+        """Counts a request to site; returns true if it is over the per-second limit."""
+        if not self.throttle:
+            return False
+        second = int(time.monotonic())
+        with self.lock:
+            window, count = self.windows.get(site, (second, 0))
+            if window != second:
+                window, count = second, 0
+            self.windows[site] = (window, count + 1)
+            return count >= self.throttle
+
+
+class Stats:
+    """What the server has answered so far."""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.bytes = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # The first urls asked for that no mock site has, to spot where they differ from the real ones
+        self.not_found = []
+        self.lock = threading.Lock()
+
+    def started(self, site: str):
+        with self.lock:
+            self.requests[site] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self, status: int, sent: int):
+        with self.lock:
+            self.in_flight -= 1
+            self.statuses[status] += 1
+            self.bytes += sent
+
+    def missing(self, url: str):
+        with self.lock:
+            if len(self.not_found) < MAX_NOT_FOUND:
+                self.not_found.append(url)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {'requests': dict(self.requests), 'statuses': {str(k): v for k, v in self.statuses.items()},
+                    'bytes': self.bytes, 'in_flight': self.in_flight, 'max_in_flight': self.max_in_flight,
+                    'not_found': list(self.not_found)}
+
+
+### The corpus: everything about a law is derived from its number
+
+WORDS = ['environmental', 'protection', 'water', 'forest', 'energy', 'climate', 'land', 'waste',
+         'air', 'emissions', 'biodiversity', 'fisheries', 'mining', 'transport', 'agriculture']
+CHINESE_WORDS = ['环境', '保护', '水', '森林', '能源', '气候', '土地', '废物', '大气', '排放']
+
+
+def subject(law: int, words=WORDS) -> str:
+    return f'{words[law % len(words)]} {words[law // len(words) % len(words)]}'
+
+
+def date(law: int) -> str:
+    return f'{law % 28 + 1:02d}/{law % 12 + 1:02d}/{1990 + law % 33}'
+
+
+def paragraphs(law: int, count: int) -> str:
+    return '\n'.join(f'<p>Article {article}. The competent authorities shall apply the rules on '
+                     f'{subject(law + article)} set out in law {law}.</p>' for article in range(1, count + 1))
+
+
+def pdf(site: str, law: int, kb: int) -> bytes:
+    """A pdf of about kb kilobytes, different for every law of every site."""
+    header = b'%%PDF-1.4\n%% %s law %d\n' % (site.encode('ascii'), law)
+    padding = (b'%% %d padding\n' % law) * (kb * 1024 // 16 + 1)
+    return header + padding[:max(0, kb * 1024 - len(header))] + b'\n%%EOF\n'
+
+
+def html(title: str, body: str) -> bytes:
+    return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>\n'
+            f'<body>\n{body}\n</body></html>\n').encode('utf-8')
+
+
+def streamed(title: str, head: str, entries: Iterator[str], tail: str) -> Iterator[bytes]:
+    """An html page whose list of entries is written out in batches, however long it is."""
+    yield f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>\n<body>\n{head}\n'.encode('utf-8')
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == STREAM_BATCH:
+            yield '\n'.join(batch).encode('utf-8') + b'\n'
+            batch = []
+    if batch:
+        yield '\n'.join(batch).encode('utf-8') + b'\n'
+    yield f'{tail}\n</body></html>\n'.encode('utf-8')
+
+
+def page(body: bytes, content_type='text/html; charset=utf-8') -> Page:
+    return 200, content_type, [body]
+
+
+class Sites:
+    """The mock sites' pages. Each site is a method taking (path, query) and returning a Page or None."""
+
+    def __init__(self, laws=LAWS, pdf_kb=PDF_KB, paragraphs=PARAGRAPHS):
+        self.laws = laws
+        self.pdf_kb = pdf_kb
+        self.paragraphs = paragraphs
+
+    def _law(self, value: str) -> Optional[int]:
+        law = int(value) if value.isdigit() else -1
+        return law if 0 <= law < self.laws else None
+
+    def _pdf(self, site: str, value: str) -> Optional[Page]:
+        law = self._law(value)
+        return None if law is None else page(pdf(site, law, self.pdf_kb), 'application/pdf')
+
+    def vietnam(self, path: str, query: Dict[str, str]) -> Optional[Page]:
+        if path == '/TW/Pages/vanbanTA.aspx':
+            doctype = int(query.get('idLoaiVanBan', '0') or 0)
+            number = int(query.get('Page', '1') or 1)
+            if not 1 <= doctype <= VIETNAM_TYPES:
+                return None
+            # Laws are dealt out to the types in turn
+            laws = range(doctype - 1, self.laws, VIETNAM_TYPES)
+            start = (number - 1) * VIETNAM_PAGE_SIZE
+            items = '\n'.join(f'''<li>
+  <p class="title"><a href="/TW/Pages/vbpqen-toanvan.aspx?ItemID={law}">Law {law} on {subject(law)}</a></p>
+  <div class="des"><p>Regulating {subject(law)}.</p></div>
+  <p class="green"><label>Published:</label> {date(law)}</p>
+  <p class="green"><label>Effective:</label> {date(law + 1)}</p>
+</li>''' for law in laws[start:start + VIETNAM_PAGE_SIZE])
+            return page(html(f'Type {doctype}', f'''<div class="tabs"><a class="selected" href="#"><span>Documents: Type {doctype}. {len(laws)} documents</span></a></div>
+<ul class="listLaw">
+{items}
+</ul>'''))
+        match = re.fullmatch(r'/TW/Pages/vbpq(en)?-toanvan\.aspx', path)
+        if match:
+            law = self._law(query.get('ItemID', ''))
+            if law is None:
+                return None
+            english = match.group(1) is not None
+            history = ('<li><a href="/TW/Pages/vbpq-toanvan.aspx?ItemID={0}"><b class="history">Vietnamese Documents</b></a></li>'
+                       .format(law) if english and law % 2 else '')
+            attachments = (f'''<div class="vbFile"><ul>
+  <li><a href="javascript:viewfile('iFrame')">Xem nhanh</a></li>
+  <li><a href="javascript:downloadfile('Law{law}.pdf','/TW/Lists/vbpq/Attachments/{law}/Law{law}.pdf')">Law{law}.pdf</a></li>
+</ul></div>''' if law % 3 == 0 else '')
+            return page(html(f'Law {law}', f'''<ul class="info"><li><span>Effective: </span>{'In force' if law % 5 else 'Expired'}</li>{history}</ul>
+{attachments}
+<div class="fulltext">
+{paragraphs(law, self.paragraphs)}
+</div>'''))
+        match = re.fullmatch(r'/TW/Lists/vbpq/Attachments/(\d+)/Law\d+\.pdf', path)
+        return self._pdf('vietnam', match.group(1)) if match else None
+
+    def india(self, path: str, query: Dict[str, str]) -> Optional[Page]:
+        if path == '/handle/123456789/1362/browse':
+            if 'value' in query:
+                # An act's page, which ChromeBot reads the pdf page links from
+                law = self._law(query['value'])
+                if law is None:
+                    return None
+                return page(html(f'Act {law}', f'<a href="https://www.indiacode.nic.in/handle/123456789/{100000 + law}'
+                                               f'?view_type=browse&sam_handle=123456789/1362">Act {law}</a>'))
+            offset = int(query.get('offset', '0') or 0)
+            rows = '\n'.join(f'<tr><td><a href="/handle/123456789/1362/browse?type=actno&order=ASC&rpp=20&value={law}">'
+                             f'Act {law}</a></td></tr>' for law in range(offset, min(offset + INDIA_PAGE_SIZE, self.laws)))
+            next_page = (f'<a class="pull-right" href="/handle/123456789/1362/browse?type=actno&offset={offset + INDIA_PAGE_SIZE}">next</a>'
+                         if offset + INDIA_PAGE_SIZE < self.laws else '')
+            return page(html('Browse by act number', f'<table>\n{rows}\n</table>\n{next_page}'))
+        match = re.fullmatch(r'/handle/123456789/(\d+)', path)
+        if match:
+            law = self._law(str(int(match.group(1)) - 100000))
+            if law is None:
+                return None
+            return page(html(f'Act {law}', f'''<p id="short_title">The {subject(law)} Act {law}</p>
+<a href="/bitstream/123456789/{100000 + law}/1/a{law}.pdf">Download</a>'''))
+        match = re.fullmatch(r'/bitstream/123456789/\d+/1/a(\d+)\.pdf', path)
+        return self._pdf('india', match.group(1)) if match else None
+
+    def albania(self, path: str, query: Dict[str, str]) -> Optional[Page]:
+        prefix = '/index.php/en/library/albanian-legislation'
+        if path == prefix + '/category/360-laws':
+            entries = (f'<li><a href="{prefix}/category/{1000 + law}-law-no-{law}">Law no. {law}</a></li>'
+                       for law in range(self.laws))
+            return 200, 'text/html; charset=utf-8', streamed('Laws', '<ul>', entries, '</ul>')
+        match = re.fullmatch(prefix + r'/category/\d+-law-no-(\d+)', path)
+        if match:
+            law = self._law(match.group(1))
+            if law is None:
+                return None
+            return page(html(f'Law no. {law}', f'''<h1>Law no. {law} on {subject(law)}</h1>
+<a href="{prefix}/download/{law}-law-no-{law}" title="Download">Law no {law} on {subject(law)}</a>'''))
+        match = re.fullmatch(prefix + r'/download/(\d+)-law-no-\d+', path)
+        return self._pdf('albania', match.group(1)) if match else None
+
+    def armenia(self, path: str, query: Dict[str, str]) -> Optional[Page]:
+        if path == '/legislation.php' and query.get('sel') == 'alpha':
+            entries = (f'<tr><td><a href="/legislation.php?sel=show&ID={law}&lang=eng">Law on {subject(law)}</a></td></tr>'
+                       for law in range(self.laws))
+            return 200, 'text/html; charset=utf-8', streamed('Legislation', '<table>', entries, '</table>')
+        if path == '/legislation.php' and query.get('sel') == 'show':
+            law = self._law(query.get('ID', ''))
+            if law is None:
+                return None
+            link = f'<a href="/law_docs/{law}eng.pdf">PDF</a>' if law % 2 else ''
+            return page(html(f'Law {law}', f'''<h3>LAW {law} ON {subject(law).upper()}</h3>
+<h3>Chapter 1. General provisions</h3>
+{link}
+{paragraphs(law, self.paragraphs)}'''))
+        match = re.fullmatch(r'/law_docs/(\d+)eng\.pdf', path)
+        return self._pdf('armenia', match.group(1)) if match else None
+
+    def china(self, path: str, query: Dict[str, str]) -> Optional[Page]:
+        if path == '/flfg/index.htm':
+            entries = (f'<li><a href="/flfg/{1990 + law % 33}-{law % 12 + 1:02d}/{law % 28 + 1:02d}/content_{law}.htm">'
+                       f'法律 {law} {subject(law, CHINESE_WORDS)}</a></li>' for law in range(self.laws))
+            return 200, 'text/html; charset=utf-8', streamed('法律法规', '<ul>', entries, '</ul>')
+        match = re.fullmatch(r'/flfg/\d+-\d+/\d+/content_(\d+)\.htm', path)
+        if match:
+            law = self._law(match.group(1))
+            if law is None:
+                return None
+            link = (f'<a href="/flfg/files/{law}.pdf" title="http://www.gov.cn/flfg/files/{law}.pdf">附件 {law}</a>'
+                    if law % 4 == 0 else '')
+            return page(html(f'法律 {law}', f'{link}\n{paragraphs(law, self.paragraphs)}'))
+        match = re.fullmatch(r'/flfg/files/(\d+)\.pdf', path)
+        return self._pdf('china', match.group(1)) if match else None
+
+    def route(self, host: str) -> Optional[Callable[[str, Dict[str, str]], Optional[Page]]]:
+        return {
+            'vbpl.vn': self.vietnam,
+            'www.indiacode.nic.in': self.india,
+            'indiacode.nic.in': self.india,
+            'euralius.eu': self.albania,
+            'www.parliament.am': self.armenia,
+            'parliament.am': self.armenia,
+            'www.gov.cn': self.china,
+        }.get(host)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers for every mock site. The server has sites, faults and stats attributes."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # One line per request would swamp the terminal during a load test
+        pass
+
+    def _send(self, status: int, content_type: str, chunks: Iterable[bytes], headers=None) -> int:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if isinstance(chunks, list):
+            body = b''.join(chunks)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return len(body)
+        # Streamed pages don't know their length in advance
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        sent = 0
+        for chunk in chunks:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            sent += len(chunk)
+        self.wfile.write(b'0\r\n\r\n')
+        return sent
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        host = (self.headers.get('Host') or '').split(':')[0].lower()
+        server = self.server
+        if url.path == '/_mock/stats':
+            self._send(200, 'application/json', [json.dumps(server.stats.as_dict()).encode('utf-8')])
+            return
+        site = server.sites.route(host)
+        server.stats.started(host)
+        status, sent = 500, 0
+        try:
+            if site is None:
+                server.stats.missing(f'http://{host}{self.path}')
+                status, sent = 404, self._send(404, 'text/plain', [f'No mock site for {host}\n'.encode('utf-8')])
+                return
+            if server.faults.throttled(host):
+                status, sent = 429, self._send(429, 'text/plain', [b'Too many requests\n'], {'Retry-After': '1'})
+                return
+            time.sleep(server.faults.delay())
+            error = server.faults.error()
+            if error is not None:
+                status, sent = error, self._send(error, 'text/plain', [b'Injected error\n'])
+                return
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+            result = site(url.path, query)
+            if result is None:
+                server.stats.missing(f'http://{host}{self.path}')
+                result = 404, 'text/plain', [b'Not found\n']
+            status, content_type, chunks = result
+            match = RANGE_PATTERN.fullmatch(self.headers.get('Range', ''))
+            if status == 200 and match and isinstance(chunks, list):
+                # Resumed downloads ask for the rest of the file
+                body = b''.join(chunks)
+                start = min(int(match.group(1)), len(body))
+                status, sent = 206, self._send(206, content_type, [body[start:]],
+                                               {'Content-Range': f'bytes {start}-{len(body) - 1}/{len(body)}'})
+                return
+            sent = self._send(status, content_type, chunks)
+        finally:
+            server.stats.finished(status, sent)
+
+    # The sites' forms are read-only searches, so a POST gets the same page
+    def do_POST(self):
+        # The sites answer form posts like the page itself, but the form body has to be read
+        # off the connection first, or the next keep-alive request would start inside it
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.do_GET()
+
+
+def serve(port=PORT, sites: Optional[Sites] = None, faults: Optional[Faults] = None,
+          host='127.0.0.1') -> ThreadingHTTPServer:
+    """Starts the mock sites in a background thread. Returns the server, to shutdown() it."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.sites = sites or Sites()
+    server.faults = faults or Faults()
+    server.stats = Stats()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mock government sites for scale and load tests.')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--bind', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--laws', type=int, default=LAWS, help='laws per site')
+    parser.add_argument('--pdf-kb', type=int, default=PDF_KB, help='size of every pdf')
+    parser.add_argument('--paragraphs', type=int, default=PARAGRAPHS, help='paragraphs on a law page')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 500/503 responses')
+    parser.add_argument('--throttle', type=float, default=0.0, help='requests per second per site before 429s')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = serve(args.port, Sites(args.laws, args.pdf_kb, args.paragraphs),
+                   Faults(args.latency, args.jitter, args.error_rate, args.throttle, args.seed), args.bind)
+    print(f'Mock sites with {args.laws} laws each on http://{args.bind}:{args.port}')
+    print(f"Run scrapers with HTTP_HOST_MAP='*=http://{args.bind}:{args.port}'")
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(server.stats.as_dict()))
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(server.stats.as_dict()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+HTML parsing on lxml.
+
+BeautifulSoup with html.parser builds a tree of Python objects for every page, which
+made parsing the scrapers' main CPU cost once pages were fetched concurrently. lxml
+parses in C, and XPath expressions compiled once at import are evaluated in C too.
+For pages where only a few tags matter, iter_tags() parses incrementally and hands
+those tags over one by one (like a SoupStrainer), without keeping the whole tree.
+
+Usage:
+    TITLES = parsing.xpath(f"//p[{parsing.has_class('title')}]//a")
+    tree = parsing.parse(response.text)
+    for title in TITLES(tree):
+        print(parsing.text(title), title.get('href'))
+"""
+import functools
+import io
+from typing import Iterator, Optional, Union
+
+from lxml import etree, html
+
+# Text the way BeautifulSoup's get_text() returns it: every text node, but not scripts and styles.
+_TEXT = etree.XPath('descendant-or-self::text()[not(ancestor::script) and not(ancestor::style)]')
+
+
+def parse(markup: Union[str, bytes], encoding: Optional[str] = None) -> html.HtmlElement:
+    """Parses a page. Bytes are decoded with encoding, or whatever the page declares."""
+    if isinstance(markup, str):
+        # lxml refuses str input with an encoding declaration, so hand it the bytes.
+        markup, encoding = markup.encode('utf-8'), 'utf-8'
+    parser = html.HTMLParser(encoding=encoding) if encoding else None
+    return html.fromstring(markup, parser=parser)
+
+
+@functools.lru_cache(maxsize=None)
+def xpath(expression: str) -> etree.XPath:
+    """Returns expression compiled, to be called on a tree or element."""
+    return etree.XPath(expression)
+
+
+def has_class(name: str) -> str:
+    """XPath condition for an element with the CSS class name, like the CSS selector .name."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def text(element) -> str:
+    """Returns all the text in element, like BeautifulSoup's get_text()."""
+    return ''.join(_TEXT(element))
+
+
+def iter_tags(markup: Union[str, bytes], *tags: str, encoding: Optional[str] = None) -> Iterator[etree._Element]:
+    """Yields the tags named tags as the page is parsed, without building the rest of the tree.
+
+    Each element is complete when yielded, and cleared once the caller moves on.
+    """
+    if isinstance(markup, str):
+        markup, encoding = markup.encode('utf-8'), 'utf-8'
+    for _, element in etree.iterparse(io.BytesIO(markup), events=('end',), tag=tags or None,
+                                      html=True, encoding=encoding, recover=True):
+        yield element
+        element.clear(keep_tail=True)
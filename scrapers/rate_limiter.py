@@ -0,0 +1,159 @@
+"""
+Per-host adaptive rate limiter shared by HTTP requests and browser navigation.
+
+Each host gets a token bucket. Every request or page navigation takes a token first,
+so requests to a host are spread out at that host's current rate. The rate adapts:
+  - while responses come back quickly, it slowly increases (up to MAX_RATE);
+  - on 429/503, timeouts or anti-robot pages, it is cut sharply and the host is
+    paused (for Retry-After seconds if the server sent one).
+This finds roughly the highest rate each site tolerates without getting us banned.
+
+Usage:
+    rate_limiter.wait(url)             # before a request
+    rate_limiter.report(url, ...)      # after it, with what happened
+or, for Selenium:
+    rate_limiter.navigate(driver, url)
+    rate_limiter.click(driver, element)
+"""
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+# Requests per second a host starts at, unless listed in HOST_RATES.
+DEFAULT_RATE = 2.0
+# Starting rates for sites known to throttle or block fast clients.
+HOST_RATES = {
+    'www.legifrance.gouv.fr': 0.5,
+    'www.normattiva.it': 0.5,
+    'gzk.rks-gov.net': 1.0,
+    'www.fedlex.admin.ch': 1.0,
+}
+MIN_RATE = 0.05
+MAX_RATE = 20.0
+# Number of requests that can be sent at once after a host has been idle.
+BURST = 4
+# Responses faster than this (in seconds) count as healthy and raise the rate.
+HEALTHY_LATENCY = 2.0
+# Healthy responses raise the rate by this much; throttling multiplies it by BACKOFF.
+INCREASE = 0.1
+BACKOFF = 0.5
+# Seconds to pause a host after it throttles us, if it did not send Retry-After.
+PENALTY = 30.0
+THROTTLE_STATUSES = (429, 503)
+# Text found in the title of pages that block robots.
+BLOCKED_MARKERS = ('captcha', 'access denied', 'request unsuccessful', 'are you a robot',
+                   'too many requests')
+
+
+class TokenBucket:
+    """Token bucket whose refill rate is adjusted from feedback about the host."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(delay)
+
+    def succeeded(self, latency: float):
+        with self._lock:
+            if latency < HEALTHY_LATENCY:
+                self.rate = min(MAX_RATE, self.rate + INCREASE)
+
+    def throttled(self, pause: Optional[float] = None):
+        with self._lock:
+            self.rate = max(MIN_RATE, self.rate * BACKOFF)
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, time.monotonic() + (pause or PENALTY))
+
+
+class RateLimiter:
+    """Keeps one TokenBucket per host."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(HOST_RATES.get(host, DEFAULT_RATE))
+            return self._buckets[host]
+
+    def wait(self, url: str):
+        self.bucket(url).acquire()
+
+    def report(self, url: str, status: Optional[int] = None, latency: float = 0.0,
+               timed_out=False, blocked=False, retry_after: Optional[str] = None):
+        """Adjusts the host's rate from the outcome of a request."""
+        bucket = self.bucket(url)
+        if timed_out or blocked or status in THROTTLE_STATUSES:
+            print(f'Slowing down requests to {urlparse(url).netloc}')
+            bucket.throttled(parse_retry_after(retry_after))
+        elif status is None or status < 400:
+            bucket.succeeded(latency)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Returns the number of seconds in a Retry-After header, if it has one."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def looks_blocked(text: str) -> bool:
+    """Returns true if a page title or snippet looks like an anti-robot wall."""
+    text = (text or '').lower()
+    return any(marker in text for marker in BLOCKED_MARKERS)
+
+
+LIMITER = RateLimiter()
+
+
+def wait(url: str):
+    """Blocks until a request to url's host is allowed."""
+    LIMITER.wait(url)
+
+
+def report(url: str, **kwargs):
+    """Reports the outcome of a request to url's host. See RateLimiter.report."""
+    LIMITER.report(url, **kwargs)
+
+
+def navigate(driver, url: str):
+    """Loads url in a Selenium driver, paced by the rate limiter."""
+    wait(url)
+    start = time.monotonic()
+    try:
+        driver.get(url)
+    except Exception as e:
+        if 'timeout' in type(e).__name__.lower():
+            report(url, timed_out=True)
+        raise
+    report(url, latency=time.monotonic() - start, blocked=looks_blocked(driver.title))
+
+
+def click(driver, element):
+    """Clicks an element that causes a navigation, paced by the rate limiter of the current host."""
+    url = driver.current_url
+    wait(url)
+    start = time.monotonic()
+    element.click()
+    report(url, latency=time.monotonic() - start, blocked=looks_blocked(driver.title))
@@ -0,0 +1,143 @@
+"""
+Resumable file downloads.
+
+Files are streamed into a '<destination>.<url digest>.part' file, which only shows up at
+the destination once it is complete. That way a crash or a dropped connection never
+leaves a truncated file behind for the path.exists checks to mistake for a finished
+download. If the stream breaks, the download resumes from the bytes already on disk
+with an HTTP Range request, both within a run and on the next run. An If-Range
+validator makes sure a file that changed on the server is started over instead.
+
+The SHA-256 of the file is computed while it streams in, and the finished file goes
+into the content-addressed blob_store, linked at the destination.
+
+Usage:
+    stored = resumable.download(url, destination)
+    stored.path, stored.sha256
+"""
+import hashlib
+import json
+import os
+from typing import Optional
+
+import requests
+
+import blob_store
+import http_client
+import metrics
+import retry
+
+CHUNK_SIZE = 1024 * 1024
+PART_SUFFIX = '.part'
+# Hex digits of the url's digest in a partial file's name, so that two documents headed
+# for the same destination don't write into the same partial file.
+URL_DIGEST_LENGTH = 12
+# Number of times a broken download is resumed before giving up.
+ATTEMPTS = 5
+
+
+def _load_validator(part: str) -> Optional[str]:
+    try:
+        with open(part + '.json', 'r') as file:
+            return json.load(file).get('validator')
+    except (OSError, ValueError):
+        return None
+
+
+def _save_validator(part: str, response: requests.Response):
+    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+    if validator is not None:
+        with open(part + '.json', 'w') as file:
+            json.dump({'url': response.url, 'validator': validator}, file)
+
+
+def _expected_size(response: requests.Response, offset: int) -> Optional[int]:
+    """Returns the full size of the file, if the response tells us."""
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length')
+    if length is not None and length.isdigit() and 'Content-Encoding' not in response.headers:
+        return offset + int(length)
+    return None
+
+
+def _request(url: str, offset: int, part: str) -> requests.Response:
+    # Ask for the raw bytes, so byte offsets and Content-Length refer to the file itself.
+    headers = {'Accept-Encoding': 'identity'}
+    if offset > 0:
+        headers['Range'] = f'bytes={offset}-'
+        validator = _load_validator(part)
+        if validator is not None:
+            headers['If-Range'] = validator
+    return retry.call(url, http_client.get, url, stream=True, headers=headers)
+
+
+def _hash_existing(part: str):
+    """Starts a SHA-256 over the bytes already in a partial download."""
+    hasher = hashlib.sha256()
+    with open(part, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def download(url: str, dest: str, response: Optional[requests.Response] = None) -> Optional[blob_store.Stored]:
+    """Downloads url to dest, resuming after failures.
+
+    Returns where the file was stored and its digest, or None if it could not be downloaded.
+    An already open streaming response for url can be passed in to avoid requesting it again.
+    """
+    part = f'{dest}.{hashlib.sha256(url.encode("utf-8")).hexdigest()[:URL_DIGEST_LENGTH]}{PART_SUFFIX}'
+    for _ in range(ATTEMPTS):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if response is None:
+            try:
+                response = _request(url, offset, part)
+            except retry.RetryError as e:
+                print(e)
+                return None
+            if offset > 0 and response.status_code == 206:
+                print(f'Resuming download of {url} from byte {offset}')
+                metrics.increment('download_resumes')
+        if response.status_code == 416:
+            # Our partial file doesn't fit the file on the server any more. Start over.
+            response.close()
+            response = None
+            if os.path.exists(part):
+                os.remove(part)
+            continue
+        if response.status_code not in (200, 206):
+            print(f'Could not download {url}: status {response.status_code}')
+            response.close()
+            return None
+        if response.status_code == 200:
+            # The server sent the whole file, either because we asked for it or because
+            # it ignored our Range request.
+            offset = 0
+            _save_validator(part, response)
+        expected = _expected_size(response, offset)
+
+        print('Saving file from ', url, ' to ', dest)
+        hasher = _hash_existing(part) if offset > 0 else hashlib.sha256()
+        try:
+            with open(part, 'ab' if offset > 0 else 'wb') as file_handle:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    file_handle.write(chunk)
+                    hasher.update(chunk)
+        except requests.RequestException as e:
+            print(f'Download of {url} was interrupted: {e}')
+            continue
+        finally:
+            response.close()
+            response = None
+
+        if expected is not None and os.path.getsize(part) < expected:
+            print(f'Download of {url} is incomplete, resuming')
+            continue
+        if os.path.exists(part + '.json'):
+            os.remove(part + '.json')
+        return blob_store.store(part, hasher.hexdigest(), dest)
+    print(f'Giving up on downloading {url}')
+    return None
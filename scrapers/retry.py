@@ -0,0 +1,170 @@
+"""
+Retry policy shared by every HTTP call the scrapers make.
+
+Failed requests (connection errors, timeouts and 429/5xx responses) are retried with
+exponential backoff and full jitter instead of immediately, so a struggling server gets
+time to recover. Two safeguards stop a flaky host from eating the whole crawl:
+  - a retry budget: retries to a host may only add a fraction on top of its requests;
+  - a circuit breaker per host: after enough consecutive failures the host is skipped
+    for a cool-down period, then a single request is let through to test it again.
+Every retry, exhausted budget and opened circuit is counted in metrics.
+
+Usage:
+    response = retry.call(url, http_client.get, url, timeout=10)
+raises RetryError once all attempts have failed, or CircuitOpenError if the host is down.
+"""
+import random
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+import requests
+
+import metrics
+import rate_limiter
+
+ATTEMPTS = 5
+BASE_DELAY = 0.5
+MAX_DELAY = 30.0
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Each request earns its host this many retries; a host can save up at most BUDGET_RESERVE.
+BUDGET_RATIO = 0.2
+BUDGET_RESERVE = 10.0
+# Open a host's circuit after this many consecutive failures, for this many seconds.
+FAILURE_THRESHOLD = 5
+COOL_DOWN = 60.0
+
+
+class RetryError(Exception):
+    """All attempts of a request failed."""
+
+    def __init__(self, url: str, last_error: Optional[BaseException] = None,
+                 response: Optional[requests.Response] = None):
+        reason = f'status {response.status_code}' if response is not None else repr(last_error)
+        super().__init__(f'Failed to get {url}: {reason}')
+        self.url = url
+        self.last_error = last_error
+        self.response = response
+
+
+class CircuitOpenError(RetryError):
+    """The host has failed too often recently, so the request was not sent."""
+
+    def __init__(self, url: str):
+        Exception.__init__(self, f'Skipping {url}: too many recent failures from {urlparse(url).netloc}')
+        self.url = url
+        self.last_error = None
+        self.response = None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, attempts=ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retry number attempt (starting at 1)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class HostState:
+    """Retry budget and circuit breaker for one host."""
+
+    def __init__(self):
+        self.budget = BUDGET_RESERVE
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self.failures < FAILURE_THRESHOLD:
+                self.budget = min(BUDGET_RESERVE, self.budget + BUDGET_RATIO)
+                return True
+            # Half-open: once the cool-down is over, let one request through to test the host.
+            if now >= self.open_until and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def allow_retry(self) -> bool:
+        with self._lock:
+            if self.budget < 1:
+                return False
+            self.budget -= 1
+            return True
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+
+    def failed(self) -> bool:
+        """Records a failure. Returns true if it opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            reopened = self.probing
+            self.probing = False
+            if self.failures >= FAILURE_THRESHOLD:
+                self.open_until = time.monotonic() + COOL_DOWN
+                return self.failures == FAILURE_THRESHOLD or reopened
+            return False
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def host_state(url: str) -> HostState:
+    host = urlparse(url).netloc
+    with _hosts_lock:
+        if host not in _hosts:
+            _hosts[host] = HostState()
+        return _hosts[host]
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+def call(url: str, func: Callable, *args, policy: RetryPolicy = DEFAULT_POLICY, **kwargs):
+    """Calls func(*args, **kwargs), a request to url, retrying on errors and retryable statuses."""
+    host = urlparse(url).netloc
+    state = host_state(url)
+    last_error = None
+    response = None
+    for attempt in range(1, policy.attempts + 1):
+        if attempt > 1:
+            if not state.allow_retry():
+                metrics.increment(f'retry_budget_exhausted.{host}')
+                break
+            delay = policy.delay(attempt - 1)
+            if response is not None:
+                delay = max(delay, rate_limiter.parse_retry_after(response.headers.get('Retry-After')) or 0)
+            metrics.increment('retries')
+            metrics.increment(f'retries.{host}')
+            time.sleep(delay)
+        if not state.allow_request():
+            metrics.increment(f'circuit_open.{host}')
+            raise CircuitOpenError(url)
+        try:
+            response = func(*args, **kwargs)
+        except requests.RequestException as e:
+            print(f'Request to {url} failed: {e}')
+            last_error, response = e, None
+        else:
+            if response.status_code not in RETRYABLE_STATUSES:
+                state.succeeded()
+                return response
+            print(f'Request to {url} returned {response.status_code}')
+            # A streamed body is never read, so give its connection back to the pool now;
+            # the status and headers stay available for Retry-After and the RetryError
+            response.close()
+        if state.failed():
+            print(f'Too many failures from {host}, pausing it for {COOL_DOWN:.0f}s')
+    raise RetryError(url, last_error, response)
@@ -4,103 +4,31 @@ using a Selenium Chrome bot.
 """
 from datetime import date
 import json
-from os import path
 import re
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 import os
-import time
+
+import browser_pool
+from browser_pool import BrowserPool
+from chrome_bot import ChromeBot
+import fetch_engine
+import resumable
 
 START_URL = "https://www.fedlex.admin.ch"
 DOWNLOAD_PATH = '../data/switzerland/pdf/'
 METADATA = []
 METADATA_PATH = '../data/switzerland/metadata.json'
 COUNTRY = 'Switzerland'
-
-### Fake user agent to bypass anti-robot walls
-FAKE_USER_AGENT = 'Mozilla/5.0 (Windows NT 4.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36'
+VERSION_ROWS_XPATH = '//*[@id="versionContent"]/tbody/tr'
+# The text of every cell and link of every row of the versions table
+VERSIONS_SPEC = {'selector': VERSION_ROWS_XPATH,
+                 'fields': {'cells': {'selector': './/td', 'fields': {'text': 'text'}},
+                            'links': {'selector': './/td//a', 'fields': {'text': 'text'}}}}
 
 ### REUSABLE CODE (common to all scrapers)
 
-class ChromeBot:
-    def __init__(self, headless=False):
-        options = Options()
-        options.headless = headless
-        options.add_argument(f'user-agent={FAKE_USER_AGENT}')
-
-        # Add custom profile to disactivate PDF viewer
-        profile = {
-            "plugins.plugins_list": [{"enabled": False,
-                                         "name": "Chrome PDF Viewer"}],
-        }
-        options.add_experimental_option("prefs", profile)
-
-        self.driver = webdriver.Chrome(options=options)
-        print('Chrome bot initialized!')
-    
-    def navigate_to(self, url):
-        try:
-            self.driver.get(url)
-            print(f'Loaded page: {url}')
-        except:
-            print(f'Could not access this page: {url}')
-    
-    def find_xpath(self, xpath):
-        try:
-            return self.driver.find_elements_by_xpath(xpath)
-        except IndexError:
-            print('FAILED: Chrome bot could not find specified xpath.')
-    
-    def find_class(self, class_name):
-        try:
-            return self.driver.find_elements_by_class_name(class_name)
-        except IndexError:
-            print('FAILED: Chrome bot could not find elements of that class: {class_name}.')
-    
-    def find_id(self, id_name):
-        try:
-            return self.driver.find_elements_by_id(id_name)
-        except IndexError:
-            print('FAILED: Chrome bot could not find elements with that id: {id_name}.')
-    
-    def find_tag(self, tag_name):
-        try:
-            return self.driver.find_elements_by_tag_name(tag_name)
-        except IndexError:
-            print('FAILED: Chrome bot could not find elements with that tag name: {tag_name}.')
-
-    def find_text(self, text):
-        try:
-            return self.driver.find_element_by_link_text(text)
-        except IndexError:
-            print('FAILED: Chrome bot could not find elements with that text: {text}.')
-            
-    def find_css(self, css_selector):
-        try:
-            return self.driver.find_elements_by_css_selector(css_selector)
-        except IndexError:
-            print('FAILED: Chrome bot could not find elements with that CSS: {css_selector}.')
-
-    def switch_to_tab(self, tab_id):
-        tab = self.driver.window_handles[tab_id]
-        self.driver.switch_to.window(tab)
-        
-    def wait_sec(self, time_sec):
-        time.sleep(time_sec)
-        # Not sure why; this doesn't seem to work with the Swiss website.
-        ### self.driver.implicitly_wait(time_sec)
-
-
-def collect_response(url: str, trials=10, timeout=10):
-    for _ in range(trials):
-        try:
-            response = requests.get(url, timeout=timeout, stream=True)
-        except:
-            print('Page failed to load. Trying again...')
-            continue
-        break
-    return response
+def collect_response(url: str, timeout=10):
+    """Gets url with the shared retry policy. Returns None if the page could not be loaded."""
+    return fetch_engine.get_with_retries(url, timeout=timeout, stream=True)
 
 
 def filename_maker(law_name: str) -> str:
@@ -119,25 +47,26 @@ def create_pdf_destination_file(title):
         os.path.dirname(__file__), 
         generate_pdf_file_name(title)
     )
-    if path.exists(pdf_destination_file):
-        print("Already downloaded!")
-        return
+    # A file with this name may be another law with the same title: blob_store keeps both
     return pdf_destination_file
 
 
 def write_response(response, pdf_destination_file):
-    with open(pdf_destination_file, 'wb') as file:
-        for chunk in response.iter_content(1024 * 1024):
-            file.write(chunk)
-    print("Saved file as binary.")
+    """Streams the response to the file, resuming with Range requests if the stream breaks.
+    Returns where the file was stored and its digest, or None if it could not be saved."""
+    stored = resumable.download(response.url, pdf_destination_file, response=response)
+    if stored is not None:
+        print("Saved file as binary.")
+    return stored
 
 
-def append_to_metadata(law_name: str, law_version_date: str, pdf_link: str, filename: str):
+def append_to_metadata(law_name: str, law_version_date: str, pdf_link: str, filename: str, sha256: str = None):
     """Appends an item to the METADATA list."""
     METADATA.append({'title': law_name,
                      'law validity': law_version_date,
                      'link': pdf_link,
                      'download_path': filename,
+                     'sha256': sha256,
                      'download_date': date.today().strftime('%Y-%m-%d'),
                      'country': COUNTRY,})
     print('Added item to METADATA.')
@@ -154,65 +83,76 @@ def write_metadata_json():
 
 ### COUNTRY-SPECIFIC CODE (Here, Switzerland; from www.fedex.admin.ch)
 
-def scrape_swiss_laws(headless=True):
-    """Scrapes all French laws from legifrance.gouv.fr."""
+def download_law(bot, law):
+    """Downloads the most recent version WITH a PDF link of a (link, title) law.
+    Returns (law version date, pdf link, stored file), or None if nothing was downloaded."""
+    link, law_title = law
+    print('\nAttempting to download: ', law_title)
+    pdf_destination_file = create_pdf_destination_file(law_title)
+    # Navigate to law page
+    bot.navigate_to(link)
+    # Target most recent version WITH a PDF link
+    bot.wait_for_xpath(VERSION_ROWS_XPATH)
+    # Read the whole table at once; only the link we click is looked up as an element
+    table_versions = bot.extract(VERSIONS_SPEC)
+    for row, version in enumerate(table_versions, start=1):
+        version_xpath = f'{VERSION_ROWS_XPATH}[{row}]'
+        for i, td_link in enumerate(version['links']): # There can be links to HTML, PDF and/or DOC versions... or no links at all
+            if re.match('PDF', td_link['text']):
+                bot.clear_captured()
+                bot.click(bot.find_xpath(f'{version_xpath}//td//a')[i])  # Should display pdf viewer in <iframe>
+                pdf_source_url = bot.wait_for_attribute('.pdf-reader iframe', 'src')
+                if pdf_source_url is None:
+                    break
+                # Save the PDF the browser already loaded, or else download it ourselves
+                stored = bot.save_captured(pdf_destination_file)
+                if stored is None:
+                    response = collect_response(pdf_source_url)
+                    stored = None if response is None else write_response(response, pdf_destination_file)
+                if stored is None:
+                    break
+                # Scrape date
+                law_version_date = version['cells'][1]['text']
+                return law_version_date, pdf_source_url, stored
+    print(f"Warning: Could not download this law: {law_title}")
+    return None
+
+
+def scrape_swiss_laws(headless=True, workers=browser_pool.WORKERS):
+    """Scrapes all Swiss laws from fedlex.admin.ch."""
     
     # Initialize Selenium Chrome bot and navigate to start page.
-    bot = ChromeBot(headless)
+    bot = ChromeBot(headless, lean=True, profile='switzerland')
     bot.navigate_to(START_URL)
-    bot.wait_sec(3)
     
     # Click on Fr button; laws only exist in French, German or Italian
-    fr_button = bot.find_xpath(
+    fr_button = bot.wait_for_xpath(
         '/html/body/app-root/div/app-header/header/div[1]/section/app-language/nav/ul/li[2]/a'
     )
-    if fr_button is None:
+    if not fr_button:
         return  # Stop if a problem occured
-    fr_button[0].click()
-    bot.wait_sec(2)
+    bot.click(fr_button[0])
+    bot.wait_for_network_idle()
 
     # Get all links under section "Textes choisis" (=Selected Texts)
     div_section_xpath = '/html/body/app-root/div/app-home/div/div/div/app-editable-links/section/div[4]/ul'
-    all_text_a_tags = bot.find_xpath(f"{div_section_xpath}//li//a")
-    all_text_links = list(map(lambda x: x.get_attribute('href'), all_text_a_tags))
-    all_law_titles = list(map(lambda x: x.text, all_text_a_tags))
+    bot.wait_for_xpath(f"{div_section_xpath}//li//a")
+    all_text_a_tags = bot.extract({'selector': f"{div_section_xpath}//li//a", 'fields': {'href': 'href', 'text': 'text'}})
+    all_text_links = list(map(lambda x: x['href'], all_text_a_tags))
+    all_law_titles = list(map(lambda x: x['text'], all_text_a_tags))
     print(f'Law texts found: {len(all_text_a_tags)}')
 
-    # Loop over all law text links; download a PDF for each
-    for k, (link, law_title) in enumerate(zip(all_text_links, all_law_titles)):
-        print(f'\nAttempting to download: ({k + 1}/{len(all_text_links)}) | ', law_title)
-        pdf_destination_file = create_pdf_destination_file(law_title)
-        if pdf_destination_file is not None:  # Unless file was already downloaded      
-            # Navigate to law page
-            bot.navigate_to(link)
-            bot.wait_sec(4)
-            # Target most recent version WITH a PDF link
-            table_versions = bot.find_xpath('//*[@id="versionContent"]/tbody//tr')  # All table rows
-            found = False
-            for row in range(1, len(table_versions) + 1):
-                version_xpath = f'//*[@id="versionContent"]/tbody/tr[{row}]'
-                version_tds = bot.find_xpath(f'{version_xpath}//td')
-                td_links = bot.find_xpath(f'{version_xpath}//td//a')
-                for td_link in td_links: # There can be links to HTML, PDF and/or DOC versions... or no links at all
-                    if re.match('PDF', td_link.text):
-                        td_link.click()  # Should display pdf viewer in <iframe>
-                        bot.wait_sec(4)
-                        pdf_reader_target = bot.find_css('.pdf-reader iframe')
-                        pdf_source_url = pdf_reader_target[0].get_attribute('src')
-                        # Download PDF file
-                        response = collect_response(pdf_source_url)
-                        bot.wait_sec(4)
-                        write_response(response, pdf_destination_file)
-                        # Scrape date
-                        law_version_date = version_tds[1].text
-                        append_to_metadata(law_title, law_version_date, pdf_source_url, pdf_destination_file)
-                        bot.wait_sec(4)
-                        found = True
-                        break
-                if found:
-                    break
-            if not found:
-                print(f"Warning: Could not download this law: {law_title}")
+    bot.quit()
+
+    # Download a PDF for each law text link, on a pool of browsers
+    laws = list(zip(all_text_links, all_law_titles))
+    pool = BrowserPool(lambda: ChromeBot(headless, lean=True, capture_mime_types=['application/pdf'],
+                                           profile='switzerland'), workers)
+    results = pool.map(download_law, laws)
+    for (link, law_title), result in zip(laws, results):
+        if result is not None:
+            law_version_date, pdf_source_url, stored = result
+            append_to_metadata(law_title, law_version_date, pdf_source_url, stored.path, stored.sha256)
     
     # Wrap-up
     write_metadata_json()
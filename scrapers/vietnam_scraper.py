@@ -16,11 +16,13 @@ Step 2: Access each base link, which may contain multiple pages, and scrape meta
 
 from datetime import date, datetime
 import pathlib
-import requests
 import re
 import json
 import os
-from bs4 import BeautifulSoup
+
+import blob_store
+import fetch_engine
+import parsing
 
 
 HOME_DIR = os.path.dirname(os.path.dirname(__file__))
@@ -31,6 +33,22 @@ COUNTRY = "Vietnam"
 BASE_URL = "http://vbpl.vn"
 BASE_URLS = []
 METADATA = []
+DOWNLOADS = {} # file attachments to download, as {link: download_path}
+# number of pages of search results to fetch at once
+PAGING_BATCH = 8
+
+# compiled selectors, named after the CSS selectors and soup searches they replace
+SELECTED_SPAN = parsing.xpath(f"//a[{parsing.has_class('selected')}]//span")                # a.selected span
+LAW_LIST_ITEMS = parsing.xpath(f"//ul[{parsing.has_class('listLaw')}]//li")                 # ul.listLaw li
+TITLE_LINKS = parsing.xpath(f"//p[{parsing.has_class('title')}]//a")                        # p.title a
+DESCRIPTIONS = parsing.xpath(f"//div[{parsing.has_class('des')}]//p")                       # div.des p
+PUBLISHED = parsing.xpath(f"//label[.='Published:']/ancestor::p[{parsing.has_class('green')}][1]")
+EFFECTIVE = parsing.xpath(f"//label[.='Effective:']/ancestor::p[{parsing.has_class('green')}][1]")
+FULLTEXT = parsing.xpath(f"//div[{parsing.has_class('fulltext')}]")
+VIETNAMESE_LINK = parsing.xpath(f"//b[{parsing.has_class('history')}][.='Vietnamese Documents']/ancestor::a[1]/@href")
+STATUS = parsing.xpath("//span[.='Effective: ']/ancestor::li[1]")
+VBFILE = parsing.xpath(f"//div[{parsing.has_class('vbFile')}]")
+ATTACHMENTS = parsing.xpath(".//ul//li//a")                                                 # ul li a
 
 
 def gather_baselinks(max_index = 24):
@@ -39,15 +57,17 @@ def gather_baselinks(max_index = 24):
     print("gathering baselinks")
     
     # gather all links
-    for i in range(1, max_index + 1, 1):
-        url = f"https://vbpl.vn/TW/Pages/vanbanTA.aspx?idLoaiVanBan={i}"
-        page = requests.get(url)
-        soup = BeautifulSoup(page.content, "html.parser")
+    urls = [f"https://vbpl.vn/TW/Pages/vanbanTA.aspx?idLoaiVanBan={i}" for i in range(1, max_index + 1, 1)]
+    pages = fetch_engine.fetch_all(urls, cache=True)
+    for url, page in zip(urls, pages):
+        if page is None:
+            continue
+        tree = parsing.parse(page.content)
 
         # grab document type and number of documents
-        content = soup.select("a.selected span")[0]
-        doctype = re.split("[:.]", content.get_text())[1].strip()
-        numdoc = re.findall("\d+|$", content.get_text())[0]
+        content = parsing.text(SELECTED_SPAN(tree)[0])
+        doctype = re.split("[:.]", content)[1].strip()
+        numdoc = re.findall("\d+|$", content)[0]
         
         # only include link if num of docs > 0
         if int(numdoc) > 0:
@@ -63,58 +83,83 @@ def loop_through_paging():
         table_exists = True
         i = 1
 
-        # if the table of documents exists, loop through page numbers with i
+        # if the table of documents exists, loop through page numbers with i,
+        # fetching PAGING_BATCH pages of search results at a time
         while table_exists:
 
-            # access the page of search results
-            base = base_url + f"&Page={i}"
-            page = requests.get(base)
-            soup = BeautifulSoup(page.content, "html.parser")
-
-            # check if the table of documents exists
-            table = soup.select("ul.listLaw li")
-            if len(table) > 0:
-                print("scraping page", i)
-                scrape_documents_info(soup, doctype)
-                i += 1
-            else:
-                print("end")
-                table_exists = False
+            # access the pages of search results
+            bases = [base_url + f"&Page={n}" for n in range(i, i + PAGING_BATCH)]
+            pages = fetch_engine.fetch_all(bases, cache=True)
+            for url, page in zip(bases, pages):
+                if page is None:
+                    # a failed fetch isn't the end of the results: try the page once more on its own,
+                    # and if it still fails, say so rather than silently dropping the rest of the type
+                    page = fetch_engine.get_with_retries(url, cache=True)
+                if page is None:
+                    print("could not fetch page", i, "of", doctype, "- skipping the rest of this type:", url)
+                    table_exists = False
+                    break
+                tree = parsing.parse(page.content)
+
+                # check if the table of documents exists
+                table = LAW_LIST_ITEMS(tree)
+                if len(table) > 0:
+                    print("scraping page", i)
+                    scrape_documents_info(tree, doctype)
+                    i += 1
+                else:
+                    print("end")
+                    table_exists = False
+                    break
     return
 
 
-def scrape_documents_info(soup, doctype):
+def scrape_documents_info(tree, doctype):
     """Scrape information of documents in one entire page, and enter each document to download its text.
     Assumption: all pages have tables of rows with the same html structure."""
 
+    # the page's entries are appended after these ones
+    first_entry = len(METADATA)
+
     # gather all available info from the page
-    titles = soup.select("p.title a")
-    descs = soup.select("div.des p")
-    publabels = soup.find_all("label", string = "Published:")
-    pubdates = [d.find_parent("p", class_ = "green").get_text().split(":")[1] for d in publabels]
-    efflabels = soup.find_all("label", string = "Effective:")
-    effdates = [d.find_parent("p", class_ = "green").get_text().split(":")[1] for d in efflabels]
+    titles = TITLE_LINKS(tree)
+    descs = DESCRIPTIONS(tree)
+    pubdates = [parsing.text(d).split(":")[1] for d in PUBLISHED(tree)]
+    effdates = [parsing.text(d).split(":")[1] for d in EFFECTIVE(tree)]
+
+    # fetch every document on the page, and then their Vietnamese versions, concurrently
+    urls = [BASE_URL + title.get("href") for title in titles]
+    trees = [None if page is None else parsing.parse(page.content)
+             for page in fetch_engine.fetch_all(urls, cache=True)]
+    viet_urls = {}
+    for doc_tree in trees:
+        if doc_tree is None or not FULLTEXT(doc_tree):
+            continue
+        viet_link = VIETNAMESE_LINK(doc_tree)
+        if viet_link:
+            viet_urls[BASE_URL + viet_link[0]] = None
+    for viet_url, page in zip(viet_urls, fetch_engine.fetch_all(viet_urls, cache=True)):
+        if page is not None:
+            viet_urls[viet_url] = parsing.parse(page.content)
 
     # enter each document on the page
     for i in range(len(titles)):
 
         # extract info specific to document
-        url = BASE_URL + titles[i]["href"]
-        title = titles[i].get_text()
-        description = descs[i].get_text()
+        url = urls[i]
+        title = parsing.text(titles[i])
+        description = parsing.text(descs[i])
         published_date = validated_date(pubdates[i])
         effective_date = validated_date(effdates[i])
 
         # enter document url, gather additional info and append to metadata - only for English
         language = "english"
-        page = requests.get(url)
-        soup = BeautifulSoup(page.content, "html.parser")
+        doc_tree = trees[i]
 
-        if soup.find("div", class_ = "fulltext") is None: # if document page is empty, skip the law entierely
+        if doc_tree is None or not FULLTEXT(doc_tree): # if document page is empty, skip the law entierely
             continue
 
-        statusspan = soup.find("span", string = "Effective: ")
-        status = statusspan.find_parent("li").get_text().split(":")[1].strip()
+        status = parsing.text(STATUS(doc_tree)[0]).split(":")[1].strip()
 
         metadata_dict = {
         "title": title,
@@ -129,24 +174,28 @@ def scrape_documents_info(soup, doctype):
         }
 
         # download document(s) text
-        metadata = find_download_links(soup, title, language)
+        metadata = find_download_links(doc_tree, title, language)
         append_metadata(metadata_dict, metadata)
 
         # extract Vietnamese version if available
-        viet_button = soup.find("b", "history", string = "Vietnamese Documents")
+        viet_link = VIETNAMESE_LINK(doc_tree)
 
-        if viet_button:
-            # parse html of vietnamese site
-            viet_url = BASE_URL + viet_button.find_parent("a")["href"]
-            page = requests.get(viet_url)
-            soup = BeautifulSoup(page.content, "html.parser")
+        if viet_link:
+            # parsed html of vietnamese site
+            viet_url = BASE_URL + viet_link[0]
+            viet_tree = viet_urls[viet_url]
+            if viet_tree is None:
+                continue
 
             # gather info for metadata
             language = "vietnamese"
             metadata_dict["link"] = viet_url
-            metadata = find_download_links(soup, title, language)
+            metadata = find_download_links(viet_tree, title, language)
             append_metadata(metadata_dict, metadata)
 
+    # download all file attachments found on the page; only this page's entries can have them
+    blob_store.add_digests(METADATA[first_entry:], fetch_engine.download_all(DOWNLOADS))
+    DOWNLOADS.clear()
     return
 
 
@@ -159,15 +208,15 @@ def validated_date(date_string):
         return None
 
 
-def find_download_links(soup, title, language):
+def find_download_links(tree, title, language):
     """Examine all download links per law document and create respective filepaths."""
 
-    vbfile = soup.find("div", "vbFile")
-    fulltext = soup.find("div", "fulltext")
+    vbfile = next(iter(VBFILE(tree)), None)
+    fulltext = next(iter(FULLTEXT(tree)), None)
 
     # check if file attachment elements exist
     if vbfile is not None:
-        attach = vbfile.select("ul li a")
+        attach = ATTACHMENTS(vbfile)
         metadata_list = [] # collect metadata for link and download_path
 
         # some laws have multiple doc links, so we want to alter the saved doc's filename to prevent overwriting
@@ -180,13 +229,12 @@ def find_download_links(soup, title, language):
         for a in attach:
 
             # ignore "Xem nhanh"/Quick View links as they're invalid
-            if "iFrame" in a["href"]: 
+            if "iFrame" in a.get("href"): 
                 continue
             
             # all other links are javascript
-            fpath = re.findall(r"([^']*)" , a["href"])[6]
+            fpath = re.findall(r"([^']*)" , a.get("href"))[6]
             url = BASE_URL + fpath
-            doc = requests.get(url)
             ext = re.split("\.", fpath)[-1]
 
             # some laws have multiple doc links, so we alter the saved doc's filename to prevent overwriting
@@ -194,19 +242,18 @@ def find_download_links(soup, title, language):
                 title = title[:-1] + str(i)
                 i += 1
 
+            # queue the file; every attachment on the page is downloaded concurrently afterwards
             fname = create_filename(title, language, ext)
-            with open(fname, "wb") as f:
-                for chunk in doc.iter_content(1024 * 1024):
-                    f.write(chunk)
+            DOWNLOADS[url] = fname
             
-            print("downloaded", ext, "for", title)
+            print("queued", ext, "for", title)
             metadata_list.append({"link": url, "download_path": fname, "language": language}) # alternative for "download_path": [fname.index("data"):]
 
         return metadata_list
 
     # if file attachment elements don't exist, scrape the text off the page and save as txt
     elif fulltext is not None:
-        doc = fulltext.get_text()
+        doc = parsing.text(fulltext)
         fname = create_filename(title, language, "txt")
         with open(fname, "w", encoding = "utf-8") as f:
             f.write(doc)